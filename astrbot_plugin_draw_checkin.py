@@ -1,46 +1,225 @@
-from astrbot.api.event import filter, AstrMessageEvent
+from astrbot.api.event import filter, AstrMessageEvent, MessageChain
 from astrbot.api.star import Context, Star, register
 from astrbot.api import logger
 import astrbot.api.message_components as Comp
 
 import os
+import csv
 import json
+import math
+import uuid
+import copy
+import time
 import random
+import hashlib
+import secrets
+import sys
+import sqlite3
+import threading
+import contextlib
+import string
+import asyncio
 import datetime
-import pyodbc
+import functools
+import importlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, Tuple, List, Optional
 
+try:
+    import fcntl
+    msvcrt = None
+except ImportError:  # Windows
+    import msvcrt
+    fcntl = None
+
+
+@functools.lru_cache(maxsize=None)
+def _optional_import(name: str):
+    """首次使用时才导入依赖（结果缓存），未安装或加载失败时返回 None
+
+    pyodbc（加载 ODBC 驱动管理器可能很慢）、Pillow、NumPy、PyArrow 均通过此函数按需加载，
+    不使用对应功能的部署不会在插件加载时付出这部分开销。
+    """
+    try:
+        return importlib.import_module(name)
+    except ImportError as e:
+        logger.info(f"可选依赖 {name} 不可用: {e}")
+        return None
+
 
 PLUGIN_ID = "astrbot_plugin_draw_checkin"
 # 新的数据目录
 DATA_DIR = os.path.join("data", "plugin-data", PLUGIN_ID)
-os.makedirs(DATA_DIR, exist_ok=True)
 DATA_FILE = os.path.join(DATA_DIR, "checkin_data.json")
 BIND_FILE = os.path.join(DATA_DIR, "account_bind.json")
 LOTTERY_ITEMS_FILE = os.path.join(DATA_DIR, "lottery_items.json")  # 抽奖物品配置文件
 GROUP_CONFIG_FILE = os.path.join(DATA_DIR, "group_config.json")  # 群组独立配置
+LOTTERY_POOLS_FILE = os.path.join(DATA_DIR, "lottery_pools.json")  # 群组奖池定义
+LOTTERY_EVENTS_FILE = os.path.join(DATA_DIR, "lottery_events.json")  # 限时活动定义
+STOCK_DB_FILE = os.path.join(DATA_DIR, "stock.db")  # 限量奖品库存（SQLite，多进程共享）
+STOCK_PERIODS = {"total", "daily"}
+DEFAULT_POOL = "default"
+POOL_RELOAD_INTERVAL = 5.0
+EVENT_PRECOMPILE_LEAD = 300.0
+EVENT_POLL_INTERVAL = 60.0
+STATS_FILE = os.path.join(DATA_DIR, "daily_stats.json")  # 日切状态与每日汇总
+STATS_KEEP_DAYS = 400
+EXPORT_DIR = os.path.join(DATA_DIR, "exports")  # 管理员导出文件
+BULK_BATCH_SIZE = 500  # 批量操作每个事务处理的记录数
+RECORDS_DIR = os.path.join(DATA_DIR, "records")  # 打卡/抽奖流水（按天追加的 JSONL）
+REPORT_DIR = os.path.join(DATA_DIR, "reports")  # 运营报表输出
+REPORT_CHUNK_SIZE = 20000  # 报表每次读入并聚合的流水条数
+REPORT_FIELDS = ["date", "group_id", "kind", "item_type", "count", "amount"]
+RNG_SEED_FILE = os.path.join(DATA_DIR, "rng_seed")  # 抽奖随机数根种子
+POOL_ARCHIVE_DIR = os.path.join(DATA_DIR, "pool_archive")  # 按内容哈希存档的奖池配置（用于复现抽奖）
+PROFILE_DIR = os.path.join(DATA_DIR, "profiles")  # 性能采样输出
+PROFILE_MODES = ("cprofile", "sample")
+PROFILE_MAX_RUNS = 100  # 单次采样最多覆盖的命令执行次数
+PROFILE_SAMPLE_INTERVAL = 0.005  # sample 模式的采样间隔（秒）
+PROFILE_HISTORY = 10  # 保留最近完成的采样记录条数
+STORAGE_SCOPES = ("group", "user", "global")
+SCOPE_STATE_FILE = os.path.join(DATA_DIR, "storage_scope.json")  # 数据当前的存储范围与迁移进度
+SCOPE_MIGRATION_INTERVAL = 0.5  # 后台迁移每批之间的间隔（秒）
 
 
-def _load_group_config() -> Dict[str, Any]:
-    """加载群组配置"""
-    try:
-        if os.path.exists(GROUP_CONFIG_FILE):
-            with open(GROUP_CONFIG_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        return {}
-    except Exception as e:
-        logger.error(f"加载群组配置失败: {e}")
-        return {}
+class _FileLock:
+    """进程间咨询锁（POSIX 使用 fcntl.flock，Windows 使用 msvcrt.locking），同进程内可重入"""
 
+    def __init__(self, path: str):
+        self._path = path + ".lock"
+        self._local = threading.RLock()
+        self._depth = 0
+        self._fh = None
 
-def _save_group_config(config: Dict[str, Any]) -> None:
-    """保存群组配置"""
-    try:
-        os.makedirs(os.path.dirname(GROUP_CONFIG_FILE), exist_ok=True)
-        with open(GROUP_CONFIG_FILE, "w", encoding="utf-8") as f:
-            json.dump(config, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        logger.error(f"保存群组配置失败: {e}")
+    def __enter__(self) -> "_FileLock":
+        self._local.acquire()
+        if self._depth == 0:
+            try:
+                os.makedirs(os.path.dirname(self._path), exist_ok=True)
+                self._fh = open(self._path, "a+b")
+                if fcntl is not None:
+                    fcntl.flock(self._fh.fileno(), fcntl.LOCK_EX)
+                elif msvcrt is not None:
+                    self._fh.seek(0)
+                    while True:
+                        try:
+                            msvcrt.locking(self._fh.fileno(), msvcrt.LK_LOCK, 1)
+                            break
+                        except OSError:
+                            continue
+            except Exception:
+                if self._fh is not None:
+                    self._fh.close()
+                    self._fh = None
+                self._local.release()
+                raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._depth -= 1
+        if self._depth == 0 and self._fh is not None:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(self._fh.fileno(), fcntl.LOCK_UN)
+                elif msvcrt is not None:
+                    self._fh.seek(0)
+                    msvcrt.locking(self._fh.fileno(), msvcrt.LK_UNLCK, 1)
+            finally:
+                self._fh.close()
+                self._fh = None
+        self._local.release()
+
+
+class _JsonStore:
+    """多实例安全的 JSON 数据文件
+
+    - 读取：以文件的 (inode, mtime, size) 作为版本号，发现被其他进程改写后重新加载（乐观检查）
+    - 写入：transaction() 在独占文件锁内重新加载最新内容，执行修改后写临时文件并原子替换
+    多个 AstrBot 进程共用同一数据目录时，各自的修改不会互相覆盖。
+    """
+
+    def __init__(self, path: str, label: str):
+        self.path = path
+        self.label = label
+        self._lock = _FileLock(path)
+        self._data: Optional[Dict[str, Any]] = None
+        self._version: Any = None
+
+    def _stat(self) -> Any:
+        try:
+            st = os.stat(self.path)
+            return st.st_ino, st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    def _sync(self) -> None:
+        version = self._stat()
+        if self._data is not None and version == self._version:
+            return
+        try:
+            if version is not None:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._data = json.load(f)
+            else:
+                self._data = {}
+        except Exception as e:
+            logger.error(f"加载{self.label}失败: {e}")
+            if self._data is None:
+                self._data = {}
+        self._version = version
+
+    @property
+    def data(self) -> Dict[str, Any]:
+        if self._data is None or self._stat() != self._version:
+            # 重新加载时持锁，避免后台线程的加载替换掉正在事务中修改的数据
+            with self._lock:
+                self._sync()
+        return self._data
+
+    @property
+    def version(self) -> Any:
+        """当前数据对应的文件版本，本进程写入或被其他进程改写后变化"""
+        self.data
+        return self._version
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """在文件锁内读取最新数据并在退出时写回；块内抛出异常则放弃本次修改"""
+        with self._lock:
+            self._sync()
+            try:
+                yield self._data
+            except BaseException:
+                # 内存中的数据可能已被部分修改，下次访问时从磁盘重新加载
+                self._version = None
+                self._data = None
+                raise
+            self._write()
+
+    def _write(self) -> None:
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+            self._version = self._stat()
+        except Exception as e:
+            logger.error(f"保存{self.label}失败: {e}")
+
+
+_DATA_STORE = _JsonStore(DATA_FILE, "打卡数据")
+_BIND_STORE = _JsonStore(BIND_FILE, "账号绑定数据")
+_GROUP_CONFIG_STORE = _JsonStore(GROUP_CONFIG_FILE, "群组配置")
+_STATS_STORE = _JsonStore(STATS_FILE, "每日汇总")
+_SCOPE_STORE = _JsonStore(SCOPE_STATE_FILE, "存储范围迁移状态")
+
+
+def _load_group_config() -> Dict[str, Any]:
+    """获取群组配置（只读；修改请使用 _GROUP_CONFIG_STORE.transaction()）"""
+    return _GROUP_CONFIG_STORE.data
 
 
 def _load_lottery_items() -> Dict[str, Any]:
@@ -59,6 +238,7 @@ def _load_lottery_items() -> Dict[str, Any]:
                     "type": "points",
                     "min_amount": 10,
                     "max_amount": 100,
+                    "rarity": "common",
                     "probability": 0.4,
                     "direct_to_account": True
                 },
@@ -68,6 +248,7 @@ def _load_lottery_items() -> Dict[str, Any]:
                     "type": "ingots",
                     "min_amount": 5,
                     "max_amount": 50,
+                    "rarity": "common",
                     "probability": 0.4,
                     "direct_to_account": True
                 },
@@ -78,6 +259,7 @@ def _load_lottery_items() -> Dict[str, Any]:
                     "item_code": "bless",
                     "min_amount": 1,
                     "max_amount": 3,
+                    "rarity": "rare",
                     "probability": 0.1,
                     "direct_to_account": False,
                     "description": "用于装备强化"
@@ -89,6 +271,7 @@ def _load_lottery_items() -> Dict[str, Any]:
                     "item_code": "soul",
                     "min_amount": 1,
                     "max_amount": 2,
+                    "rarity": "rare",
                     "probability": 0.05,
                     "direct_to_account": False,
                     "description": "用于装备强化"
@@ -100,6 +283,7 @@ def _load_lottery_items() -> Dict[str, Any]:
                     "item_code": "life",
                     "min_amount": 1,
                     "max_amount": 1,
+                    "rarity": "epic",
                     "probability": 0.03,
                     "direct_to_account": False,
                     "description": "用于装备升级"
@@ -111,6 +295,7 @@ def _load_lottery_items() -> Dict[str, Any]:
                     "item_code": "create",
                     "min_amount": 1,
                     "max_amount": 1,
+                    "rarity": "epic",
                     "probability": 0.01,
                     "direct_to_account": False,
                     "description": "用于装备合成"
@@ -122,6 +307,7 @@ def _load_lottery_items() -> Dict[str, Any]:
                     "item_code": "lucky_box",
                     "min_amount": 1,
                     "max_amount": 1,
+                    "rarity": "epic",
                     "probability": 0.01,
                     "direct_to_account": False,
                     "description": "随机开出稀有物品"
@@ -144,7 +330,12 @@ def _load_lottery_items() -> Dict[str, Any]:
                     "probability": 0.03,
                     "description": "获得额外抽奖机会"
                 }
-            ]
+            ],
+            # 保底规则：按稀有度层级配置，hard=必出抽数，soft_start/soft_step=概率递增起点与步长
+            "pity": {
+                "rare": {"hard": 20, "soft_start": 12, "soft_step": 0.02},
+                "epic": {"hard": 80, "soft_start": 60, "soft_step": 0.005}
+            }
         }
         
         # 保存默认配置
@@ -157,105 +348,135 @@ def _load_lottery_items() -> Dict[str, Any]:
         return {"items": [], "special_rewards": []}
 
 
-def _get_group_db_config(group_id: str, cfg: Dict[str, Any]) -> Dict[str, Any]:
-    """获取群组特定的数据库配置"""
-    group_configs = _load_group_config()
-    
-    if group_id in group_configs and "db_config" in group_configs[group_id]:
-        # 使用群组特定的配置
-        group_db_cfg = group_configs[group_id]["db_config"]
-        return {
-            "server": group_db_cfg.get("db_server", cfg.get("db_server", "202.189.8.117")),
-            "port": group_db_cfg.get("db_port", cfg.get("db_port", "1433")),
-            "database": group_db_cfg.get("db_database", cfg.get("db_database", "MuOnline")),
-            "username": group_db_cfg.get("db_username", cfg.get("db_username", "sa")),
-            "password": group_db_cfg.get("db_password", cfg.get("db_password", "bvT9527zzvipFEG2ic4R0#b")),
-            "driver": group_db_cfg.get("db_driver", cfg.get("db_driver", "FreeTDS"))
-        }
+def _resolve_db_config(group_db_cfg: Dict[str, Any], cfg: Dict[str, Any]) -> Dict[str, Any]:
+    """按群组数据库配置（未自定义时为空）与全局配置解析连接配置（含可选的只读库）
+
+    由 _ConfigSnapshot.db_config 调用并缓存，处理器不直接调用。
+    """
+    def pick(key: str, default: Any) -> Any:
+        return group_db_cfg.get(key, cfg.get(key, default))
     
-    # 使用全局配置
-    return {
-        "server": cfg.get("db_server", "202.189.8.117"),
-        "port": cfg.get("db_port", "1433"),
-        "database": cfg.get("db_database", "MuOnline"),
-        "username": cfg.get("db_username", "sa"),
-        "password": cfg.get("db_password", "bvT9527zzvipFEG2ic4R0#b"),
-        "driver": cfg.get("db_driver", "FreeTDS")
+    db_config = {
+        "server": pick("db_server", "202.189.8.117"),
+        "port": pick("db_port", "1433"),
+        "database": pick("db_database", "MuOnline"),
+        "username": pick("db_username", "sa"),
+        "password": pick("db_password", "bvT9527zzvipFEG2ic4R0#b"),
+        "driver": pick("db_driver", "FreeTDS"),
+        "payout_mode": pick("db_payout_mode", "python"),
+        "replica_staleness": float(pick("db_replica_staleness", 30)),
+        "replica": None
     }
+    
+    # 只读库必须与主库来自同一份配置：群组自定义主库时不会套用全局的只读库
+    replica_source = group_db_cfg or cfg
+    if replica_source.get("db_replica_server"):
+        db_config["replica"] = dict(
+            db_config,
+            server=replica_source["db_replica_server"],
+            # 配置项留空（schema 默认值为空串）时沿用主库的端口与账号
+            port=replica_source.get("db_replica_port") or db_config["port"],
+            username=replica_source.get("db_replica_username") or db_config["username"],
+            password=replica_source.get("db_replica_password") or db_config["password"],
+            replica=None
+        )
+    return db_config
+
+
+def _connection_string(db_config: Dict[str, Any]) -> str:
+    return (
+        f"DRIVER={db_config['driver']};"
+        f"SERVER={db_config['server']},{db_config['port']};"
+        f"DATABASE={db_config['database']};"
+        f"UID={db_config['username']};"
+        f"PWD={db_config['password']}"
+    )
+
+
+def _connect(db_config: Dict[str, Any], autocommit: bool = False, login_timeout: int = 0):
+    """按连接配置建立 ODBC 连接，失败时抛出异常"""
+    connection_string = _connection_string(db_config)
+    pyodbc = _optional_import("pyodbc")
+    if pyodbc is None:
+        raise RuntimeError("未安装 pyodbc")
+    return pyodbc.connect(connection_string, autocommit=autocommit, timeout=login_timeout)
 
 
-def _get_db_connection(group_id: str, cfg: Dict[str, Any]):
-    """获取数据库连接（支持群组独立配置）"""
+def _get_db_connection(group_id: str, settings: "_ConfigSnapshot", autocommit: bool = False):
+    """获取主库连接（支持群组独立配置），所有写入都走主库"""
     try:
-        db_config = _get_group_db_config(group_id, cfg)
-        connection_string = (
-            f"DRIVER={db_config['driver']};"
-            f"SERVER={db_config['server']},{db_config['port']};"
-            f"DATABASE={db_config['database']};"
-            f"UID={db_config['username']};"
-            f"PWD={db_config['password']}"
-        )
-        conn = pyodbc.connect(connection_string)
-        return conn
+        return _connect(settings.db_config(group_id), autocommit=autocommit)
     except Exception as e:
         logger.error(f"数据库连接失败: {e}")
         return None
 
 
-def _load_data() -> Dict[str, Any]:
-    try:
-        if os.path.exists(DATA_FILE):
-            with open(DATA_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        return {}
-    except Exception as e:
-        logger.error(f"加载打卡数据失败: {e}")
-        return {}
+REPLICA_LOGIN_TIMEOUT = 5  # 只读库登录超时（秒），超时即回退主库
+REPLICA_RETRY_INTERVAL = 30.0  # 只读库连接失败后暂停使用的秒数
+RECENT_WRITE_LIMIT = 10000  # 最多记录的近期写入账号数
+_REPLICA_DOWN_UNTIL: Dict[Tuple[str, str, str], float] = {}
+_RECENT_WRITES: "OrderedDict[Tuple[str, str, str, str], float]" = OrderedDict()
 
 
-def _save_data(data: Dict[str, Any]) -> None:
-    try:
-        os.makedirs(os.path.dirname(DATA_FILE), exist_ok=True)
-        with open(DATA_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        logger.error(f"保存打卡数据失败: {e}")
+def _db_key(db_config: Dict[str, Any]) -> Tuple[str, str, str]:
+    return str(db_config["server"]), str(db_config["port"]), str(db_config["database"])
 
 
-def _load_bind_data() -> Dict[str, Any]:
-    """加载账号绑定数据"""
-    try:
-        if os.path.exists(BIND_FILE):
-            with open(BIND_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        return {}
-    except Exception as e:
-        logger.error(f"加载账号绑定数据失败: {e}")
-        return {}
+def _mark_account_written(group_id: str, settings: "_ConfigSnapshot", account_name: str) -> None:
+    """记录账号刚在主库被写入，staleness 窗口内该账号的读取不走只读库"""
+    key = _db_key(settings.db_config(group_id)) + (account_name,)
+    _RECENT_WRITES.pop(key, None)
+    _RECENT_WRITES[key] = time.monotonic()
+    while len(_RECENT_WRITES) > RECENT_WRITE_LIMIT:
+        _RECENT_WRITES.popitem(last=False)
 
 
-def _save_bind_data(data: Dict[str, Any]) -> None:
-    """保存账号绑定数据"""
-    try:
-        os.makedirs(os.path.dirname(BIND_FILE), exist_ok=True)
-        with open(BIND_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        logger.error(f"保存账号绑定数据失败: {e}")
+def _replica_failed(db_config: Dict[str, Any], error: Exception) -> None:
+    """只读库连接或查询出错：REPLICA_RETRY_INTERVAL 秒内不再使用"""
+    _REPLICA_DOWN_UNTIL[_db_key(db_config)] = time.monotonic() + REPLICA_RETRY_INTERVAL
+    logger.error(f"只读库不可用，{REPLICA_RETRY_INTERVAL:g}秒内改用主库: {error}")
+
+
+def _open_read_connection(group_id: str, settings: "_ConfigSnapshot", account_name: str = "", primary: bool = False):
+    """获取只读查询连接，返回 (连接, 是否为只读库)；连接失败时连接为 None
+
+    配置了只读库时优先使用；以下情况使用主库：
+    - primary 为 True（如绑定时校验刚注册的账号，需要读到主库的最新数据）
+    - 该账号在 db_replica_staleness 秒内被本插件写入过（只读库可能尚未同步）
+    - 只读库连接或查询出错（之后 REPLICA_RETRY_INTERVAL 秒内不再尝试）
+    """
+    db_config = settings.db_config(group_id)
+    replica = db_config["replica"]
+    if replica and not primary:
+        key = _db_key(db_config)
+        now = time.monotonic()
+        written_at = _RECENT_WRITES.get(key + (account_name,)) if account_name else None
+        recently_written = written_at is not None and now - written_at < db_config["replica_staleness"]
+        if not recently_written and _REPLICA_DOWN_UNTIL.get(key, 0.0) <= now:
+            try:
+                return _connect(replica, login_timeout=REPLICA_LOGIN_TIMEOUT), True
+            except Exception as e:
+                _replica_failed(db_config, e)
+    return _get_db_connection(group_id, settings), False
+
+
+def _get_read_connection(group_id: str, settings: "_ConfigSnapshot", account_name: str = "", primary: bool = False):
+    """获取只读查询连接（见 _open_read_connection）"""
+    return _open_read_connection(group_id, settings, account_name, primary)[0]
 
 
 def _today() -> datetime.date:
     return datetime.date.today()
 
 
-def _yesterday() -> datetime.date:
-    return datetime.date.today() - datetime.timedelta(days=1)
+def _get_ctx_id(event: AstrMessageEvent, settings: "_ConfigSnapshot") -> str:
+    """获取上下文ID（支持群组独立）"""
+    return _ctx_id_for_scope(event, settings.storage_scope)
 
 
-def _get_ctx_id(event: AstrMessageEvent, cfg: Dict[str, Any]) -> str:
-    """获取上下文ID（支持群组独立）"""
+def _ctx_id_for_scope(event: AstrMessageEvent, scope: str) -> str:
+    """按指定存储范围计算上下文ID（迁移期间用于定位旧范围下的数据）"""
     try:
-        scope = (cfg.get("storage_scope") or "group").lower()
         platform = event.get_platform_name()
         group_id = event.get_group_id() or "default"
         
@@ -283,19 +504,208 @@ def _default_user(user_id: str, username: str) -> Dict[str, Any]:
     }
 
 
-def _get_game_account_info(group_id: str, cfg: Dict[str, Any], account_name: str):
-    """获取游戏账号信息（支持群组独立数据库）"""
-    conn = _get_db_connection(group_id, cfg)
+ACCOUNT_FILTER_FP_RATE = 0.01  # 账号过滤器误判率（误判只会多查一次数据库）
+ACCOUNT_FILTER_FETCH_SIZE = 5000  # 构建过滤器时每批读取的账号数
+ACCOUNT_MISS_TTL = 60.0  # 数据库确认不存在的账号在此时间内不再查询
+ACCOUNT_MISS_CACHE_SIZE = 4096
+
+
+def _normalise_account(account_name: str) -> str:
+    # MEMB_INFO 默认排序规则不区分大小写，且会忽略尾部空格
+    return str(account_name).rstrip().lower()
+
+
+class _BloomFilter:
+    """布隆过滤器：判定「不存在」一定准确，判定「存在」有 fp_rate 的误判率"""
+
+    __slots__ = ("size", "hashes", "bits")
+
+    def __init__(self, capacity: int, fp_rate: float = ACCOUNT_FILTER_FP_RATE):
+        capacity = max(1, capacity)
+        self.size = max(64, int(-capacity * math.log(fp_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value: str):
+        digest = hashlib.blake2b(value.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for idx in range(self.hashes):
+            yield (h1 + idx * h2) % self.size
+
+    def add(self, value: str) -> None:
+        for pos in self._positions(value):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, value: str) -> bool:
+        return all(self.bits[pos >> 3] >> (pos & 7) & 1 for pos in self._positions(value))
+
+
+class _AccountFilterRegistry:
+    """各游戏库的账号名快照
+
+    每个游戏库（同库的群共享）维护一个布隆过滤器，在后台线程中用 fetchmany 分批读取全部 memb___id 构建，
+    每 account_filter_refresh 秒重建一次并整体替换。20 万账号约占 240KB。
+    打卡、查询使用的都是已绑定的账号：快照中不存在时直接判定不存在，不访问数据库；
+    只有快照开始构建之后才绑定的账号（可能是之后新注册的）会查询一次数据库确认。
+    绑定账号时快照中不存在的账号查询数据库：查到则补进过滤器，
+    查不到则在 ACCOUNT_MISS_TTL 秒内记为不存在，反复绑定同一个不存在的账号时不再访问数据库。
+    快照超过 3 个刷新周期未更新（如数据库持续不可用）时不再使用，全部回退为数据库查询。
+    """
+
+    def __init__(self):
+        # 游戏库 -> (过滤器, 构建时间, 开始构建时已绑定的账号)
+        self._filters: Dict[Tuple[str, str, str], Tuple[_BloomFilter, float, frozenset]] = {}
+        self._building: set = set()
+        self._misses: "OrderedDict[Tuple[Tuple[str, str, str], str], float]" = OrderedDict()
+
+    def might_exist(self, group_id: str, settings: "_ConfigSnapshot", account_name: str) -> Optional[bool]:
+        """返回 False 表示快照中没有该账号；None 表示暂无可用快照"""
+        interval = settings.account_filter_refresh
+        if interval <= 0:
+            return None
+        key = _db_key(settings.db_config(group_id))
+        entry = self._filters.get(key)
+        now = time.monotonic()
+        if entry is None or now - entry[1] >= interval:
+            self._schedule(key, group_id, settings)
+        if entry is None or now - entry[1] >= interval * 3:
+            return None
+        return _normalise_account(account_name) in entry[0]
+
+    def bound_since_snapshot(self, group_id: str, settings: "_ConfigSnapshot", account_name: str) -> bool:
+        """账号是否在快照开始构建之后才被绑定（快照可能还没有收录它）"""
+        entry = self._filters.get(_db_key(settings.db_config(group_id)))
+        name = _normalise_account(account_name)
+        if entry is None or name in entry[2]:
+            return False
+        return any(_normalise_account(bound) == name for bound in _BIND_STORE.data.values())
+
+    def recently_missing(self, group_id: str, settings: "_ConfigSnapshot", account_name: str) -> bool:
+        """账号是否在 ACCOUNT_MISS_TTL 秒内已被数据库确认不存在"""
+        miss_key = (_db_key(settings.db_config(group_id)), _normalise_account(account_name))
+        confirmed_at = self._misses.get(miss_key)
+        if confirmed_at is None:
+            return False
+        if time.monotonic() - confirmed_at < ACCOUNT_MISS_TTL:
+            return True
+        del self._misses[miss_key]
+        return False
+
+    def confirm(self, group_id: str, settings: "_ConfigSnapshot", account_name: str, exists: bool) -> None:
+        """记录快照未命中后数据库的查询结果：存在则补进过滤器，不存在则短期缓存"""
+        key = _db_key(settings.db_config(group_id))
+        name = _normalise_account(account_name)
+        if exists:
+            self._misses.pop((key, name), None)
+            entry = self._filters.get(key)
+            if entry is not None:
+                entry[0].add(name)
+            return
+        self._misses.pop((key, name), None)
+        self._misses[(key, name)] = time.monotonic()
+        while len(self._misses) > ACCOUNT_MISS_CACHE_SIZE:
+            self._misses.popitem(last=False)
+
+    def _schedule(self, key: Tuple[str, str, str], group_id: str, settings: "_ConfigSnapshot") -> None:
+        if key in self._building:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._building.add(key)
+        loop.create_task(self._refresh(key, group_id, settings))
+
+    async def _refresh(self, key: Tuple[str, str, str], group_id: str, settings: "_ConfigSnapshot") -> None:
+        try:
+            started = time.perf_counter()
+            # 先记下已绑定的账号：之后才绑定的账号在快照中查不到时仍会查询数据库确认
+            bound = frozenset(_normalise_account(account) for account in _BIND_STORE.data.values())
+            bloom, count = await asyncio.to_thread(self._build, group_id, settings)
+            self._filters[key] = (bloom, time.monotonic(), bound)
+            logger.info(
+                f"账号快照已更新：{key[2]}@{key[0]} 共 {count} 个账号，"
+                f"{len(bloom.bits) / 1024:.0f}KB，用时 {(time.perf_counter() - started) * 1000:.0f}ms"
+            )
+        except Exception as e:
+            logger.error(f"构建账号快照失败: {e}")
+        finally:
+            self._building.discard(key)
+
+    @staticmethod
+    def _build(group_id: str, settings: "_ConfigSnapshot") -> Tuple[_BloomFilter, int]:
+        conn = _get_read_connection(group_id, settings)
+        if not conn:
+            raise RuntimeError("数据库连接失败")
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM MEMB_INFO")
+            total = int(cursor.fetchone()[0] or 0)
+            # 预留余量，快照期间新注册的账号不会让误判率明显上升
+            bloom = _BloomFilter(int(total * 1.1) + 1000)
+            cursor.execute("SELECT memb___id FROM MEMB_INFO")
+            count = 0
+            while True:
+                rows = cursor.fetchmany(ACCOUNT_FILTER_FETCH_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    if row[0] is not None:
+                        bloom.add(_normalise_account(row[0]))
+                        count += 1
+            return bloom, count
+        finally:
+            conn.close()
+
+
+_ACCOUNT_FILTER = _AccountFilterRegistry()
+
+
+def _fetch_account_row(conn, account_name: str):
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT memb___id, jf, yb FROM MEMB_INFO WHERE memb___id = ?", 
+        account_name
+    )
+    return cursor.fetchone()
+
+
+def _get_game_account_info(group_id: str, settings: "_ConfigSnapshot", account_name: str, verify: bool = False):
+    """获取游戏账号信息（支持群组独立数据库，配置只读库时从只读库读取）
+
+    verify 为 True（绑定账号）时读主库，刚在游戏中注册、只读库尚未同步的账号也能绑定；
+    只读库查询出错时回退主库重试，不会误判为账号不存在。
+
+    账号快照中不存在时：打卡、查询（verify 为 False）直接返回 None，快照之后才绑定的账号除外；
+    绑定账号（verify 为 True）查询数据库确认，近期已确认不存在的账号直接返回 None。
+    """
+    in_snapshot = _ACCOUNT_FILTER.might_exist(group_id, settings, account_name)
+    if in_snapshot is False:
+        if not verify and not _ACCOUNT_FILTER.bound_since_snapshot(group_id, settings, account_name):
+            return None
+        if _ACCOUNT_FILTER.recently_missing(group_id, settings, account_name):
+            return None
+    
+    conn, on_replica = _open_read_connection(group_id, settings, account_name, primary=verify)
     if not conn:
         return None
         
     try:
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT memb___id, jf, yb FROM MEMB_INFO WHERE memb___id = ?", 
-            account_name
-        )
-        row = cursor.fetchone()
+        try:
+            row = _fetch_account_row(conn, account_name)
+        except Exception as e:
+            if not on_replica:
+                raise
+            _replica_failed(settings.db_config(group_id), e)
+            conn.close()
+            conn = _get_db_connection(group_id, settings)
+            if not conn:
+                return None
+            row = _fetch_account_row(conn, account_name)
+        if in_snapshot is False:
+            # 快照之后新注册的账号补进过滤器；确认不存在的短期缓存
+            _ACCOUNT_FILTER.confirm(group_id, settings, account_name, row is not None)
         
         if row:
             return {
@@ -308,12 +718,13 @@ def _get_game_account_info(group_id: str, cfg: Dict[str, Any], account_name: str
         logger.error(f"查询游戏账号失败: {e}")
         return None
     finally:
-        conn.close()
+        if conn:
+            conn.close()
 
 
-def _update_game_account_assets(group_id: str, cfg: Dict[str, Any], account_name: str, points_change: int = 0, ingots_change: int = 0):
+def _update_game_account_assets(group_id: str, settings: "_ConfigSnapshot", account_name: str, points_change: int = 0, ingots_change: int = 0):
     """更新游戏账号的积分和元宝（支持群组独立数据库）"""
-    conn = _get_db_connection(group_id, cfg)
+    conn = _get_db_connection(group_id, settings)
     if not conn:
         return False
         
@@ -338,7 +749,10 @@ def _update_game_account_assets(group_id: str, cfg: Dict[str, Any], account_name
         cursor.execute(update_sql, params)
         conn.commit()
         
-        return cursor.rowcount > 0
+        if cursor.rowcount > 0:
+            _mark_account_written(group_id, settings, account_name)
+            return True
+        return False
         
     except Exception as e:
         logger.error(f"更新游戏账号资产失败: {e}")
@@ -348,233 +762,2753 @@ def _update_game_account_assets(group_id: str, cfg: Dict[str, Any], account_name
         conn.close()
 
 
+PAYOUT_PROCEDURE = "dbo.astrbot_draw_checkin_payout_v1"
+# 校验账号、发放积分/元宝并返回最新余额，整体在一个事务内完成
+PAYOUT_PROCEDURE_SQL = """CREATE PROCEDURE dbo.astrbot_draw_checkin_payout_v1
+    @account VARCHAR(50), @points INT, @ingots INT
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+    BEGIN TRAN;
+    IF @points <> 0 OR @ingots <> 0
+        UPDATE MEMB_INFO SET jf = ISNULL(jf, 0) + @points, yb = ISNULL(yb, 0) + @ingots WHERE memb___id = @account;
+    SELECT memb___id, jf, yb FROM MEMB_INFO WHERE memb___id = @account;
+    COMMIT;
+END"""
+# 无法创建存储过程时使用的等价单批 SQL
+PAYOUT_BATCH_SQL = """SET NOCOUNT ON;
+SET XACT_ABORT ON;
+BEGIN TRAN;
+UPDATE MEMB_INFO SET jf = ISNULL(jf, 0) + ?, yb = ISNULL(yb, 0) + ? WHERE memb___id = ?;
+SELECT memb___id, jf, yb FROM MEMB_INFO WHERE memb___id = ?;
+COMMIT;"""
+_PAYOUT_PROCEDURES: Dict[Tuple[str, str, str], bool] = {}  # 各游戏库的存储过程是否可用
+
+
+def _ensure_payout_procedure(cursor, db_key: Tuple[str, str, str]) -> bool:
+    """首次使用时在游戏库中安装发奖存储过程，结果按库缓存；无权限时返回 False"""
+    ready = _PAYOUT_PROCEDURES.get(db_key)
+    if ready is None:
+        try:
+            body = PAYOUT_PROCEDURE_SQL.replace("'", "''")
+            cursor.execute(f"IF OBJECT_ID(N'{PAYOUT_PROCEDURE}', N'P') IS NULL EXEC(N'{body}')")
+            ready = True
+        except Exception as e:
+            logger.error(f"安装发奖存储过程失败，改用单批 SQL: {e}")
+            ready = False
+        _PAYOUT_PROCEDURES[db_key] = ready
+    return ready
+
+
+def _apply_account_deltas(group_id: str, settings: "_ConfigSnapshot", account_name: str,
+                          points_change: int = 0, ingots_change: int = 0) -> Optional[Dict[str, Any]]:
+    """一次性发放积分/元宝
+
+    db_payout_mode 为 procedure / batch 时，校验账号、加减余额与读取最新余额在一次网络往返内完成，
+    返回 {"account", "points", "ingots"}；python 模式沿用逐条 UPDATE，不返回余额。
+    账号不存在或发放失败时返回 None。
+    """
+    db_config = settings.db_config(group_id)
+    mode = str(db_config.get("payout_mode") or "python").lower()
+    if mode not in {"procedure", "batch"}:
+        if not _update_game_account_assets(group_id, settings, account_name, points_change, ingots_change):
+            return None
+        return {"account": account_name, "points": None, "ingots": None}
+
+    conn = _get_db_connection(group_id, settings, autocommit=True)
+    if not conn:
+        return None
+
+    try:
+        cursor = conn.cursor()
+        db_key = (str(db_config["server"]), str(db_config["port"]), str(db_config["database"]))
+        if mode == "procedure" and _ensure_payout_procedure(cursor, db_key):
+            cursor.execute(f"EXEC {PAYOUT_PROCEDURE} ?, ?, ?", account_name, points_change, ingots_change)
+        else:
+            cursor.execute(PAYOUT_BATCH_SQL, points_change, ingots_change, account_name, account_name)
+        row = cursor.fetchone()
+        if not row:
+            return None
+        if points_change or ingots_change:
+            _mark_account_written(group_id, settings, account_name)
+        return {
+            "account": row[0],
+            "points": row[1] if row[1] is not None else 0,
+            "ingots": row[2] if row[2] is not None else 0
+        }
+    except Exception as e:
+        logger.error(f"发放游戏账号资产失败: {e}")
+        return None
+    finally:
+        conn.close()
+
+
 def _get_user_game_account(bind_data: Dict[str, Any], user_id: str) -> str:
     """根据用户ID获取绑定的游戏账号"""
     return bind_data.get(user_id, "")
 
 
-def _get_random_signature(cfg: Dict[str, Any]) -> str:
-    """获取随机签名"""
-    signature_messages = cfg.get("signature_messages", [
-        "奇迹世界因你而精彩！",
-        "坚持打卡，福利不断！",
-        "勇者大陆欢迎你的到来！",
-        "每日打卡，战力飙升！",
-        "奇迹相伴，快乐相随！"
-    ])
-    return random.choice(signature_messages)
+DEFAULT_SIGNATURES = [
+    "奇迹世界因你而精彩！",
+    "坚持打卡，福利不断！",
+    "勇者大陆欢迎你的到来！",
+    "每日打卡，战力飙升！",
+    "奇迹相伴，快乐相随！"
+]
 
+# 默认消息模板：模板名 -> 显示模式(emoji/plain) -> 行列表
+# 行内使用 {字段} 占位；{sep} 为分隔线，{signature} 为随机签名；
+# 若某行引用的字段值为 None，则整行不显示（用于可选行）
+DEFAULT_MESSAGE_TEMPLATES: Dict[str, Dict[str, List[str]]] = {
+    "checkin": {
+        "emoji": [
+            "✅ 打卡成功",
+            "{sep}",
+            "📅 累计打卡：{total_days}天",
+            "🔥 连续打卡：{consecutive_days}天",
+            "🎯 获得抽奖机会：{gained}次",
+            "💰 剩余抽奖机会：{chances}次",
+            "🎊 连续打卡奖励：额外{bonus}次抽奖机会",
+            "🎉 {event_name}：额外{event_bonus}次抽奖机会",
+            "{sep}",
+            "💫 {signature}"
+        ],
+        "plain": [
+            "打卡成功",
+            "{sep}",
+            "累计打卡：{total_days}天",
+            "连续打卡：{consecutive_days}天",
+            "获得抽奖机会：{gained}次",
+            "剩余抽奖机会：{chances}次",
+            "连续打卡奖励：额外{bonus}次抽奖机会",
+            "{event_name}：额外{event_bonus}次抽奖机会",
+            "{sep}",
+            "* {signature}"
+        ]
+    },
+    "checkin_digest_header": {
+        "emoji": [
+            "✅ 打卡成功（{count}人）",
+            "{sep}"
+        ],
+        "plain": [
+            "打卡成功（{count}人）",
+            "{sep}"
+        ]
+    },
+    "checkin_digest_entry": {
+        "emoji": [
+            " 🔥连续{consecutive_days}天 🎯+{gained}次 💰剩余{chances}次"
+        ],
+        "plain": [
+            " 连续{consecutive_days}天 +{gained}次 剩余{chances}次"
+        ]
+    },
+    "checkin_digest_footer": {
+        "emoji": [
+            "{sep}",
+            "💫 {signature}"
+        ],
+        "plain": [
+            "{sep}",
+            "* {signature}"
+        ]
+    },
+    "lottery": {
+        "emoji": [
+            "🎰 抽奖结果",
+            "🎉 活动进行中：{event_name}",
+            "{sep}",
+            "{results}",
+            "🎊 获得额外抽奖机会：{extra_chances}次",
+            "{sep}",
+            "剩余抽奖机会：{chances}次",
+            "💰 账户余额：积分 {points}，元宝 {ingots}",
+            "{sep}\n📝 需要兑换的物品：\n{items}\n💡 请私聊GM兑换物品",
+            "{sep}",
+            "💫 {signature}"
+        ],
+        "plain": [
+            "抽奖结果",
+            "活动进行中：{event_name}",
+            "{sep}",
+            "{results}",
+            "获得额外抽奖机会：{extra_chances}次",
+            "{sep}",
+            "剩余抽奖机会：{chances}次",
+            "账户余额：积分 {points}，元宝 {ingots}",
+            "{sep}\n需要兑换的物品：\n{items}\n请私聊GM兑换物品",
+            "{sep}",
+            "* {signature}"
+        ]
+    },
+    "bind_success": {
+        "emoji": [
+            "✨ 绑定成功",
+            "{sep}",
+            "👤 QQ用户：{user_id}",
+            "🎮 游戏账号：{account}",
+            "💎 当前积分：{points}",
+            "🪙 当前元宝：{ingots}",
+            "{sep}",
+            "💫 {signature}"
+        ],
+        "plain": [
+            "* 绑定成功",
+            "{sep}",
+            "QQ用户：{user_id}",
+            "游戏账号：{account}",
+            "当前积分：{points}",
+            "当前元宝：{ingots}",
+            "{sep}",
+            "* {signature}"
+        ]
+    },
+    "my_binding": {
+        "emoji": [
+            "✨ 我的绑定信息",
+            "{sep}",
+            "👤 QQ用户：{user_id}",
+            "🎮 游戏账号：{account}",
+            "💎 当前积分：{points}",
+            "🪙 当前元宝：{ingots}",
+            "✅ 绑定状态：{status_ok}",
+            "❌ 绑定状态：{status_error}",
+            "{sep}",
+            "💫 {signature}"
+        ],
+        "plain": [
+            "* 我的绑定信息",
+            "{sep}",
+            "QQ用户：{user_id}",
+            "游戏账号：{account}",
+            "当前积分：{points}",
+            "当前元宝：{ingots}",
+            "绑定状态：{status_ok}",
+            "绑定状态：{status_error}",
+            "{sep}",
+            "* {signature}"
+        ]
+    },
+    "lottery_chances": {
+        "emoji": [
+            "✨ 抽奖机会信息",
+            "{sep}",
+            "👤 用户：{username}",
+            "🎯 剩余抽奖机会：{chances}次",
+            "📅 累计打卡：{total_days}天",
+            "🔥 连续打卡：{consecutive_days}天",
+            "🎊 连续打卡奖励：额外{bonus}次抽奖机会",
+            "{sep}",
+            "💫 {signature}"
+        ],
+        "plain": [
+            "* 抽奖机会信息",
+            "{sep}",
+            "用户：{username}",
+            "剩余抽奖机会：{chances}次",
+            "累计打卡：{total_days}天",
+            "连续打卡：{consecutive_days}天",
+            "连续打卡奖励：额外{bonus}次抽奖机会",
+            "{sep}",
+            "* {signature}"
+        ]
+    },
+    "lottery_history": {
+        "emoji": [
+            "📜 {username}的抽奖历史",
+            "{sep}",
+            "{records}",
+            "{sep}",
+            "共计 {total} 条记录"
+        ],
+        "plain": [
+            "{username}的抽奖历史",
+            "{sep}",
+            "{records}",
+            "{sep}",
+            "共计 {total} 条记录"
+        ]
+    },
+    "checkin_calendar": {
+        "emoji": [
+            "📅 {username}的{month}签到日历",
+            "{sep}",
+            "{grid}",
+            "{sep}",
+            "✅ 本月签到：{count}/{days}天",
+            "🔥 连续打卡：{consecutive_days}天",
+            "🩹 本月剩余补签：{makeup_left}次"
+        ],
+        "plain": [
+            "{username}的{month}签到日历",
+            "{sep}",
+            "{grid}",
+            "{sep}",
+            "本月签到：{count}/{days}天",
+            "连续打卡：{consecutive_days}天",
+            "本月剩余补签：{makeup_left}次"
+        ]
+    },
+    "makeup_checkin": {
+        "emoji": [
+            "🩹 补签成功：{date}",
+            "{sep}",
+            "📅 累计打卡：{total_days}天",
+            "🔥 连续打卡：{consecutive_days}天",
+            "🎯 消耗抽奖机会：{cost}次",
+            "🩹 本月剩余补签：{makeup_left}次"
+        ],
+        "plain": [
+            "补签成功：{date}",
+            "{sep}",
+            "累计打卡：{total_days}天",
+            "连续打卡：{consecutive_days}天",
+            "消耗抽奖机会：{cost}次",
+            "本月剩余补签：{makeup_left}次"
+        ]
+    },
+    "checkin_stats": {
+        "emoji": [
+            "📊 近{n}天签到统计",
+            "{sep}",
+            "{rows}",
+            "{sep}",
+            "📈 日均签到：{average}人"
+        ],
+        "plain": [
+            "近{n}天签到统计",
+            "{sep}",
+            "{rows}",
+            "{sep}",
+            "日均签到：{average}人"
+        ]
+    },
+    "checkin_day_users": {
+        "emoji": [
+            "📊 {date} 签到名单（{count}人）",
+            "{sep}",
+            "{names}"
+        ],
+        "plain": [
+            "{date} 签到名单（{count}人）",
+            "{sep}",
+            "{names}"
+        ]
+    },
+    "lottery_simulation": {
+        "emoji": [
+            "🧪 抽奖模拟（{draws}次）",
+            "{sep}",
+            "{rows}",
+            "{sep}",
+            "{tiers}",
+            "✨ 倍率生效：{multiplied}次",
+            "🔑 随机种子：{seed}（相同种子可复现本次模拟）"
+        ],
+        "plain": [
+            "抽奖模拟（{draws}次）",
+            "{sep}",
+            "{rows}",
+            "{sep}",
+            "{tiers}",
+            "倍率生效：{multiplied}次",
+            "随机种子：{seed}（相同种子可复现本次模拟）"
+        ]
+    },
+    "query_assets": {
+        "emoji": [
+            "✨ 📊 打卡信息",
+            "{sep}",
+            "👤 用户：{username}",
+            "📅 累计打卡：{total_days}天",
+            "🔥 连续打卡：{consecutive_days}天",
+            "🎯 剩余抽奖机会：{chances}次",
+            "💎 账号积分：{points}",
+            "🪙 账号元宝：{ingots}",
+            "🎮 游戏账号：{unbound}",
+            "{sep}",
+            "💫 {signature}"
+        ],
+        "plain": [
+            "* 打卡信息",
+            "{sep}",
+            "用户：{username}",
+            "累计打卡：{total_days}天",
+            "连续打卡：{consecutive_days}天",
+            "剩余抽奖机会：{chances}次",
+            "账号积分：{points}",
+            "账号元宝：{ingots}",
+            "游戏账号：{unbound}",
+            "{sep}",
+            "* {signature}"
+        ]
+    },
+    "group_config": {
+        "emoji": [
+            "⚙️ 群组配置（群ID：{group_id}）",
+            "{sep}",
+            "数据库配置（自定义）：\n- 服务器：{db_server}\n- 数据库：{db_database}",
+            "- 只读库：{db_replica}",
+            "数据库配置：{db_default}",
+            "抽奖奖池：{pool}",
+            "{sep}",
+            "💡 使用命令修改配置：",
+            "/设置群组数据库 [服务器] [数据库] [用户名] [密码]",
+            "/设置群组只读库 [服务器] [端口]"
+        ],
+        "plain": [
+            "群组配置（群ID：{group_id}）",
+            "{sep}",
+            "数据库配置（自定义）：\n- 服务器：{db_server}\n- 数据库：{db_database}",
+            "- 只读库：{db_replica}",
+            "数据库配置：{db_default}",
+            "抽奖奖池：{pool}",
+            "{sep}",
+            "使用命令修改配置：",
+            "/设置群组数据库 [服务器] [数据库] [用户名] [密码]",
+            "/设置群组只读库 [服务器] [端口]"
+        ]
+    }
+}
 
-def _format_with_emoji(cfg: Dict[str, Any], text: str, emoji_dict: Dict[str, str]) -> str:
-    """根据配置决定是否使用emoji格式化文本"""
-    use_emoji = cfg.get("use_emoji", True)
-    if use_emoji:
-        for plain, emoji in emoji_dict.items():
-            text = text.replace(plain, emoji)
-    return text
 
+class _CompiledTemplate:
+    """预编译的消息模板
 
-def _format_message(cfg: Dict[str, Any], title: str, content_lines: list) -> str:
-    """统一格式化消息"""
-    separator = cfg.get("message_separator", "--------")
-    use_emoji = cfg.get("use_emoji", True)
-    
-    emoji_map = {
-        "✨": "✨",
-        "打卡信息": "📊 打卡信息",
-        "绑定信息": "🔗 绑定信息",
-        "抽奖信息": "🎯 抽奖信息",
-        "游戏账号信息": "🎮 游戏账号信息"
-    }
-    
-    if use_emoji:
-        formatted_title = _format_with_emoji(cfg, f"✨ {title}", emoji_map)
-    else:
-        formatted_title = f"* {title}"
-    
-    lines = [formatted_title, separator]
-    lines.extend(content_lines)
-    lines.append(separator)
-    
-    signature = _get_random_signature(cfg)
-    if use_emoji:
-        lines.append(f"💫 {signature}")
-    else:
-        lines.append(f"* {signature}")
-    
-    return "\n".join(lines)
+    每行被拆分为「字面量 / 字段」片段，分隔线等常量在编译期折叠进字面量，
+    渲染时只做一次拼接，不再逐条 str.replace。
+    """
 
+    __slots__ = ("lines",)
 
-def _is_checkin_time_allowed(cfg: Dict[str, Any]) -> Tuple[bool, str]:
-    """检查当前时间是否在允许的打卡时间内"""
-    try:
-        now = datetime.datetime.now()
-        current_hour = now.hour
-        current_minute = now.minute
-        current_time_minutes = current_hour * 60 + current_minute
-        
-        start_time_str = cfg.get("checkin_start_time", "00:00")
-        end_time_str = cfg.get("checkin_end_time", "23:59")
-        enable_time_limit = cfg.get("enable_checkin_time_limit", False)
-        
-        if not enable_time_limit:
-            return True, ""
-        
-        start_hour, start_minute = map(int, start_time_str.split(':'))
-        end_hour, end_minute = map(int, end_time_str.split(':'))
-        
-        start_time_minutes = start_hour * 60 + start_minute
-        end_time_minutes = end_hour * 60 + end_minute
-        
-        if start_time_minutes <= current_time_minutes <= end_time_minutes:
-            return True, ""
-        else:
-            start_display = f"{start_hour:02d}:{start_minute:02d}"
-            end_display = f"{end_hour:02d}:{end_minute:02d}"
-            return False, f"当前时间不在打卡时间内\n打卡时间：{start_display} - {end_display}"
-            
-    except Exception as e:
-        logger.error(f"检查打卡时间失败: {e}")
-        return True, ""
+    def __init__(self, lines: List[str], constants: Dict[str, str]):
+        formatter = string.Formatter()
+        self.lines: List[Tuple[Tuple[Any, ...], Tuple[str, ...]]] = []
+        for line in lines:
+            parts: List[Any] = []
+            fields: List[str] = []
+            for literal, field, spec, conversion in formatter.parse(line):
+                if literal:
+                    parts.append(literal)
+                if field is None:
+                    continue
+                if field in constants and not spec and not conversion:
+                    parts.append(constants[field])
+                    continue
+                parts.append((field, spec or "", conversion))
+                fields.append(field)
+            self.lines.append((tuple(parts), tuple(fields)))
+
+    def render(self, values: Dict[str, Any]) -> str:
+        out = []
+        for parts, fields in self.lines:
+            if any(values.get(field) is None for field in fields):
+                continue
+            chunks = []
+            for part in parts:
+                if isinstance(part, str):
+                    chunks.append(part)
+                    continue
+                field, spec, conversion = part
+                value = values[field]
+                if conversion == "r":
+                    value = repr(value)
+                elif conversion == "s":
+                    value = str(value)
+                chunks.append(format(value, spec))
+            out.append("".join(chunks))
+        return "\n".join(out)
+
+
+class _MessageTemplates:
+    """消息模板引擎：按配置一次性编译当前显示模式下的全部模板"""
+
+    def __init__(self, cfg: Dict[str, Any]):
+        self.use_emoji = bool(cfg.get("use_emoji", True))
+        self.separator = str(cfg.get("message_separator", "--------"))
+        self.signatures = tuple(cfg.get("signature_messages") or DEFAULT_SIGNATURES)
+        mode = "emoji" if self.use_emoji else "plain"
+        overrides = cfg.get("message_templates") or {}
+        constants = {"sep": self.separator}
+
+        self._compiled: Dict[str, _CompiledTemplate] = {}
+        for name, modes in DEFAULT_MESSAGE_TEMPLATES.items():
+            custom = overrides.get(name) if isinstance(overrides, dict) else None
+            lines = custom.get(mode) if isinstance(custom, dict) else None
+            if lines:
+                try:
+                    self._compiled[name] = _CompiledTemplate([str(line) for line in lines], constants)
+                    continue
+                except ValueError as e:
+                    logger.error(f"消息模板 {name}/{mode} 格式错误，已使用默认模板: {e}")
+            self._compiled[name] = _CompiledTemplate(modes[mode], constants)
+
+    def render(self, name: str, **values: Any) -> str:
+        """使用给定字段渲染模板"""
+        if "signature" not in values:
+            values["signature"] = random.choice(self.signatures) if self.signatures else ""
+        return self._compiled[name].render(values)
+
+
+# 图片卡片渲染配色：行类型 -> (图标底色, 图标文字)
+CARD_ICON_STYLES: Dict[str, Tuple[Tuple[int, int, int], str]] = {
+    "points": ((64, 158, 255), "积"),
+    "ingots": ((245, 166, 35), "宝"),
+    "item": ((155, 89, 182), "物"),
+    "multiplier": ((231, 76, 60), "倍"),
+    "extra_chance": ((46, 204, 113), "次"),
+    "checkin": ((26, 188, 156), "签"),
+    "info": ((127, 140, 141), "i"),
+}
+CARD_WIDTH = 480
+CARD_PADDING = 20
+CARD_HEADER_HEIGHT = 64
+CARD_ROW_HEIGHT = 40
+CARD_ICON_SIZE = 28
+CARD_KEEP_FILES = 50
+
+
+def _strip_emoji(text: str) -> str:
+    """去掉文本中的 emoji（卡片中由图标代替，且多数字体无法绘制）"""
+    return "".join(ch for ch in text if ord(ch) < 0x2600 or 0x3000 <= ord(ch) < 0x1F000).strip()
 
 
-def _perform_lottery(group_id: str, cfg: Dict[str, Any], user_id: str, game_account: str) -> Tuple[Dict[str, Any], str]:
-    """执行抽奖
-    返回: (抽奖结果, 消息)
+class _CardRenderer:
+    """打卡/抽奖结果图片卡片渲染器（可选，依赖 Pillow）
+
+    - 图标与字体在首次使用时栅格化并常驻缓存
+    - 背景、标题栏等静态图层使用 LRU 缓存，按（标题, 行数）复用
+    - 渲染在线程池中执行，不阻塞事件循环
     """
-    lottery_config = _load_lottery_items()
-    items = lottery_config.get("items", [])
-    special_rewards = lottery_config.get("special_rewards", [])
-    
-    if not items:
-        return {}, "❌ 抽奖配置错误，请联系管理员"
-    
-    # 计算总概率
-    total_prob = sum(item["probability"] for item in items)
-    total_special_prob = sum(reward["probability"] for reward in special_rewards)
-    
-    # 抽奖
-    roll = random.random() * (total_prob + total_special_prob)
-    
-    result = {}
-    message_lines = []
-    extra_chances = 0
-    
-    if roll <= total_prob:
-        # 抽中普通物品
-        cumulative_prob = 0
-        for item in items:
-            cumulative_prob += item["probability"]
-            if roll <= cumulative_prob:
-                result = item.copy()
-                break
-    else:
-        # 抽中特殊奖励
-        roll -= total_prob
-        cumulative_prob = 0
-        for reward in special_rewards:
-            cumulative_prob += reward["probability"]
-            if roll <= cumulative_prob:
-                result = reward.copy()
-                break
-    
-    if not result:
-        return {}, "❌ 抽奖失败，请稍后重试"
-    
-    # 处理结果
-    result_type = result.get("type")
-    
-    if result_type == "points":
-        amount = random.randint(result["min_amount"], result["max_amount"])
-        if _update_game_account_assets(group_id, cfg, game_account, points_change=amount):
-            result["actual_amount"] = amount
-            message_lines.append(f"🎉 恭喜！获得 {amount} 积分")
-        else:
-            return {}, "❌ 发放积分失败，请联系管理员"
-    
-    elif result_type == "ingots":
-        amount = random.randint(result["min_amount"], result["max_amount"])
-        if _update_game_account_assets(group_id, cfg, game_account, ingots_change=amount):
-            result["actual_amount"] = amount
-            message_lines.append(f"🎉 恭喜！获得 {amount} 元宝")
-        else:
-            return {}, "❌ 发放元宝失败，请联系管理员"
-    
-    elif result_type == "item":
-        amount = random.randint(result["min_amount"], result["max_amount"])
-        result["actual_amount"] = amount
-        message_lines.append(f"🎁 恭喜！获得 {result['name']} × {amount}")
-        message_lines.append(f"💡 请私聊GM兑换物品")
-    
-    elif result_type == "multiplier":
-        multiplier = result.get("multiplier", 2.0)
-        message_lines.append(f"✨ 获得特殊奖励：{result['name']}")
-        # 实际使用时需要结合下一次抽奖
-        result["multiplier"] = multiplier
-    
-    elif result_type == "extra_chance":
-        extra_chances = result.get("extra_chances", 1)
-        message_lines.append(f"🎊 获得特殊奖励：{result['name']}")
-        result["extra_chances"] = extra_chances
-    
-    # 记录抽奖历史
-    result["timestamp"] = datetime.datetime.now().isoformat()
-    result["user_id"] = user_id
-    
-    return result, "\n".join(message_lines), extra_chances
 
+    def __init__(self, cfg: Dict[str, Any]):
+        self.enabled = bool(cfg.get("enable_image_card", False))
+        self._font_path = str(cfg.get("image_card_font_path", "") or "")
+        self._executor: Optional[ThreadPoolExecutor] = None
+        if not self.enabled:
+            return
+        self._image = _optional_import("PIL.Image")
+        self._image_draw = _optional_import("PIL.ImageDraw")
+        self._image_font = _optional_import("PIL.ImageFont")
+        if self._image is None or self._image_draw is None or self._image_font is None:
+            logger.warning("未安装 Pillow，图片卡片功能已禁用，将回退为文字消息")
+            self.enabled = False
+            return
+        if not self._resolve_font_path():
+            logger.warning("未找到可用的中文字体文件，图片卡片功能已禁用，将回退为文字消息")
+            self.enabled = False
+            return
+        workers = max(1, int(cfg.get("image_card_workers", 2)))
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="draw_checkin_card")
+        self._card_dir = os.path.abspath(os.path.join(DATA_DIR, "cards"))
+        os.makedirs(self._card_dir, exist_ok=True)
+        self._font = functools.lru_cache(maxsize=8)(self._load_font)
+        self._icon = functools.lru_cache(maxsize=32)(self._rasterise_icon)
+        self._text_layer = functools.lru_cache(maxsize=512)(self._rasterise_text)
+        self._static_layer = functools.lru_cache(maxsize=64)(self._build_static_layer)
+        # 预先栅格化全部图标，首次渲染不再付出这部分开销
+        self._executor.submit(self._warm_up)
 
-def _update_consecutive_days(info: Dict[str, Any], today: datetime.date) -> None:
-    """更新连续打卡天数"""
-    last_checkin = info.get("last_checkin")
-    
-    if not last_checkin:
-        info["consecutive_days"] = 1
-        return
-    
-    try:
-        last_date = datetime.date.fromisoformat(last_checkin)
-        yesterday = _yesterday()
-        
-        if last_date == yesterday:
-            info["consecutive_days"] = info.get("consecutive_days", 0) + 1
-        elif last_date == today:
-            pass
-        else:
-            info["consecutive_days"] = 1
-    except ValueError:
-        info["consecutive_days"] = 1
+    def _resolve_font_path(self) -> str:
+        """优先使用配置的字体，其次使用数据目录中随插件分发的字体"""
+        candidates = [self._font_path, os.path.join(DATA_DIR, "assets", "card_font.ttf")]
+        for path in candidates:
+            if path and os.path.exists(path):
+                self._font_path = path
+                return path
+        return ""
 
+    def _load_font(self, size: int):
+        return self._image_font.truetype(self._font_path, size)
 
-@register("astrbot_plugin_draw_checkin", "小卡拉米", "抽奖打卡插件", "2.0.0")
-class DrawCheckinPlugin(Star):
-    def __init__(self, context: Context, config=None):
-        super().__init__(context)
-        self.data: Dict[str, Any] = _load_data()
-        self.bind_data: Dict[str, Any] = _load_bind_data()
-        self._cfg_obj = config
-        self._cfg_cache: Dict[str, Any] = dict(config or {})
+    def _rasterise_icon(self, kind: str):
+        color, glyph = CARD_ICON_STYLES.get(kind, CARD_ICON_STYLES["info"])
+        icon = self._image.new("RGBA", (CARD_ICON_SIZE, CARD_ICON_SIZE), (0, 0, 0, 0))
+        draw = self._image_draw.Draw(icon)
+        draw.rounded_rectangle((0, 0, CARD_ICON_SIZE - 1, CARD_ICON_SIZE - 1), radius=6, fill=color)
+        font = self._font(18)
+        left, top, right, bottom = draw.textbbox((0, 0), glyph, font=font)
+        draw.text(
+            ((CARD_ICON_SIZE - (right - left)) / 2 - left, (CARD_ICON_SIZE - (bottom - top)) / 2 - top),
+            glyph, font=font, fill=(255, 255, 255)
+        )
+        return icon
 
-    def _curr_cfg(self) -> Dict[str, Any]:
+    def _rasterise_text(self, text: str, size: int, color: Tuple[int, int, int]):
+        font = self._font(size)
+        left, top, right, bottom = font.getbbox(text or " ")
+        layer = self._image.new("RGBA", (max(1, right), max(1, bottom)), (0, 0, 0, 0))
+        self._image_draw.Draw(layer).text((0, 0), text, font=font, fill=color)
+        return layer
+
+    def _build_static_layer(self, title: str, row_count: int):
+        height = CARD_HEADER_HEIGHT + CARD_PADDING * 2 + CARD_ROW_HEIGHT * row_count
+        card = self._image.new("RGBA", (CARD_WIDTH, height), (250, 248, 243, 255))
+        draw = self._image_draw.Draw(card)
+        draw.rectangle((0, 0, CARD_WIDTH, CARD_HEADER_HEIGHT), fill=(52, 73, 94))
+        title_layer = self._text_layer(title, 26, (255, 255, 255))
+        card.alpha_composite(title_layer, (CARD_PADDING, (CARD_HEADER_HEIGHT - title_layer.height) // 2))
+        for idx in range(1, row_count):
+            y = CARD_HEADER_HEIGHT + CARD_PADDING + CARD_ROW_HEIGHT * idx
+            draw.line((CARD_PADDING, y, CARD_WIDTH - CARD_PADDING, y), fill=(230, 226, 218))
+        return card
+
+    def _warm_up(self) -> None:
         try:
-            if self._cfg_obj is not None:
-                return self._cfg_obj
-        except Exception:
-            pass
-        return self._cfg_cache
+            for kind in CARD_ICON_STYLES:
+                self._icon(kind)
+        except Exception as e:
+            logger.error(f"预加载卡片图标失败: {e}")
 
-    def _get_group_id(self, event: AstrMessageEvent) -> str:
-        """获取群组ID"""
-        return event.get_group_id() or "default"
+    def _render(self, title: str, rows: List[Tuple[str, str]]) -> str:
+        card = self._static_layer(_strip_emoji(title), len(rows)).copy()
+        for idx, (kind, text) in enumerate(rows):
+            y = CARD_HEADER_HEIGHT + CARD_PADDING + CARD_ROW_HEIGHT * idx
+            card.alpha_composite(self._icon(kind), (CARD_PADDING, y + (CARD_ROW_HEIGHT - CARD_ICON_SIZE) // 2))
+            text_layer = self._text_layer(_strip_emoji(text), 18, (44, 62, 80))
+            card.alpha_composite(
+                text_layer,
+                (CARD_PADDING + CARD_ICON_SIZE + 12, y + (CARD_ROW_HEIGHT - text_layer.height) // 2)
+            )
 
-    def _is_group_admin(self, event: AstrMessageEvent) -> bool:
-        """检查用户是否为群管理员或群主"""
-        user_id = event.get_sender_id()
-        
+        path = os.path.join(self._card_dir, f"{uuid.uuid4().hex}.png")
+        card.convert("RGB").save(path, "PNG", optimize=False)
+        self._cleanup()
+        return path
+
+    def _cleanup(self) -> None:
+        """只保留最近生成的若干张卡片"""
         try:
-            if event.is_admin():
-                return True
-        except Exception:
+            files = sorted(
+                (entry for entry in os.scandir(self._card_dir) if entry.name.endswith(".png")),
+                key=lambda entry: entry.stat().st_mtime
+            )
+            for entry in files[:-CARD_KEEP_FILES]:
+                os.remove(entry.path)
+        except Exception as e:
+            logger.error(f"清理卡片文件失败: {e}")
+
+    async def render(self, title: str, rows: List[Tuple[str, str]]) -> Optional[str]:
+        """在线程池中渲染卡片，返回图片路径；失败时返回 None 以便回退为文字"""
+        if not self.enabled or not rows:
+            return None
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self._render, title, rows)
+        except Exception as e:
+            logger.error(f"渲染图片卡片失败: {e}")
+            return None
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+class _CheckinDigest:
+    """群打卡回复聚合器
+
+    开启后，同一会话内的打卡成功回复会先缓冲，满足以下任一条件时合并为一条消息发出：
+    - 缓冲条数达到 flush_size：由当前打卡处理器直接回复
+    - 距首条缓冲超过 window 秒：由后台定时任务主动推送
+    """
+
+    def __init__(self, cfg: Dict[str, Any], send):
+        self.enabled = bool(cfg.get("enable_checkin_digest", False))
+        self.window = max(0.1, float(cfg.get("checkin_digest_window", 5)))
+        self.flush_size = max(1, int(cfg.get("checkin_digest_max_size", 20)))
+        self._send = send
+        self._buffers: Dict[str, List[Dict[str, Any]]] = {}
+        self._timers: Dict[str, asyncio.Task] = {}
+
+    def add(self, session: str, entry: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        """加入一条打卡结果；若缓冲已满则返回需立即发送的全部条目"""
+        buffer = self._buffers.setdefault(session, [])
+        buffer.append(entry)
+        if len(buffer) >= self.flush_size:
+            timer = self._timers.pop(session, None)
+            if timer is not None:
+                timer.cancel()
+            return self._buffers.pop(session)
+        if session not in self._timers:
+            self._timers[session] = asyncio.create_task(self._flush_later(session))
+        return None
+
+    async def _flush_later(self, session: str) -> None:
+        try:
+            await asyncio.sleep(self.window)
+        except asyncio.CancelledError:
+            return
+        self._timers.pop(session, None)
+        entries = self._buffers.pop(session, None)
+        if entries:
+            await self._deliver(session, entries)
+
+    async def _deliver(self, session: str, entries: List[Dict[str, Any]]) -> None:
+        try:
+            await self._send(session, entries)
+        except Exception as e:
+            logger.error(f"发送打卡汇总消息失败: {e}")
+
+    async def flush_all(self) -> None:
+        """立即发出全部缓冲（插件卸载时调用）"""
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        buffers, self._buffers = self._buffers, {}
+        for session, entries in buffers.items():
+            if entries:
+                await self._deliver(session, entries)
+
+
+
+class _RateLimiter:
+    """按「用户 + 会话 + 命令」限流的令牌桶
+
+    每个活跃键只保存 [令牌数, 上次访问时间, 是否已提示] 三个值，令牌在访问时按流逝时间惰性补充。
+    键按最近访问排序：空闲到令牌已回满的键与同新建无异，访问时从最旧一端顺带清理；
+    键数超过 max_keys 时淘汰最久未访问的键。
+    """
+
+    def __init__(self, cfg: Dict[str, Any]):
+        self.enabled = bool(cfg.get("enable_rate_limit", True))
+        self.capacity = max(1.0, float(cfg.get("rate_limit_capacity", 3)))
+        self.refill_seconds = max(0.1, float(cfg.get("rate_limit_refill_seconds", 10)))
+        self.max_keys = max(100, int(cfg.get("rate_limit_max_keys", 10000)))
+        # 回满整个桶所需的时间，空闲超过该时间的键可直接丢弃
+        self._idle_ttl = self.capacity * self.refill_seconds
+        self._buckets: "OrderedDict[Tuple[str, str, str], List[Any]]" = OrderedDict()
+        self.notice = str(cfg.get("rate_limit_message", "") or "⏳ 操作太频繁啦，请稍后再试~")
+
+    def _evict(self, now: float) -> None:
+        while self._buckets:
+            key, bucket = next(iter(self._buckets.items()))
+            if now - bucket[1] < self._idle_ttl and len(self._buckets) < self.max_keys:
+                break
+            del self._buckets[key]
+
+    def acquire(self, key: Tuple[str, str, str]) -> Optional[str]:
+        """消耗一个令牌；放行返回 None，被限流返回提示语（同一轮限流只提示一次，之后返回空串）"""
+        now = time.monotonic()
+        self._evict(now)
+        bucket = self._buckets.pop(key, None)
+        if bucket is None:
+            bucket = [self.capacity, now, False]
+        else:
+            bucket[0] = min(self.capacity, bucket[0] + (now - bucket[1]) / self.refill_seconds)
+            bucket[1] = now
+        self._buckets[key] = bucket
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            bucket[2] = False
+            return None
+        if bucket[2]:
+            return ""
+        bucket[2] = True
+        return self.notice
+
+
+def _rate_limited(command: str):
+    """命令限流装饰器（放在 filter.command 之下），被限流时直接返回缓存的提示语，不执行命令"""
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(self, event: AstrMessageEvent, *args, **kwargs):
+            limiter = self._rate_limiter
+            if limiter.enabled:
+                notice = limiter.acquire((event.get_sender_id(), event.unified_msg_origin, command))
+                if notice is not None:
+                    if notice:
+                        yield event.plain_result(notice)
+                    return
+            async for result in handler(self, event, *args, **kwargs):
+                yield result
+        return wrapper
+    return decorator
+
+
+class _DedupeWindow:
+    """消息去重窗口
+
+    固定容量的环形缓冲记录 (消息键, 到达时间)，配合哈希集合做 O(1) 查重；
+    超出 window 秒或被新消息挤出缓冲的键自动失效，内存占用固定。
+    """
+
+    def __init__(self, cfg: Dict[str, Any]):
+        self.window = max(1.0, float(cfg.get("dedupe_window", 600)))
+        self.capacity = max(16, int(cfg.get("dedupe_capacity", 4096)))
+        self._ring: List[Optional[Tuple[str, float]]] = [None] * self.capacity
+        self._head = 0
+        self._size = 0
+        self._seen: set = set()
+
+    def seen(self, key: str) -> bool:
+        """已在窗口内出现过返回 True；否则记录该键并返回 False"""
+        now = time.monotonic()
+        while self._size:
+            oldest = (self._head - self._size) % self.capacity
+            old_key, arrived = self._ring[oldest]
+            if now - arrived < self.window and self._size < self.capacity:
+                break
+            self._seen.discard(old_key)
+            self._ring[oldest] = None
+            self._size -= 1
+
+        if key in self._seen:
+            return True
+        self._ring[self._head] = (key, now)
+        self._head = (self._head + 1) % self.capacity
+        self._size += 1
+        self._seen.add(key)
+        return False
+
+
+def _message_key(event: AstrMessageEvent) -> Optional[str]:
+    """平台消息的唯一键；适配器未提供消息ID时返回 None"""
+    try:
+        message_id = event.message_obj.message_id
+    except Exception:
+        return None
+    if not message_id:
+        return None
+    return f"{event.unified_msg_origin}:{message_id}"
+
+
+def _idempotent(handler):
+    """幂等装饰器（紧贴 filter.command 之下）：适配器重连后重复投递的同一条消息只处理一次"""
+    @functools.wraps(handler)
+    async def wrapper(self, event: AstrMessageEvent, *args, **kwargs):
+        key = _message_key(event)
+        if key is not None and self._dedupe.seen(key):
+            logger.info(f"忽略重复投递的消息：{key}（{handler.__name__}）")
+            return
+        async for result in handler(self, event, *args, **kwargs):
+            yield result
+    return wrapper
+
+
+class _ProfileCapture:
+    """一次性能采样：累计目标命令接下来 N 次执行的剖析数据，完成后写入 PROFILE_DIR
+
+    剖析只在命令处理函数自身运行的每一步（两次 await 之间）开启，等待期间事件循环上的其他消息不会计入。
+    cprofile 模式输出 pstats 文件（附按累计耗时排序的文本摘要）；
+    sample 模式由后台线程定时采样事件循环线程的调用栈，输出可直接生成火焰图的 collapsed stack 文本。
+    """
+
+    def __init__(self, command: str, runs: int, mode: str):
+        self.command = command
+        self.runs = runs
+        self.mode = mode
+        self.remaining = runs
+        self.active = 0
+        self.wall_times: List[float] = []
+        self._stepping = False
+        self._thread_id: Optional[int] = None
+        self._profile = None
+        self._stacks: Dict[str, int] = {}
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        if mode == "cprofile":
+            import cProfile
+            self._profile = cProfile.Profile()
+        else:
+            self._sampler = threading.Thread(target=self._sample_loop, name="draw_checkin_profiler", daemon=True)
+            self._sampler.start()
+
+    def resume(self) -> None:
+        self._thread_id = threading.get_ident()
+        self._stepping = True
+        if self._profile is not None:
+            self._profile.enable()
+
+    def pause(self) -> None:
+        if self._profile is not None:
+            self._profile.disable()
+        self._stepping = False
+
+    def _sample_loop(self) -> None:
+        while not self._stop.wait(PROFILE_SAMPLE_INTERVAL):
+            if not self._stepping:
+                continue
+            frame = sys._current_frames().get(self._thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if names:
+                stack = ";".join(reversed(names))
+                self._stacks[stack] = self._stacks.get(stack, 0) + 1
+
+    def finish(self) -> Optional[str]:
+        """停止采样并写出结果文件；没有完成任何一次执行时不写文件，返回 None"""
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        if not self.wall_times:
+            return None
+
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        base = os.path.abspath(os.path.join(PROFILE_DIR, f"{self.command}_{datetime.datetime.now():%Y%m%d_%H%M%S}"))
+        if self._profile is not None:
+            import pstats
+            path = base + ".prof"
+            self._profile.dump_stats(path)
+            with open(base + ".txt", "w", encoding="utf-8") as f:
+                pstats.Stats(self._profile, stream=f).sort_stats("cumulative").print_stats(40)
+        else:
+            path = base + ".folded"
+            with open(path, "w", encoding="utf-8") as f:
+                for stack, count in sorted(self._stacks.items()):
+                    f.write(f"{stack} {count}\n")
+        return path
+
+
+class _ProfiledStep:
+    """包装一次 await：被包装对象每运行一步都开启剖析，挂起等待时暂停"""
+
+    __slots__ = ("_awaitable", "_capture")
+
+    def __init__(self, awaitable, capture: _ProfileCapture):
+        self._awaitable = awaitable
+        self._capture = capture
+
+    def __await__(self):
+        it = self._awaitable.__await__()
+        value, error = None, None
+        while True:
+            self._capture.resume()
+            try:
+                signal = it.throw(error) if error is not None else it.send(value)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                self._capture.pause()
+            try:
+                value, error = (yield signal), None
+            except BaseException as e:
+                value, error = None, e
+
+
+class _HandlerProfiler:
+    """按命令开启的性能采样；未开启时热路径只有一次字典查询"""
+
+    def __init__(self):
+        self._captures: Dict[str, _ProfileCapture] = {}
+        self.history: List[Dict[str, Any]] = []
+
+    def arm(self, command: str, runs: int, mode: str) -> None:
+        """为命令开启接下来 runs 次执行的采样（替换该命令尚未完成的采样）"""
+        self.cancel(command)
+        self._captures[command] = _ProfileCapture(command, runs, mode)
+
+    def cancel(self, command: str) -> bool:
+        """取消命令的采样，已完成的部分仍会写出"""
+        capture = self._captures.pop(command, None)
+        if capture is None:
+            return False
+        self._finish(capture)
+        return True
+
+    def pending(self) -> List[_ProfileCapture]:
+        return list(self._captures.values())
+
+    def begin(self, command: str) -> Optional[_ProfileCapture]:
+        capture = self._captures.get(command)
+        if capture is None or capture.remaining <= 0:
+            return None
+        capture.remaining -= 1
+        capture.active += 1
+        return capture
+
+    def end(self, capture: _ProfileCapture, elapsed: float) -> None:
+        capture.active -= 1
+        capture.wall_times.append(elapsed)
+        if capture.remaining <= 0 and capture.active == 0 and self._captures.get(capture.command) is capture:
+            del self._captures[capture.command]
+            self._finish(capture)
+
+    def _finish(self, capture: _ProfileCapture) -> None:
+        try:
+            path = capture.finish()
+        except Exception as e:
+            logger.error(f"写出性能采样结果失败: {e}")
+            return
+        if path is None:
+            return
+        avg_ms = sum(capture.wall_times) / len(capture.wall_times) * 1000
+        self.history.append({
+            "command": capture.command,
+            "mode": capture.mode,
+            "runs": len(capture.wall_times),
+            "avg_ms": avg_ms,
+            "max_ms": max(capture.wall_times) * 1000,
+            "path": path,
+        })
+        del self.history[:-PROFILE_HISTORY]
+        logger.info(f"性能采样完成：/{capture.command} {len(capture.wall_times)}次，平均耗时 {avg_ms:.1f}ms，文件：{path}")
+
+    def shutdown(self) -> None:
+        for command in list(self._captures):
+            self.cancel(command)
+
+
+_PROFILED_COMMANDS: set = set()
+
+
+def _profiled(command: str):
+    """性能采样装饰器（放在其他装饰器最内层，只统计真正执行的命令），未开启采样时直接透传"""
+    _PROFILED_COMMANDS.add(command)
+
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(self, event: AstrMessageEvent, *args, **kwargs):
+            capture = self._profiler.begin(command)
+            if capture is None:
+                async for result in handler(self, event, *args, **kwargs):
+                    yield result
+                return
+            started = time.perf_counter()
+            steps = handler(self, event, *args, **kwargs)
+            try:
+                while True:
+                    try:
+                        result = await _ProfiledStep(steps.__anext__(), capture)
+                    except StopAsyncIteration:
+                        break
+                    yield result
+            finally:
+                self._profiler.end(capture, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def _parse_clock(text: str) -> int:
+    """将 HH:MM 解析为当天的分钟数"""
+    hour, minute = map(int, str(text).strip().split(":"))
+    if not (0 <= hour <= 23 and 0 <= minute <= 59):
+        raise ValueError(f"无效的时间：{text}")
+    return hour * 60 + minute
+
+
+def _format_clock(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def _parse_time_windows(cfg: Dict[str, Any]) -> Tuple[Tuple[int, int], ...]:
+    """解析打卡时间段
+
+    优先使用 checkin_time_windows（如 ["08:00-10:00", "22:00-02:00"]），
+    否则使用 checkin_start_time / checkin_end_time。开始晚于结束表示跨越零点。
+    """
+    specs = cfg.get("checkin_time_windows") or [
+        f"{cfg.get('checkin_start_time', '00:00')}-{cfg.get('checkin_end_time', '23:59')}"
+    ]
+    windows = []
+    for spec in specs:
+        try:
+            start, end = str(spec).split("-")
+            windows.append((_parse_clock(start), _parse_clock(end)))
+        except Exception as e:
+            logger.error(f"解析打卡时间段失败: {spec} ({e})")
+    return tuple(windows)
+
+
+class _ConfigSnapshot:
+    """插件配置的只读快照
+
+    在插件加载（配置变更会触发重载）时校验并解析一次，处理器直接读取属性，
+    不再每次 .get() 取默认值或重复解析时间字符串。
+    数据库配置同样在此解析：全局配置只解析一次，群组自定义的数据库配置按群缓存，
+    群组配置文件被修改（/设置群数据库 或其他实例）后才重新解析。
+    """
+
+    __slots__ = (
+        "storage_scope", "base_lottery_chances", "makeup_monthly_limit", "makeup_cost",
+        "time_limit_enabled", "checkin_windows", "checkin_time_notice", "account_filter_refresh",
+        "_db_source", "_default_db_config", "_group_db_configs", "_frozen"
+    )
+
+    def __init__(self, cfg: Dict[str, Any]):
+        scope = str(cfg.get("storage_scope") or "group").lower()
+        self.storage_scope = scope if scope in STORAGE_SCOPES else "group"
+        self.base_lottery_chances = max(0, int(cfg.get("base_lottery_chances", 1)))
+        self.makeup_monthly_limit = max(0, int(cfg.get("makeup_checkin_monthly_limit", 2)))
+        self.makeup_cost = max(0, int(cfg.get("makeup_checkin_cost", 1)))
+
+        # 兼容旧版本的 enable_checkin_time_limit 键
+        enabled = bool(cfg.get("enable_time_limit", False) or cfg.get("enable_checkin_time_limit", False))
+        self.checkin_windows = _parse_time_windows(cfg) if enabled else ()
+        if enabled and not self.checkin_windows:
+            logger.error("打卡时间限制已开启但没有有效的时间段，已忽略时间限制")
+        self.time_limit_enabled = bool(self.checkin_windows)
+        self.checkin_time_notice = "、".join(
+            f"{_format_clock(start)} - {_format_clock(end)}" for start, end in self.checkin_windows
+        )
+
+        self.account_filter_refresh = float(cfg.get("account_filter_refresh", 600))
+        self._db_source = {key: value for key, value in cfg.items() if key.startswith("db_")}
+        self._default_db_config = _resolve_db_config({}, self._db_source)
+        # 群号 -> (群组配置文件版本, 解析后的数据库配置)
+        self._group_db_configs: Dict[str, Tuple[Any, Dict[str, Any]]] = {}
+        self._frozen = True
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        if getattr(self, "_frozen", False):
+            raise AttributeError("配置快照为只读")
+        object.__setattr__(self, name, value)
+
+    def db_config(self, group_id: str) -> Dict[str, Any]:
+        """群组的数据库连接配置（含可选的只读库），只读，调用方不应修改"""
+        group_db_cfg = (_load_group_config().get(group_id) or {}).get("db_config")
+        if not group_db_cfg:
+            return self._default_db_config
+        version = _GROUP_CONFIG_STORE.version
+        cached = self._group_db_configs.get(group_id)
+        if cached is None or cached[0] != version:
+            cached = self._group_db_configs[group_id] = (version, _resolve_db_config(group_db_cfg, self._db_source))
+        return cached[1]
+
+    def checkin_time_allowed(self, now: Optional[datetime.datetime] = None) -> Tuple[bool, str]:
+        """检查当前时间是否在允许的打卡时间内"""
+        if not self.time_limit_enabled:
+            return True, ""
+        now = now or datetime.datetime.now()
+        minutes = now.hour * 60 + now.minute
+        for start, end in self.checkin_windows:
+            if start <= end:
+                if start <= minutes <= end:
+                    return True, ""
+            elif minutes >= start or minutes <= end:
+                return True, ""
+        return False, f"当前时间不在打卡时间内\n打卡时间：{self.checkin_time_notice}"
+
+
+SPECIAL_REWARD_TYPES = {"multiplier", "extra_chance"}
+COMMON_TIERS = {"common", "special"}
+
+
+def _pool_digest(pool: Dict[str, Any]) -> str:
+    """奖池配置的内容哈希"""
+    return hashlib.sha1(json.dumps(pool, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def _archive_pool(digest: str, pool: Dict[str, Any]) -> None:
+    """按内容哈希存档奖池配置（已存在则跳过），奖池或活动修改、删除后仍可复现当时的抽奖"""
+    path = os.path.join(POOL_ARCHIVE_DIR, f"{digest}.json")
+    if os.path.exists(path):
+        return
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(POOL_ARCHIVE_DIR, exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(pool, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.error(f"存档奖池配置失败: {e}")
+
+
+def _load_archived_pool(digest: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(POOL_ARCHIVE_DIR, f"{digest}.json")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class _LotterySampler:
+    """预编译的抽奖分布（分层别名表）
+
+    先按稀有度层级抽层，再在层内用 Walker 别名表 O(1) 抽取具体奖品。
+    保底等按用户状态调整的只是层级权重（寥寥几个数），层内表无需重建。
+    """
+
+    def __init__(self, lottery_config: Dict[str, Any]):
+        grouped: Dict[str, List[Dict[str, Any]]] = {}
+        for item in lottery_config.get("items", []):
+            grouped.setdefault(item.get("rarity", "common"), []).append(item)
+        for reward in lottery_config.get("special_rewards", []):
+            grouped.setdefault(reward.get("rarity", "special"), []).append(reward)
+
+        self.tiers: List[str] = []
+        self.tier_weights: List[float] = []
+        self._tables: List[Tuple[List[Dict[str, Any]], List[float], List[int]]] = []
+        for tier, entries in grouped.items():
+            entries = [entry for entry in entries if float(entry.get("probability", 0)) > 0]
+            if not entries:
+                continue
+            weights = [float(entry["probability"]) for entry in entries]
+            self.tiers.append(tier)
+            self.tier_weights.append(sum(weights))
+            self._tables.append((entries, *self._build_alias(weights)))
+
+        self.total_weight = sum(self.tier_weights)
+        self._tier_weight = dict(zip(self.tiers, self.tier_weights))
+        self.has_items = bool(lottery_config.get("items"))
+        self.pity: Dict[str, Dict[str, float]] = {
+            tier: rule for tier, rule in (lottery_config.get("pity") or {}).items() if tier in self.tiers
+        }
+        self.config = lottery_config
+        self.digest = _pool_digest(lottery_config)
+        # 由 excluding() 生成的变体记录相对原奖池剔除的奖品
+        self.excluded: frozenset = frozenset()
+        # 限量奖品：奖品 id -> (库存键, 上限, 周期)
+        self.stocked: Dict[Any, Tuple[str, int, str]] = {
+            entry.get("id"): _stock_spec(entry)
+            for entries, _, _ in self._tables for entry in entries if entry.get("stock") is not None
+        }
+        self._variants: Dict[frozenset, "_LotterySampler"] = {}
+
+    def excluding(self, item_ids: frozenset) -> "_LotterySampler":
+        """返回剔除指定奖品后重新归一化的抽样器（按剔除集合缓存）"""
+        if not item_ids:
+            return self
+        variant = self._variants.get(item_ids)
+        if variant is None:
+            variant = self._variants[item_ids] = _LotterySampler(_merge_pool(self.config, {"remove": list(item_ids)}))
+            variant.excluded = item_ids
+        return variant
+
+    def available(self, ledger: "_StockLedger") -> "_LotterySampler":
+        """剔除已售罄的限量奖品"""
+        if not self.stocked:
+            return self
+        sold_out = frozenset(
+            item_id for item_id, spec in self.stocked.items() if ledger.remaining(*spec) <= 0
+        )
+        return self.excluding(sold_out)
+
+    @staticmethod
+    def _build_alias(weights: List[float]) -> Tuple[List[float], List[int]]:
+        """Vose 别名法建表"""
+        count = len(weights)
+        total = sum(weights)
+        scaled = [w * count / total for w in weights]
+        prob = [0.0] * count
+        alias = list(range(count))
+        small = [i for i, w in enumerate(scaled) if w < 1.0]
+        large = [i for i, w in enumerate(scaled) if w >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            prob[s] = scaled[s]
+            alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+        for i in small + large:
+            prob[i] = 1.0
+        return prob, alias
+
+    def weights_for(self, state: Dict[str, Any]) -> List[float]:
+        """按用户保底计数调整层级权重
+
+        - 距上次命中达到 hard-1 次时，下一抽必出该层（多个层同时触发时取最稀有的）
+        - 超过 soft_start 后，每多一抽该层权重增加 soft_step × 总权重
+        """
+        if not self.pity:
+            return self.tier_weights
+        counters = state.get("pity", {})
+        weights = list(self.tier_weights)
+        forced = None
+        for idx, tier in enumerate(self.tiers):
+            rule = self.pity.get(tier)
+            if not rule:
+                continue
+            misses = counters.get(tier, 0)
+            hard = int(rule.get("hard", 0))
+            if hard and misses + 1 >= hard:
+                if forced is None or self.tier_weights[idx] < self.tier_weights[forced]:
+                    forced = idx
+                continue
+            soft_start = int(rule.get("soft_start", 0))
+            if soft_start and misses >= soft_start:
+                weights[idx] += self.total_weight * float(rule.get("soft_step", 0)) * (misses - soft_start + 1)
+        if forced is not None:
+            return [w if idx == forced else 0.0 for idx, w in enumerate(weights)]
+        return weights
+
+    def satisfies(self, hit_tier: str, tier: str) -> bool:
+        """抽中 hit_tier 是否满足 tier 的保底：同层或更稀有（权重更小）的非普通层级都算
+
+        否则多个层级同时到达必出抽数时，被更稀有层级占用的那一抽会让较低层级的保底多等一抽。
+        """
+        if hit_tier == tier:
+            return True
+        return hit_tier not in COMMON_TIERS and self._tier_weight.get(hit_tier, 0.0) <= self._tier_weight.get(tier, 0.0)
+
+    def draw(self, weights: List[float], rng=random) -> Tuple[Dict[str, Any], str]:
+        """抽取一次，返回 (奖品配置, 所属层级)"""
+        roll = rng.random() * sum(weights)
+        tier_idx = len(weights) - 1
+        for idx, weight in enumerate(weights):
+            if roll < weight:
+                tier_idx = idx
+                break
+            roll -= weight
+        entries, prob, alias = self._tables[tier_idx]
+        column = rng.random() * len(entries)
+        slot = int(column)
+        if column - slot >= prob[slot]:
+            slot = alias[slot]
+        return entries[slot], self.tiers[tier_idx]
+
+
+def _load_lottery_pools() -> Dict[str, Any]:
+    """加载奖池定义（lottery_items.json 为 default 基础奖池）"""
+    try:
+        if os.path.exists(LOTTERY_POOLS_FILE):
+            with open(LOTTERY_POOLS_FILE, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return {}
+    except Exception as e:
+        logger.error(f"加载奖池定义失败: {e}")
+        return {}
+
+
+def _merge_pool(base: Dict[str, Any], override: Dict[str, Any]) -> Dict[str, Any]:
+    """在父奖池基础上叠加子奖池定义
+
+    - items / special_rewards 按 id 合并：同 id 覆盖字段，新 id 追加
+    - remove 列出需要从父奖池中移除的 id
+    - pity 按层级覆盖
+    """
+    merged = copy.deepcopy(base)
+    removed = set(override.get("remove", []))
+    for key in ("items", "special_rewards"):
+        entries = [entry for entry in merged.get(key, []) if entry.get("id") not in removed]
+        index = {entry.get("id"): entry for entry in entries}
+        for entry in override.get(key, []):
+            if entry.get("id") in index:
+                index[entry.get("id")].update(entry)
+            else:
+                entries.append(copy.deepcopy(entry))
+                index[entry.get("id")] = entries[-1]
+        merged[key] = entries
+    if "pity" in override:
+        merged["pity"] = {**merged.get("pity", {}), **override["pity"]}
+    return merged
+
+
+def _resolve_pools(base: Dict[str, Any], definitions: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """展开奖池继承链，返回 {奖池名: 完整奖池配置}"""
+    resolved: Dict[str, Dict[str, Any]] = {DEFAULT_POOL: base}
+
+    def resolve(name: str, chain: Tuple[str, ...]) -> Optional[Dict[str, Any]]:
+        if name in resolved:
+            return resolved[name]
+        definition = definitions.get(name)
+        if definition is None or name in chain:
+            logger.error(f"奖池 {name} 不存在或存在循环继承，已忽略")
+            return None
+        parent = resolve(definition.get("inherit", DEFAULT_POOL), chain + (name,))
+        if parent is None:
+            return None
+        resolved[name] = _merge_pool(parent, definition)
+        return resolved[name]
+
+    for name in definitions:
+        resolve(name, ())
+    return resolved
+
+
+class _LotteryPoolRegistry:
+    """奖池注册表
+
+    - 各奖池展开继承后按内容哈希去重编译，内容相同的奖池共享同一份抽样表
+    - 群 → 抽样器 为直接引用，切换奖池只是一次指针替换
+    - 奖池文件变更后（最多每 POOL_RELOAD_INTERVAL 秒检查一次）整体重新编译；
+      只有群组配置变更（本实例、其他实例或命令行修改了群奖池）时仅重建群 → 抽样器的引用
+    """
+
+    def __init__(self):
+        self._by_hash: Dict[str, _LotterySampler] = {}
+        self._pools: Dict[str, _LotterySampler] = {}
+        self._groups: Dict[str, _LotterySampler] = {}
+        self._group_pool_names: Dict[str, str] = {}
+        self._resolved: Dict[str, Dict[str, Any]] = {}
+        self._mtimes: Tuple[Any, ...] = ()
+        self._group_mtime: Any = None
+        self._checked_at = 0.0
+        self.version = 0
+
+    @staticmethod
+    def _stat(paths=(LOTTERY_ITEMS_FILE, LOTTERY_POOLS_FILE)) -> Tuple[Any, ...]:
+        mtimes = []
+        for path in paths:
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        return tuple(mtimes)
+
+    def _compile(self, pool: Dict[str, Any]) -> _LotterySampler:
+        digest = _pool_digest(pool)
+        sampler = self._by_hash.get(digest)
+        if sampler is None:
+            sampler = self._by_hash[digest] = _LotterySampler(pool)
+            _archive_pool(digest, pool)
+        return sampler
+
+    def _reload(self) -> None:
+        base = _load_lottery_items()
+        resolved = _resolve_pools(base, _load_lottery_pools().get("pools", {}))
+        self._resolved = resolved
+        self._by_hash = {}
+        self._pools = {name: self._compile(pool) for name, pool in resolved.items()}
+        self._reload_groups()
+        self._mtimes = self._stat()
+        self.version += 1
+        logger.info(f"奖池已编译：{len(self._pools)} 个奖池，{len(self._by_hash)} 份抽样表")
+
+    def _reload_groups(self) -> None:
+        """按群组配置重建群 → 抽样器的引用（不重新编译奖池）"""
+        self._group_mtime = self._stat((GROUP_CONFIG_FILE,))
+        self._group_pool_names = {
+            group_id: group_cfg["lottery_pool"]
+            for group_id, group_cfg in _load_group_config().items()
+            if isinstance(group_cfg, dict) and group_cfg.get("lottery_pool")
+        }
+        self._groups = {
+            group_id: self._pools[name]
+            for group_id, name in self._group_pool_names.items() if name in self._pools
+        }
+
+    def _refresh(self) -> None:
+        now = time.monotonic()
+        if self._pools and now - self._checked_at < POOL_RELOAD_INTERVAL:
+            return
+        self._checked_at = now
+        if not self._pools or self._stat() != self._mtimes:
+            self._reload()
+        elif self._stat((GROUP_CONFIG_FILE,)) != self._group_mtime:
+            self._reload_groups()
+
+    def sampler_for(self, group_id: str) -> _LotterySampler:
+        self._refresh()
+        return self._groups.get(group_id) or self._pools[DEFAULT_POOL]
+
+    def pool_name_for(self, group_id: str) -> str:
+        self._refresh()
+        name = self._group_pool_names.get(group_id, DEFAULT_POOL)
+        return name if name in self._pools else DEFAULT_POOL
+
+    def pool_names(self) -> List[str]:
+        self._refresh()
+        return list(self._pools)
+
+    def compile_overlay(self, pool_name: str, overlay: Dict[str, Any]) -> _LotterySampler:
+        """编译叠加了活动覆盖的奖池（同样按内容哈希去重）"""
+        self._refresh()
+        base = self._resolved.get(pool_name, self._resolved[DEFAULT_POOL])
+        return self._compile(_apply_event_overlay(base, overlay))
+
+    def forget(self, group_id: str) -> None:
+        """群组配置被删除时恢复为默认奖池"""
+        self._groups.pop(group_id, None)
+        self._group_pool_names.pop(group_id, None)
+
+    def assign(self, group_id: str, pool_name: str) -> bool:
+        """切换群奖池（仅替换引用，并持久化到群组配置）"""
+        self._refresh()
+        sampler = self._pools.get(pool_name)
+        if sampler is None:
+            return False
+        if pool_name == DEFAULT_POOL:
+            self.forget(group_id)
+        else:
+            self._groups[group_id] = sampler
+            self._group_pool_names[group_id] = pool_name
+
+        with _GROUP_CONFIG_STORE.transaction() as group_configs:
+            group_cfg = group_configs.setdefault(group_id, {})
+            if pool_name == DEFAULT_POOL:
+                group_cfg.pop("lottery_pool", None)
+            else:
+                group_cfg["lottery_pool"] = pool_name
+        return True
+
+
+_POOL_REGISTRY = _LotteryPoolRegistry()
+
+
+def _stock_spec(entry: Dict[str, Any]) -> Optional[Tuple[str, int, str]]:
+    """解析奖品的限量配置，返回 (库存键, 上限, 周期)
+
+    stock 可写为整数（活动/全程总量）或 {"limit": 5, "period": "daily", "key": "..."}；
+    未指定 key 时按 item_code 全服共享库存。
+    """
+    spec = entry.get("stock")
+    if spec is None:
+        return None
+    if not isinstance(spec, dict):
+        spec = {"limit": spec}
+    key = entry.get("stock_key") or spec.get("key") or f"item:{entry.get('item_code') or entry.get('id')}"
+    period = spec.get("period", "total")
+    return key, int(spec.get("limit", 0)), period if period in STOCK_PERIODS else "total"
+
+
+class _StockLedger:
+    """限量奖品库存台账（SQLite）
+
+    扣减是一条带条件的 UPDATE（已发放 < 上限 才加一），由 SQLite 写锁保证原子性，
+    同一数据目录下的多个协程、线程与进程共享同一份库存，不会超发。
+    本地只缓存已发放数量用于剔除售罄奖品：缓存偏旧时最多多抽中一次，随即在扣减时失败并重新归一化。
+    """
+
+    def __init__(self, path: str = STOCK_DB_FILE):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS stock (key TEXT PRIMARY KEY, taken INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._lock = threading.Lock()
+        self._taken: Dict[str, int] = {}
+
+    @staticmethod
+    def _bucket(key: str, period: str) -> str:
+        if period == "daily":
+            return f"{key}@{_today().isoformat()}"
+        return key
+
+    def remaining(self, key: str, limit: int, period: str = "total") -> int:
+        """本地视角的剩余数量（可能略微偏多，以 take 的结果为准）"""
+        return limit - self._taken.get(self._bucket(key, period), 0)
+
+    def take(self, key: str, limit: int, period: str = "total") -> Optional[str]:
+        """原子扣减一件库存，返回扣减的库存桶（用于 release 归还）；库存不足时返回 None"""
+        bucket = self._bucket(key, period)
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._conn.execute("INSERT OR IGNORE INTO stock (key, taken) VALUES (?, 0)", (bucket,))
+                cursor = self._conn.execute(
+                    "UPDATE stock SET taken = taken + 1 WHERE key = ? AND taken < ?", (bucket, limit)
+                )
+                taken = self._conn.execute("SELECT taken FROM stock WHERE key = ?", (bucket,)).fetchone()[0]
+                self._conn.execute("COMMIT")
+            except Exception as e:
+                self._rollback()
+                logger.error(f"扣减奖品库存失败: {e}")
+                return None
+        self._taken[bucket] = taken
+        return bucket if cursor.rowcount == 1 else None
+
+    def release(self, bucket: str, count: int = 1) -> None:
+        """归还已扣减的库存（抽奖作废时调用），bucket 为 take 的返回值"""
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._conn.execute("UPDATE stock SET taken = MAX(0, taken - ?) WHERE key = ?", (count, bucket))
+                row = self._conn.execute("SELECT taken FROM stock WHERE key = ?", (bucket,)).fetchone()
+                self._conn.execute("COMMIT")
+            except Exception as e:
+                self._rollback()
+                logger.error(f"归还奖品库存失败: {e}")
+                return
+        self._taken[bucket] = row[0] if row else 0
+
+    def _rollback(self) -> None:
+        # BEGIN 本身失败（如数据库被锁）时没有打开的事务，此时再 ROLLBACK 会掩盖原始错误
+        if self._conn.in_transaction:
+            self._conn.execute("ROLLBACK")
+
+    def refresh(self, key: str, period: str = "total") -> int:
+        """从数据库读取最新已发放数量"""
+        bucket = self._bucket(key, period)
+        with self._lock:
+            row = self._conn.execute("SELECT taken FROM stock WHERE key = ?", (bucket,)).fetchone()
+        self._taken[bucket] = row[0] if row else 0
+        return self._taken[bucket]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def _parse_event_time(value: str) -> datetime.datetime:
+    """解析活动时间；带时区的时间换算为本地时间，与 datetime.now() 可直接比较"""
+    moment = datetime.datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    return moment
+
+
+def _load_lottery_events() -> List[Dict[str, Any]]:
+    """加载活动定义，并解析起止时间"""
+    try:
+        if not os.path.exists(LOTTERY_EVENTS_FILE):
+            return []
+        with open(LOTTERY_EVENTS_FILE, "r", encoding="utf-8") as f:
+            raw_events = json.load(f).get("events", [])
+    except Exception as e:
+        logger.error(f"加载活动定义失败: {e}")
+        return []
+
+    events = []
+    for raw in raw_events:
+        try:
+            event = dict(raw)
+            event["start_at"] = _parse_event_time(raw["start"])
+            event["end_at"] = _parse_event_time(raw["end"])
+            event["groups"] = {str(group_id) for group_id in raw.get("groups", [])}
+            events.append(event)
+        except (KeyError, TypeError, ValueError) as e:
+            logger.error(f"活动 {raw.get('id', '?')} 配置错误，已忽略: {e}")
+    return sorted(events, key=lambda event: event["start_at"])
+
+
+def _event_overlay(event: Dict[str, Any]) -> Dict[str, Any]:
+    """把活动定义转换为奖池覆盖：概率加成与限量库存直接写入奖品条目"""
+    overlay = {key: event[key] for key in ("items", "special_rewards", "remove", "pity") if key in event}
+    overlay["_boost"] = {str(item_id): float(factor) for item_id, factor in (event.get("boost") or {}).items()}
+    overlay["_stock"] = {str(item_id): spec for item_id, spec in (event.get("stock") or {}).items()}
+    overlay["_event_id"] = event["id"]
+    return overlay
+
+
+def _apply_event_overlay(pool: Dict[str, Any], overlay: Dict[str, Any]) -> Dict[str, Any]:
+    merged = _merge_pool(pool, overlay)
+    for key in ("items", "special_rewards"):
+        for entry in merged.get(key, []):
+            item_id = str(entry.get("id"))
+            if item_id in overlay["_boost"]:
+                entry["probability"] = float(entry.get("probability", 0)) * overlay["_boost"][item_id]
+            if item_id in overlay["_stock"]:
+                entry["stock"] = overlay["_stock"][item_id]
+                entry["stock_key"] = f"event:{overlay['_event_id']}:{item_id}"
+    return merged
+
+
+class _LotteryEventScheduler:
+    """限时活动调度器
+
+    在每个活动起止边界前 EVENT_PRECOMPILE_LEAD 秒，预先为所有奖池编译好活动版抽样器，
+    到达边界时以一次引用赋值整体切换，零点等高峰时刻不会出现集中重编译。
+    """
+
+    def __init__(self, registry: _LotteryPoolRegistry):
+        self._registry = registry
+        self._events: List[Dict[str, Any]] = []
+        self._mtime: Any = "unloaded"
+        self._ledger: Optional[_StockLedger] = None
+        # (生效中的活动, {(活动id, 奖池名): 抽样器}, 编译时的奖池版本)；版本为 -1 表示首次使用时再编译
+        self._state: Tuple[List[Dict[str, Any]], Dict[Tuple[str, str], _LotterySampler], int] = ([], {}, -1)
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ledger(self) -> _StockLedger:
+        if self._ledger is None:
+            self._ledger = _StockLedger()
+        return self._ledger
+
+    def _reload_events(self) -> bool:
+        try:
+            mtime = os.stat(LOTTERY_EVENTS_FILE).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        self._events = _load_lottery_events()
+        return True
+
+    def _active_at(self, moment: datetime.datetime) -> List[Dict[str, Any]]:
+        return [event for event in self._events if event["start_at"] <= moment < event["end_at"]]
+
+    def _next_boundary(self, moment: datetime.datetime) -> Optional[datetime.datetime]:
+        boundaries = [
+            boundary for event in self._events
+            for boundary in (event["start_at"], event["end_at"]) if boundary > moment
+        ]
+        return min(boundaries) if boundaries else None
+
+    def _prepare(self, moment: datetime.datetime):
+        """为指定时刻生效的活动编译全部奖池的活动版抽样器"""
+        active = self._active_at(moment)
+        samplers = {}
+        for event in active:
+            overlay = _event_overlay(event)
+            for pool_name in self._registry.pool_names():
+                samplers[(event["id"], pool_name)] = self._registry.compile_overlay(pool_name, overlay)
+        return active, samplers, self._registry.version
+
+    def _swap(self, prepared) -> None:
+        previous = {event["id"] for event in self._state[0]}
+        self._state = prepared
+        current = {event["id"] for event in prepared[0]}
+        if previous != current:
+            logger.info(f"抽奖活动切换：{sorted(current) or '无活动'}")
+
+    def start(self) -> None:
+        if self._task is None:
+            try:
+                self._task = asyncio.get_running_loop().create_task(self._run())
+            except RuntimeError:
+                pass
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._ledger is not None:
+            self._ledger.close()
+            self._ledger = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                now = datetime.datetime.now()
+                if self._reload_events():
+                    self._swap(self._prepare(now))
+                boundary = self._next_boundary(now)
+                if boundary is None:
+                    await asyncio.sleep(EVENT_POLL_INTERVAL)
+                    continue
+
+                lead = (boundary - now).total_seconds() - EVENT_PRECOMPILE_LEAD
+                if lead > 0:
+                    await asyncio.sleep(min(lead, EVENT_POLL_INTERVAL))
+                    continue
+
+                # 已进入预编译窗口：提前编译，边界时刻原子切换
+                prepared = self._prepare(boundary)
+                await asyncio.sleep(max(0.0, (boundary - datetime.datetime.now()).total_seconds()))
+                self._swap(prepared)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"抽奖活动调度失败: {e}")
+                await asyncio.sleep(EVENT_POLL_INTERVAL)
+
+    def _current(self):
+        active, samplers, version = self._state
+        if version != self._registry.version:
+            # 首次使用或奖池文件被修改，按当前时刻重新编译活动版抽样器
+            self._reload_events()
+            self._swap(self._prepare(datetime.datetime.now()))
+            active, samplers, version = self._state
+        return active, samplers
+
+    def active_events(self, group_id: str) -> List[Dict[str, Any]]:
+        active, _ = self._current()
+        return [event for event in active if not event["groups"] or group_id in event["groups"]]
+
+    def source_for(self, group_id: str) -> Tuple[_LotterySampler, str, List[str]]:
+        """返回 (群当前应使用的抽样器, 奖池名, 生效的活动ID)；活动优先，未剔除售罄奖品"""
+        pool_name = self._registry.pool_name_for(group_id)
+        active, samplers = self._current()
+        for event in active:
+            if not event["groups"] or group_id in event["groups"]:
+                sampler = samplers.get((event["id"], pool_name))
+                if sampler is not None:
+                    return sampler, pool_name, [event["id"]]
+        return self._registry.sampler_for(group_id), pool_name, []
+
+    def base_sampler_for(self, group_id: str) -> _LotterySampler:
+        """返回群当前应使用的抽样器（活动优先，未剔除售罄奖品）"""
+        return self.source_for(group_id)[0]
+
+    def sampler_for(self, group_id: str) -> _LotterySampler:
+        """返回群当前应使用的抽样器（活动优先，已剔除售罄奖品）"""
+        return self.base_sampler_for(group_id).available(self.ledger)
+
+    def extra_checkin_chances(self, group_id: str) -> Tuple[int, str]:
+        """活动额外打卡奖励：(额外机会数, 活动名)"""
+        events = self.active_events(group_id)
+        extra = sum(int(event.get("extra_checkin_chances", 0)) for event in events)
+        return extra, "、".join(event.get("name", event["id"]) for event in events)
+
+    def upcoming(self, group_id: str) -> List[Dict[str, Any]]:
+        now = datetime.datetime.now()
+        return [
+            event for event in self._events
+            if event["end_at"] > now and (not event["groups"] or group_id in event["groups"])
+        ]
+
+
+_EVENT_SCHEDULER = _LotteryEventScheduler(_POOL_REGISTRY)
+
+
+RNG_MASK = (1 << 64) - 1
+RNG_GAMMA = 0x9E3779B97F4A7C15
+RNG_FLOAT_SCALE = 1.0 / (1 << 53)
+RNG_VECTOR_MIN = 64  # 批量不少于该数量时使用 NumPy 向量化
+
+
+def _mix64(z: int) -> int:
+    """SplitMix64 的混合函数"""
+    z = (z ^ (z >> 30)) * 0xBF58476D1CE4E5B9 & RNG_MASK
+    z = (z ^ (z >> 27)) * 0x94D049BB133111EB & RNG_MASK
+    return z ^ (z >> 31)
+
+
+def _rng_block(seed: int, start: int, count: int) -> List[float]:
+    """生成流中第 [start, start + count) 个 [0, 1) 浮点数；NumPy 路径与纯 Python 路径逐位一致"""
+    np = _optional_import("numpy") if count >= RNG_VECTOR_MIN else None
+    if np is not None:
+        with np.errstate(over="ignore"):
+            z = np.uint64(seed) + np.arange(start + 1, start + count + 1, dtype=np.uint64) * np.uint64(RNG_GAMMA)
+            z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+            z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+            z = z ^ (z >> np.uint64(31))
+        return ((z >> np.uint64(11)).astype(np.float64) * RNG_FLOAT_SCALE).tolist()
+    return [
+        (_mix64((seed + (start + idx + 1) * RNG_GAMMA) & RNG_MASK) >> 11) * RNG_FLOAT_SCALE
+        for idx in range(count)
+    ]
+
+
+class _RngStream:
+    """计数器式随机数流（SplitMix64）
+
+    第 i 个数只由 (seed, i) 决定：可从任意偏移重放，可按标签拆分出互不相关的子流。
+    random() 从按 batch 预取的缓冲中取数，sample(n) 一次生成 n 个，可直接替代 random 模块传给抽样器。
+    """
+
+    __slots__ = ("seed", "offset", "batch", "_buffer", "_base")
+
+    def __init__(self, seed: int, offset: int = 0, batch: int = 8):
+        self.seed = seed & RNG_MASK
+        self.offset = offset
+        self.batch = max(1, batch)
+        self._buffer: List[float] = []
+        self._base = offset
+
+    def split(self, label: Any) -> "_RngStream":
+        """派生子流（同一父流 + 同一标签总是得到同一子流）"""
+        digest = hashlib.blake2b(str(label).encode("utf-8"), digest_size=8).digest()
+        return _RngStream(_mix64(self.seed ^ int.from_bytes(digest, "little")), batch=self.batch)
+
+    def sample(self, count: int) -> List[float]:
+        values = _rng_block(self.seed, self.offset, count)
+        self.offset += count
+        return values
+
+    def random(self) -> float:
+        idx = self.offset - self._base
+        if not 0 <= idx < len(self._buffer):
+            self._buffer = _rng_block(self.seed, self.offset, self.batch)
+            self._base = self.offset
+            idx = 0
+        self.offset += 1
+        return self._buffer[idx]
+
+    def randint(self, low: int, high: int) -> int:
+        return min(high, low + int(self.random() * (high - low + 1)))
+
+
+class _RngService:
+    """抽奖随机数服务
+
+    根种子（首次使用时生成并保存在数据目录）→ 作用域子流 → 用户子流 → 第 N 次抽奖子流。
+    抽奖流水记录用户子流种子与抽奖序号，据此可精确重放任意一次抽奖。
+    """
+
+    def __init__(self, path: str = RNG_SEED_FILE):
+        self._path = path
+        self._root: Optional[_RngStream] = None
+
+    def _load_root(self) -> _RngStream:
+        if self._root is None:
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            if not os.path.exists(self._path):
+                # 先写完整的临时文件再硬链接到目标路径：其他实例要么看不到种子文件，要么读到完整内容；
+                # 多个实例同时首次启动时只有第一个链接成功（不会像 os.replace 那样覆盖别人已读取的种子）
+                tmp_path = f"{self._path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                try:
+                    with open(tmp_path, "w", encoding="utf-8") as f:
+                        f.write(f"{secrets.randbits(64):016x}")
+                    os.link(tmp_path, self._path)
+                except FileExistsError:
+                    pass
+                finally:
+                    with contextlib.suppress(OSError):
+                        os.remove(tmp_path)
+            with open(self._path, "r", encoding="utf-8") as f:
+                self._root = _RngStream(int(f.read().strip(), 16))
+        return self._root
+
+    def user_seed(self, ctx_id: str, user_id: str) -> int:
+        return self._load_root().split(ctx_id).split(user_id).seed
+
+    @staticmethod
+    def draw_stream(user_seed: int, draw_index: int) -> _RngStream:
+        return _RngStream(user_seed).split(draw_index)
+
+
+_RNG = _RngService()
+
+
+def _default_lottery_state() -> Dict[str, Any]:
+    return {
+        "pending_multiplier": 1.0,  # 待生效的奖励倍率
+        "draws_since_rare": 0,  # 距上次抽中稀有层级的次数
+        "pity": {}  # 各层级距上次命中的次数
+    }
+
+
+def _draw_with_state(sampler: _LotterySampler, state: Dict[str, Any], rng=random,
+                     ledger: Optional["_StockLedger"] = None,
+                     attempts: Optional[List[List[Any]]] = None) -> Dict[str, Any]:
+    """按用户状态抽取一次并推进状态（不含发奖）
+
+    倍率奖励写入 pending_multiplier，作用于下一次积分/元宝/物品奖励。
+    抽中限量奖品时先扣减库存，扣减失败说明刚好售罄，剔除后在新分布上重抽；
+    扣减的库存桶记在结果的 stock_bucket 中，本次抽奖作废时据此归还。
+    每次尝试所剔除的售罄奖品记在 excluded 中；复现时传入 attempts（即当时的 excluded）按原样重抽。
+    重抽时其余奖品也已被其他实例抽完则返回空字典，调用方不应消耗抽奖机会。
+    """
+    base = sampler
+    exclusions: List[List[Any]] = []
+    stock_bucket = None
+    if attempts:
+        sampler = base.excluding(frozenset(attempts[0]))
+    elif ledger is not None:
+        sampler = base.available(ledger)
+    while True:
+        exclusions.append(sorted(sampler.excluded, key=str))
+        entry, tier = sampler.draw(sampler.weights_for(state), rng)
+        if attempts is not None:
+            if len(exclusions) >= len(attempts):
+                break
+            sampler = base.excluding(frozenset(attempts[len(exclusions)]))
+            continue
+        spec = sampler.stocked.get(entry.get("id")) if ledger is not None else None
+        stock_bucket = ledger.take(*spec) if spec is not None else None
+        if spec is None or stock_bucket is not None:
+            break
+        sampler = base.available(ledger)
+        if not sampler.has_items:
+            return {}
+    result = dict(entry)
+    result["rarity"] = tier
+    if stock_bucket is not None:
+        result["stock_bucket"] = stock_bucket
+    if len(exclusions) > 1 or exclusions[0]:
+        result["excluded"] = exclusions
+
+    counters = state.setdefault("pity", {})
+    for pity_tier in sampler.pity:
+        counters[pity_tier] = 0 if sampler.satisfies(tier, pity_tier) else counters.get(pity_tier, 0) + 1
+    state["draws_since_rare"] = 0 if tier not in COMMON_TIERS else state.get("draws_since_rare", 0) + 1
+
+    result_type = result.get("type")
+    if result_type == "multiplier":
+        state["pending_multiplier"] = max(
+            float(state.get("pending_multiplier", 1.0)), float(result.get("multiplier", 2.0))
+        )
+    elif result_type == "extra_chance":
+        result["extra_chances"] = result.get("extra_chances", 1)
+    else:
+        amount = rng.randint(result["min_amount"], result["max_amount"])
+        multiplier = float(state.get("pending_multiplier", 1.0))
+        if multiplier != 1.0:
+            amount = max(1, int(amount * multiplier))
+            result["applied_multiplier"] = multiplier
+            state["pending_multiplier"] = 1.0
+        result["actual_amount"] = amount
+    return result
+
+
+def _simulate_lottery(sampler: _LotterySampler, draws: int, rng=random) -> Dict[str, Any]:
+    """离线模拟单个用户连续抽奖，用于校验保底/倍率配置下的实际分布
+
+    传入大批量预取的 _RngStream 时随机数按块向量化生成，同一种子的模拟结果可复现。
+    各层级的最长间隔按「抽中该层或更稀有层级」统计，与保底的判定一致。
+    """
+    state = _default_lottery_state()
+    counts: Dict[str, int] = {}
+    tier_counts: Dict[str, int] = {}
+    longest_gap: Dict[str, int] = {}
+    last_hit: Dict[str, int] = {}
+    multiplied = 0
+    for idx in range(draws):
+        result = _draw_with_state(sampler, state, rng)
+        counts[result["name"]] = counts.get(result["name"], 0) + 1
+        tier = result["rarity"]
+        tier_counts[tier] = tier_counts.get(tier, 0) + 1
+        for gap_tier in sampler.tiers:
+            if sampler.satisfies(tier, gap_tier):
+                longest_gap[gap_tier] = max(longest_gap.get(gap_tier, 0), idx - last_hit.get(gap_tier, -1))
+                last_hit[gap_tier] = idx
+        if "applied_multiplier" in result:
+            multiplied += 1
+    return {"counts": counts, "tiers": tier_counts, "longest_gap": longest_gap, "multiplied": multiplied}
+
+
+def _replay_draw(record: Dict[str, Any]) -> Dict[str, Any]:
+    """按流水中的种子、抽奖序号、抽奖前状态与当时的奖池重放一次抽奖（不扣减库存）
+
+    奖池按流水记录的内容哈希从存档中还原（含当时生效的活动），并按当时剔除的售罄奖品重抽，
+    与当前的奖池、活动及库存无关。无法还原当时的奖池时抛出 ValueError。
+    """
+    digest = record.get("pool_digest")
+    if not digest:
+        raise ValueError("流水未记录奖池哈希（旧版本记录），无法确认当时的奖池")
+    pool = _load_archived_pool(digest)
+    if pool is None:
+        raise ValueError(f"奖池存档 {digest[:12]} 不存在（奖池 {record.get('pool')}，活动 {record.get('events') or '无'}）")
+    sampler = _LotterySampler(pool)
+    state = copy.deepcopy(record.get("state") or _default_lottery_state())
+    rng = _RNG.draw_stream(int(record["rng_seed"], 16), int(record["rng_offset"]))
+    return _draw_with_state(sampler, state, rng, attempts=record.get("excluded") or [[]])
+
+
+def _perform_lottery(group_id: str, user_id: str, state: Dict[str, Any], rng=random) -> Tuple[Dict[str, Any], str, int]:
+    """执行抽奖（积分/元宝由调用方汇总后通过 _apply_account_deltas 一次性发放）
+    返回: (抽奖结果, 消息, 额外抽奖机会)
+    """
+    sampler, pool_name, event_ids = _EVENT_SCHEDULER.source_for(group_id)
+    if not sampler.available(_EVENT_SCHEDULER.ledger).has_items:
+        return {}, "❌ 抽奖配置错误，请联系管理员", 0
+    
+    result = _draw_with_state(sampler, state, rng, ledger=_EVENT_SCHEDULER.ledger)
+    if not result:
+        return {}, "❌ 奖池中的奖品已全部抽完，请稍后再试（本次抽奖机会已退还）", 0
+    result["pool"], result["events"], result["pool_digest"] = pool_name, event_ids, sampler.digest
+    message_lines = []
+    extra_chances = 0
+    
+    # 处理结果
+    result_type = result.get("type")
+    amount = result.get("actual_amount", 0)
+    bonus = f"（×{result['applied_multiplier']:g} 倍率）" if "applied_multiplier" in result else ""
+    
+    if result_type == "points":
+        message_lines.append(f"🎉 恭喜！获得 {amount} 积分{bonus}")
+    
+    elif result_type == "ingots":
+        message_lines.append(f"🎉 恭喜！获得 {amount} 元宝{bonus}")
+    
+    elif result_type == "item":
+        message_lines.append(f"🎁 恭喜！获得 {result['name']} × {amount}{bonus}")
+        message_lines.append(f"💡 请私聊GM兑换物品")
+    
+    elif result_type == "multiplier":
+        message_lines.append(f"✨ 获得特殊奖励：{result['name']}（下次奖励×{state['pending_multiplier']:g}）")
+    
+    elif result_type == "extra_chance":
+        extra_chances = result["extra_chances"]
+        message_lines.append(f"🎊 获得特殊奖励：{result['name']}")
+    
+    # 记录抽奖历史
+    result["timestamp"] = datetime.datetime.now().isoformat()
+    result["user_id"] = user_id
+    
+    return result, "\n".join(message_lines), extra_chances
+
+
+class _CheckinDayIndex:
+    """当日打卡位图
+
+    每个作用域内的用户分配一个稠密下标，当日是否已打卡存为一个整数位图，
+    打卡路径只需一次位测试与置位。跨日时由日切任务整体清零。
+    """
+
+    def __init__(self):
+        self.day: Optional[datetime.date] = None
+        self._slots: Dict[str, Dict[str, int]] = {}
+        self._bits: Dict[str, int] = {}
+
+    def _slot(self, ctx_id: str, user_id: str) -> int:
+        slots = self._slots.setdefault(ctx_id, {})
+        slot = slots.get(user_id)
+        if slot is None:
+            slot = slots[user_id] = len(slots)
+        return slot
+
+    def reset(self, day: datetime.date, data: Dict[str, Any]) -> None:
+        """切换到新的一天，并按已有数据恢复当日已打卡的用户"""
+        self.day = day
+        self._bits = {}
+        day_str = day.isoformat()
+        for ctx_id, bucket in data.items():
+            for user_id, info in bucket.items():
+                if isinstance(info, dict) and info.get("last_checkin") == day_str:
+                    self.mark(ctx_id, user_id)
+
+    def test(self, ctx_id: str, user_id: str) -> bool:
+        return bool(self._bits.get(ctx_id, 0) >> self._slot(ctx_id, user_id) & 1)
+
+    def mark(self, ctx_id: str, user_id: str) -> None:
+        self._bits[ctx_id] = self._bits.get(ctx_id, 0) | (1 << self._slot(ctx_id, user_id))
+
+    def count(self, ctx_id: str) -> int:
+        return self._bits.get(ctx_id, 0).bit_count()
+
+
+def _rollover_streaks(data: Dict[str, Any], today: datetime.date) -> Tuple[int, Dict[str, Dict[str, int]]]:
+    """日切：批量清零断签用户的连续天数，并汇总前一日各作用域的打卡数据
+
+    返回: (被清零的用户数, {ctx_id: 前一日汇总})
+    """
+    yesterday = (today - datetime.timedelta(days=1)).isoformat()
+    today_str = today.isoformat()
+    reset_count = 0
+    summary: Dict[str, Dict[str, int]] = {}
+
+    for ctx_id, bucket in data.items():
+        checkins = 0
+        outstanding = 0
+        for info in bucket.values():
+            if not isinstance(info, dict):
+                continue
+            last_checkin = info.get("last_checkin", "")
+            if last_checkin == yesterday:
+                checkins += 1
+            elif last_checkin != today_str and info.get("consecutive_days", 0):
+                info["consecutive_days"] = 0
+                reset_count += 1
+            outstanding += info.get("lottery_chances", 0)
+        summary[ctx_id] = {
+            "checkins": checkins,
+            "users": len(bucket),
+            "outstanding_chances": outstanding
+        }
+
+    return reset_count, summary
+
+
+
+# 签到位图：第 i 位表示 BITMAP_EPOCH 之后第 i 天是否签到
+# 存储为 "起始偏移:十六进制"，起始偏移为首次签到日，避免为早于首次签到的日期占位
+BITMAP_EPOCH = datetime.date(2024, 1, 1)
+CALENDAR_MARKS = {
+    "emoji": ("🟩", "⬜", "▫️", "日 一 二 三 四 五 六"),
+    "plain": ("■", "□", "·", "日 一 二 三 四 五 六")
+}
+
+
+def _day_offset(day: datetime.date) -> int:
+    return (day - BITMAP_EPOCH).days
+
+
+def _get_checkin_bits(info: Dict[str, Any]) -> int:
+    """读取用户签到位图；旧数据按最后一次连续签到区间回填"""
+    raw = info.get("checkin_bits")
+    if raw is not None:
+        try:
+            if not raw:
+                return 0
+            base, _, value = raw.partition(":")
+            return int(value, 16) << int(base)
+        except (AttributeError, TypeError, ValueError):
+            return 0
+
+    bits = 0
+    try:
+        last_date = datetime.date.fromisoformat(info.get("last_checkin") or "")
+        streak = max(1, int(info.get("consecutive_days", 0) or 0))
+        end = _day_offset(last_date)
+        start = max(0, end - streak + 1)
+        if end >= 0:
+            bits = ((1 << (end - start + 1)) - 1) << start
+    except ValueError:
+        pass
+    _set_checkin_bits(info, bits)
+    return bits
+
+
+def _set_checkin_bits(info: Dict[str, Any], bits: int) -> None:
+    if not bits:
+        info["checkin_bits"] = ""
+        return
+    base = (bits & -bits).bit_length() - 1
+    info["checkin_bits"] = f"{base}:{bits >> base:x}"
+
+
+def _has_checkin(bits: int, day: datetime.date) -> bool:
+    offset = _day_offset(day)
+    return offset >= 0 and bool(bits >> offset & 1)
+
+
+def _streak_ending(bits: int, day: datetime.date) -> int:
+    """计算截止到指定日期（含）的连续签到天数"""
+    offset = _day_offset(day)
+    if offset < 0 or not bits >> offset & 1:
+        return 0
+    window = (1 << (offset + 1)) - 1
+    gaps = ~bits & window
+    if not gaps:
+        return offset + 1
+    return offset - (gaps.bit_length() - 1)
+
+
+def _range_bits(bits: int, start: datetime.date, days: int) -> int:
+    """截取 [start, start + days) 区间的位图，第 0 位对应 start"""
+    offset = _day_offset(start)
+    if offset < 0:
+        bits <<= -offset
+        offset = 0
+    return (bits >> offset) & ((1 << days) - 1)
+
+
+def _month_range(year: int, month: int) -> Tuple[datetime.date, int]:
+    first = datetime.date(year, month, 1)
+    next_month = datetime.date(year + (month == 12), month % 12 + 1, 1)
+    return first, (next_month - first).days
+
+
+def _render_calendar(bits: int, year: int, month: int, today: datetime.date, use_emoji: bool) -> str:
+    """生成月历网格（周日开头）"""
+    checked, missed, future, header = CALENDAR_MARKS["emoji" if use_emoji else "plain"]
+    first, days = _month_range(year, month)
+    month_bits = _range_bits(bits, first, days)
+    cells = ["  "] * ((first.weekday() + 1) % 7)
+    for idx in range(days):
+        day = first + datetime.timedelta(days=idx)
+        if month_bits >> idx & 1:
+            cells.append(checked)
+        elif day > today:
+            cells.append(future)
+        else:
+            cells.append(missed)
+    rows = [header]
+    for start in range(0, len(cells), 7):
+        rows.append(" ".join(cells[start:start + 7]))
+    return "\n".join(rows)
+
+
+def _daily_active_counts(bucket: Dict[str, Any], start: datetime.date, days: int) -> List[int]:
+    """统计作用域内 [start, start + days) 每天的签到人数
+
+    有 NumPy 时将所有用户的区间位图拼成矩阵后按列求和，否则逐位累加。
+    """
+    windows = [
+        _range_bits(_get_checkin_bits(info), start, days)
+        for info in bucket.values() if isinstance(info, dict)
+    ]
+    if not windows:
+        return [0] * days
+
+    np = _optional_import("numpy")
+    if np is not None:
+        width = (days + 7) // 8
+        matrix = np.frombuffer(
+            b"".join(window.to_bytes(width, "little") for window in windows), dtype=np.uint8
+        ).reshape(len(windows), width)
+        counts = np.unpackbits(matrix, axis=1, bitorder="little")[:, :days].sum(axis=0)
+        return [int(count) for count in counts]
+
+    return [sum(window >> idx & 1 for window in windows) for idx in range(days)]
+
+
+
+def _batched(items, size: int):
+    """将可迭代对象按 size 条切分，逐批产出（不整体读入内存）"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _grant_chances(ctx_id: str, amount: int) -> int:
+    """为作用域内所有用户增减抽奖机会（扣减不低于 0），返回影响人数
+
+    在单个事务内完成：整个数据文件只重写一次，中途出错时全部不生效，重新执行不会给部分用户重复发放。
+    """
+    affected = 0
+    with _DATA_STORE.transaction() as data:
+        for info in data.get(ctx_id, {}).values():
+            if isinstance(info, dict):
+                info["lottery_chances"] = max(0, info.get("lottery_chances", 0) + amount)
+                affected += 1
+    logger.info(f"批量调整抽奖机会：{ctx_id} 共 {affected} 人，每人 {amount:+d} 次")
+    return affected
+
+
+def _import_bindings(path: str, overwrite: bool = False, batch_size: int = BULK_BATCH_SIZE) -> Tuple[int, int]:
+    """从 CSV（用户ID,游戏账号）流式导入账号绑定，返回 (导入数, 跳过数)
+
+    默认跳过已绑定的用户与已被他人绑定的账号；overwrite 时以 CSV 为准覆盖用户原有绑定。
+    """
+    imported = skipped = 0
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        rows = (
+            (row[0].strip(), row[1].strip()) for row in csv.reader(f)
+            if len(row) >= 2 and row[0].strip() and row[1].strip() and not row[0].startswith("#")
+        )
+        for batch in _batched(rows, batch_size):
+            with _BIND_STORE.transaction() as bind_data:
+                owners = {account: user_id for user_id, account in bind_data.items()}
+                for user_id, account in batch:
+                    owner = owners.get(account)
+                    if owner == user_id:
+                        continue
+                    if owner is not None or (user_id in bind_data and not overwrite):
+                        skipped += 1
+                        continue
+                    owners.pop(bind_data.get(user_id), None)
+                    bind_data[user_id] = account
+                    owners[account] = user_id
+                    imported += 1
+    logger.info(f"导入账号绑定完成：{path} 导入 {imported} 条，跳过 {skipped} 条")
+    return imported, skipped
+
+
+STATS_EXPORT_FIELDS = [
+    "ctx_id", "user_id", "username", "total_days", "consecutive_days",
+    "lottery_chances", "last_checkin", "recent_draws"
+]
+
+
+def _iter_user_stats(ctx_id: Optional[str] = None):
+    """逐个产出用户统计行；ctx_id 为空时遍历所有作用域"""
+    data = _DATA_STORE.data
+    for current_ctx in ([ctx_id] if ctx_id else list(data)):
+        bucket = data.get(current_ctx)
+        if not isinstance(bucket, dict):
+            continue
+        # 复制键值列表，避免导出线程遍历时与处理器的写入冲突
+        for user_id, info in list(bucket.items()):
+            if not isinstance(info, dict):
+                continue
+            yield {
+                "ctx_id": current_ctx,
+                "user_id": user_id,
+                "username": info.get("username", user_id),
+                "total_days": info.get("total_days", 0),
+                "consecutive_days": info.get("consecutive_days", 0),
+                "lottery_chances": info.get("lottery_chances", 0),
+                "last_checkin": info.get("last_checkin", ""),
+                "recent_draws": len(info.get("lottery_history") or [])
+            }
+
+
+def _export_user_stats(path: str, ctx_id: Optional[str] = None) -> int:
+    """将用户统计逐行写入 CSV，返回行数"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    count = 0
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=STATS_EXPORT_FIELDS)
+        writer.writeheader()
+        for row in _iter_user_stats(ctx_id):
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def _ctx_scope(ctx_id: str) -> Optional[Tuple[str, str, str]]:
+    """解析上下文ID，返回 (存储范围, 平台, 群号/用户ID)；无法识别时返回 None"""
+    if ctx_id.endswith(":GLOBAL"):
+        return "global", ctx_id[:-len(":GLOBAL")], ""
+    parts = ctx_id.split(":", 2)
+    if len(parts) != 3 or parts[1] not in {"G", "U"}:
+        return None
+    return ("group" if parts[1] == "G" else "user"), parts[0], parts[2]
+
+
+def _scope_target(ctx_id: str, user_id: str, scope: str) -> Optional[str]:
+    """旧作用域中的用户在新存储范围下的上下文ID；无法离线推断（迁往按群存储）时返回 None"""
+    parsed = _ctx_scope(ctx_id)
+    if parsed is None:
+        return None
+    if scope == "user":
+        return f"{parsed[1]}:U:{user_id}"
+    if scope == "global":
+        return f"{parsed[1]}:GLOBAL"
+    if parsed[0] == "group":
+        return ctx_id
+    return None
+
+
+def _infer_storage_scope(data: Dict[str, Any]) -> Optional[str]:
+    """按现有数据的上下文ID推断数据所用的存储范围（首次记录迁移状态时使用）"""
+    counts: Dict[str, int] = {}
+    for ctx_id in data:
+        parsed = _ctx_scope(ctx_id)
+        if parsed is not None:
+            counts[parsed[0]] = counts.get(parsed[0], 0) + 1
+    return max(counts, key=counts.get) if counts else None
+
+
+def _merge_user_records(target: Dict[str, Any], source: Dict[str, Any], today: datetime.date) -> None:
+    """将旧作用域的用户记录合并进 target
+
+    抽奖机会相加，累计/连续天数取较大值（并与合并后的签到位图核对），签到位图取并集，
+    抽奖历史按时间合并，保底计数与待生效倍率取较大值，同月补签次数相加。
+    """
+    bits = _get_checkin_bits(target) | _get_checkin_bits(source)
+    _set_checkin_bits(target, bits)
+    target["last_checkin"] = max(target.get("last_checkin") or "", source.get("last_checkin") or "")
+    anchor = today if _has_checkin(bits, today) else today - datetime.timedelta(days=1)
+    target["consecutive_days"] = max(
+        int(target.get("consecutive_days", 0) or 0),
+        int(source.get("consecutive_days", 0) or 0),
+        _streak_ending(bits, anchor)
+    )
+    target["total_days"] = max(
+        int(target.get("total_days", 0) or 0), int(source.get("total_days", 0) or 0), bits.bit_count()
+    )
+    target["lottery_chances"] = int(target.get("lottery_chances", 0) or 0) + int(source.get("lottery_chances", 0) or 0)
+
+    history = (target.get("lottery_history") or []) + (source.get("lottery_history") or [])
+    history.sort(key=lambda record: record.get("timestamp") or "")
+    target["lottery_history"] = history[-50:]
+    target["pending_items"] = (target.get("pending_items") or []) + (source.get("pending_items") or [])
+    if "rng_offset" in source:
+        target["rng_offset"] = max(target.get("rng_offset", 0), source["rng_offset"])
+
+    states = [state for state in (target.get("lottery_state"), source.get("lottery_state")) if state]
+    if states:
+        merged = _default_lottery_state()
+        for state in states:
+            merged["pending_multiplier"] = max(merged["pending_multiplier"], float(state.get("pending_multiplier", 1.0)))
+            merged["draws_since_rare"] = max(merged["draws_since_rare"], int(state.get("draws_since_rare", 0)))
+            for tier, count in (state.get("pity") or {}).items():
+                merged["pity"][tier] = max(merged["pity"].get(tier, 0), count)
+        target["lottery_state"] = merged
+
+    makeups = [makeup for makeup in (target.get("makeup"), source.get("makeup")) if makeup]
+    if makeups:
+        month = max(makeup.get("month", "") for makeup in makeups)
+        target["makeup"] = {
+            "month": month,
+            "used": sum(makeup.get("used", 0) for makeup in makeups if makeup.get("month") == month)
+        }
+
+    for key, value in source.items():
+        target.setdefault(key, value)
+
+
+def _prepare_scope_migration(scope: str) -> List[str]:
+    """记录数据当前的存储范围；配置的范围与记录不一致时登记待迁移的旧范围，返回尚未迁移完的旧范围"""
+    with _SCOPE_STORE.transaction() as state:
+        recorded = state.get("scope") or _infer_storage_scope(_DATA_STORE.data) or scope
+        legacy = [old for old in state.get("legacy", []) if old in STORAGE_SCOPES and old != scope]
+        if recorded != scope:
+            if recorded not in legacy:
+                legacy.append(recorded)
+            state["started"] = datetime.datetime.now().isoformat(timespec="seconds")
+            logger.info(f"存储范围由 {recorded} 改为 {scope}，开始迁移数据")
+        state["scope"] = scope
+        state["legacy"] = legacy
+    return legacy
+
+
+def _migrate_scope_batch(scope: str, legacy: List[str], batch_size: int = BULK_BATCH_SIZE) -> Tuple[int, bool]:
+    """在一个事务内把最多 batch_size 个旧作用域用户合并到新存储范围，返回 (迁移人数, 是否还有可迁移的数据)"""
+    moved = 0
+    today = _today()
+    with _DATA_STORE.transaction() as data:
+        for ctx_id in list(data):
+            parsed = _ctx_scope(ctx_id)
+            bucket = data[ctx_id]
+            if parsed is None or parsed[0] not in legacy or parsed[0] == scope or not isinstance(bucket, dict):
+                continue
+            for user_id in list(bucket):
+                target_ctx = _scope_target(ctx_id, user_id, scope)
+                if target_ctx is None:
+                    break
+                if moved >= batch_size:
+                    return moved, True
+                info = bucket.pop(user_id)
+                if not isinstance(info, dict):
+                    continue
+                target_bucket = data.setdefault(target_ctx, {})
+                if user_id in target_bucket:
+                    _merge_user_records(target_bucket[user_id], info, today)
+                else:
+                    target_bucket[user_id] = info
+                moved += 1
+            if not bucket:
+                del data[ctx_id]
+    return moved, False
+
+
+def _finish_scope_migration(scope: str) -> List[str]:
+    """移除已没有剩余数据的旧范围，返回仍需在用户下次使用时迁移的旧范围"""
+    remaining = {
+        parsed[0] for parsed in map(_ctx_scope, list(_DATA_STORE.data))
+        if parsed is not None and parsed[0] != scope
+    }
+    with _SCOPE_STORE.transaction() as state:
+        legacy = [old for old in state.get("legacy", []) if old in remaining]
+        state["legacy"] = legacy
+    if legacy:
+        logger.info(f"存储范围迁移：{'、'.join(legacy)} 范围的剩余数据无法离线对应到 {scope}，将在用户下次使用时迁移")
+    else:
+        logger.info(f"存储范围迁移完成：数据已全部迁移到 {scope}")
+    return legacy
+
+
+def _append_records(records: List[Dict[str, Any]]) -> None:
+    """将打卡/抽奖流水追加到当天的 JSONL 文件（一次写入，多实例追加互不覆盖）"""
+    if not records:
+        return
+    path = os.path.join(RECORDS_DIR, f"{_today().isoformat()}.jsonl")
+    try:
+        os.makedirs(RECORDS_DIR, exist_ok=True)
+        payload = "".join(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n" for record in records)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(payload)
+    except Exception as e:
+        logger.error(f"写入运营流水失败: {e}")
+
+
+def _iter_record_chunks(day: datetime.date, chunk_size: int = REPORT_CHUNK_SIZE):
+    """逐块读取某天的流水，每块最多 chunk_size 条；损坏的行会被跳过"""
+    path = os.path.join(RECORDS_DIR, f"{day.isoformat()}.jsonl")
+    if not os.path.exists(path):
+        return
+    chunk = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                chunk.append(json.loads(line))
+            except ValueError:
+                continue
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def _aggregate_day(day: datetime.date) -> List[Dict[str, Any]]:
+    """按 (群, 类别, 奖励类型) 汇总某天的次数与发放总量
+
+    有 NumPy 时每块流水先编码为整数键，再用 bincount 一次求出次数与数量之和。
+    """
+    np = _optional_import("numpy")
+    keys: Dict[Tuple[str, str, str], int] = {}
+    counts: List[float] = []
+    amounts: List[float] = []
+    for chunk in _iter_record_chunks(day):
+        codes = []
+        values = []
+        for record in chunk:
+            key = (str(record.get("group", "")), str(record.get("kind", "")), str(record.get("type", "")))
+            codes.append(keys.setdefault(key, len(keys)))
+            values.append(float(record.get("amount", 0) or 0))
+        if len(counts) < len(keys):
+            counts.extend([0] * (len(keys) - len(counts)))
+            amounts.extend([0] * (len(keys) - len(amounts)))
+        if np is not None:
+            code_array = np.asarray(codes, dtype=np.int64)
+            chunk_counts = np.bincount(code_array, minlength=len(keys))
+            chunk_amounts = np.bincount(code_array, weights=np.asarray(values), minlength=len(keys))
+            for idx in np.flatnonzero(chunk_counts):
+                counts[idx] += int(chunk_counts[idx])
+                amounts[idx] += float(chunk_amounts[idx])
+        else:
+            for code, value in zip(codes, values):
+                counts[code] += 1
+                amounts[code] += value
+
+    return [
+        {
+            "date": day.isoformat(),
+            "group_id": group_id,
+            "kind": kind,
+            "item_type": item_type,
+            "count": int(counts[code]),
+            "amount": int(amounts[code]) if float(amounts[code]).is_integer() else amounts[code]
+        }
+        for (group_id, kind, item_type), code in sorted(keys.items())
+    ]
+
+
+def _build_report(start: datetime.date, end: datetime.date, out_base: str) -> Dict[str, Any]:
+    """生成 [start, end] 的每日运营报表
+
+    逐天读取流水并聚合，结果逐天写出：CSV 总是生成，安装 PyArrow 时额外生成 Parquet（每天一个行组）。
+    内存占用只与单块流水和当天的分组数有关，与历史数据总量无关。
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(out_base)), exist_ok=True)
+    pa = _optional_import("pyarrow")
+    pq = _optional_import("pyarrow.parquet") if pa is not None else None
+    files = [out_base + ".csv"]
+    parquet_writer = None
+    rows = 0
+    try:
+        with open(files[0], "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+            writer.writeheader()
+            day = start
+            while day <= end:
+                day_rows = _aggregate_day(day)
+                writer.writerows(day_rows)
+                rows += len(day_rows)
+                if pq is not None and day_rows:
+                    table = pa.Table.from_pydict({
+                        "date": [row["date"] for row in day_rows],
+                        "group_id": [row["group_id"] for row in day_rows],
+                        "kind": [row["kind"] for row in day_rows],
+                        "item_type": [row["item_type"] for row in day_rows],
+                        "count": pa.array([row["count"] for row in day_rows], type=pa.int64()),
+                        "amount": pa.array([float(row["amount"]) for row in day_rows], type=pa.float64())
+                    })
+                    if parquet_writer is None:
+                        files.append(out_base + ".parquet")
+                        parquet_writer = pq.ParquetWriter(files[1], table.schema)
+                    parquet_writer.write_table(table)
+                day += datetime.timedelta(days=1)
+    finally:
+        if parquet_writer is not None:
+            parquet_writer.close()
+    return {"rows": rows, "files": files}
+
+class _StartupTimer:
+    """记录插件启动各阶段耗时"""
+
+    def __init__(self):
+        self._started = self._last = time.perf_counter()
+        self._phases: List[Tuple[str, float]] = []
+
+    def mark(self, label: str) -> None:
+        now = time.perf_counter()
+        self._phases.append((label, (now - self._last) * 1000))
+        self._last = now
+
+    def summary(self) -> str:
+        phases = "、".join(f"{label} {ms:.1f}ms" for label, ms in self._phases)
+        return f"{(self._last - self._started) * 1000:.1f}ms（{phases}）"
+
+
+@register("astrbot_plugin_draw_checkin", "小卡拉米", "抽奖打卡插件", "2.0.0")
+class DrawCheckinPlugin(Star):
+    def __init__(self, context: Context, config=None):
+        timer = _StartupTimer()
+        super().__init__(context)
+        self._cfg_obj = config
+        self._cfg_cache: Dict[str, Any] = dict(config or {})
+        # 配置变更时 AstrBot 会重载插件，配置快照与模板在此一次性构建
+        self._settings = _ConfigSnapshot(self._curr_cfg())
+        timer.mark("配置")
+        self._templates = _MessageTemplates(self._curr_cfg())
+        timer.mark("消息模板")
+        self._card_renderer = _CardRenderer(self._curr_cfg())
+        timer.mark("图片卡片")
+        self._checkin_digest = _CheckinDigest(self._curr_cfg(), self._send_checkin_digest)
+        self._rate_limiter = _RateLimiter(self._curr_cfg())
+        self._dedupe = _DedupeWindow(self._curr_cfg())
+        self._profiler = _HandlerProfiler()
+        self._day_index = _CheckinDayIndex()
+        self._rollover_task: Optional[asyncio.Task] = None
+        # 存储范围迁移期间仍需兼顾读取的旧范围（预热时确定）
+        self._legacy_scopes: List[str] = []
+        self._scope_migration_task: Optional[asyncio.Task] = None
+        timer.mark("其他组件")
+        # 数据文件与日切放到后台执行，插件加载不等待大数据文件的解析
+        self._warm_up_task: Optional[asyncio.Task] = None
+        try:
+            self._warm_up_task = asyncio.get_running_loop().create_task(self._warm_up())
+        except RuntimeError:
+            # 尚无运行中的事件循环，数据在首次使用时加载
+            pass
+        _EVENT_SCHEDULER.start()
+        timer.mark("后台任务")
+        logger.info(f"抽奖打卡插件已加载，用时 {timer.summary()}")
+
+    async def _warm_up(self) -> None:
+        """后台预热：在线程中解析数据文件，再完成日切并重建打卡索引"""
+        timer = _StartupTimer()
+        try:
+            await asyncio.to_thread(lambda: (_DATA_STORE.data, _BIND_STORE.data, _STATS_STORE.data))
+            timer.mark("加载数据文件")
+            self._ensure_rollover()
+            timer.mark("日切与打卡索引")
+            self._legacy_scopes = await asyncio.to_thread(_prepare_scope_migration, self._settings.storage_scope)
+            if self._legacy_scopes:
+                self._scope_migration_task = asyncio.get_running_loop().create_task(self._scope_migration_loop())
+            timer.mark("存储范围检查")
+            logger.info(f"抽奖打卡插件数据预热完成，用时 {timer.summary()}")
+        except Exception as e:
+            logger.error(f"抽奖打卡插件数据预热失败: {e}")
+
+    @property
+    def data(self) -> Dict[str, Any]:
+        """打卡数据（其他实例写入后自动重新加载）"""
+        return _DATA_STORE.data
+
+    @property
+    def bind_data(self) -> Dict[str, Any]:
+        """账号绑定数据（其他实例写入后自动重新加载）"""
+        return _BIND_STORE.data
+
+    def _curr_cfg(self) -> Dict[str, Any]:
+        try:
+            if self._cfg_obj is not None:
+                return self._cfg_obj
+        except Exception:
+            pass
+        return self._cfg_cache
+
+    def _ensure_rollover(self) -> None:
+        """确保已完成今日日切（启动补偿、定时任务与打卡路径共用）"""
+        today = _today()
+        if self._day_index.day == today:
+            return
+
+        if _STATS_STORE.data.get("last_rollover") != today.isoformat():
+            # 多实例时只有第一个拿到锁的实例执行日切，其余实例在锁内看到已完成后跳过
+            with _STATS_STORE.transaction() as stats:
+                if stats.get("last_rollover") != today.isoformat():
+                    with _DATA_STORE.transaction() as data:
+                        reset_count, summary = _rollover_streaks(data, today)
+                    days = stats.setdefault("days", {})
+                    days[(today - datetime.timedelta(days=1)).isoformat()] = summary
+                    for stale_day in sorted(days)[:-STATS_KEEP_DAYS]:
+                        del days[stale_day]
+                    stats["last_rollover"] = today.isoformat()
+                    logger.info(f"打卡日切完成：{today.isoformat()}，重置断签 {reset_count} 人")
+
+        self._day_index.reset(today, self.data)
+
+        if self._rollover_task is None:
+            try:
+                self._rollover_task = asyncio.get_running_loop().create_task(self._rollover_loop())
+            except RuntimeError:
+                # 尚无运行中的事件循环，等下一次打卡时再启动定时任务
+                pass
+
+    async def _scope_migration_loop(self) -> None:
+        """存储范围变更后分批迁移旧数据；每批一个短事务，批间让出事件循环，迁移期间正常处理消息"""
+        scope = self._settings.storage_scope
+        total = 0
+        try:
+            while True:
+                moved, more = _migrate_scope_batch(scope, self._legacy_scopes)
+                total += moved
+                if not more:
+                    break
+                await asyncio.sleep(SCOPE_MIGRATION_INTERVAL)
+            logger.info(f"存储范围后台迁移结束，共迁移 {total} 条用户记录")
+            self._legacy_scopes = _finish_scope_migration(scope)
+        except Exception as e:
+            logger.error(f"存储范围迁移失败: {e}")
+
+    async def _rollover_loop(self) -> None:
+        """每日零点执行日切"""
+        while True:
+            now = datetime.datetime.now()
+            next_day = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time.min)
+            await asyncio.sleep((next_day - now).total_seconds() + 1)
+            try:
+                self._ensure_rollover()
+            except Exception as e:
+                logger.error(f"打卡日切失败: {e}")
+
+    def _get_group_id(self, event: AstrMessageEvent) -> str:
+        """获取群组ID"""
+        return event.get_group_id() or "default"
+
+    def _is_group_admin(self, event: AstrMessageEvent) -> bool:
+        """检查用户是否为群管理员或群主"""
+        user_id = event.get_sender_id()
+        
+        try:
+            if event.is_admin():
+                return True
+        except Exception:
             pass
         
         try:
@@ -590,23 +3524,67 @@ class DrawCheckinPlugin(Star):
         return False
 
     def _get_user_bucket(self, event: AstrMessageEvent) -> Tuple[Dict[str, Any], Dict[str, Any]]:
-        ctx_id = _get_ctx_id(event, self._curr_cfg())
+        ctx_id = _get_ctx_id(event, self._settings)
         user_id = event.get_sender_id()
         username = event.get_sender_name()
         bucket = self.data.setdefault(ctx_id, {})
         info = bucket.setdefault(user_id, _default_user(user_id, username))
+        if self._legacy_scopes:
+            # 迁移期间双读：该用户在旧存储范围下还有数据时先合并过来
+            for scope in self._legacy_scopes:
+                legacy_ctx = _ctx_id_for_scope(event, scope)
+                legacy_bucket = self.data.get(legacy_ctx)
+                if legacy_ctx != ctx_id and legacy_bucket and user_id in legacy_bucket:
+                    _merge_user_records(info, legacy_bucket.pop(user_id), _today())
+                    if not legacy_bucket:
+                        del self.data[legacy_ctx]
         info["username"] = username
         return bucket, info
 
+    @staticmethod
+    def _void_lottery_stock(results: List[Tuple[Dict[str, Any], str]]) -> None:
+        """归还作废抽奖已扣减的限量库存"""
+        for result, _ in results:
+            if result.get("stock_bucket"):
+                try:
+                    _EVENT_SCHEDULER.ledger.release(result["stock_bucket"])
+                except Exception as e:
+                    logger.error(f"归还限量库存失败: {result['stock_bucket']}: {e}")
+
+    def _refund_lottery_chances(self, event: AstrMessageEvent, amount: int) -> None:
+        """结算未能完成时退还预扣的抽奖机会"""
+        if amount <= 0:
+            return
+        try:
+            with _DATA_STORE.transaction():
+                _, info = self._get_user_bucket(event)
+                info["lottery_chances"] = info.get("lottery_chances", 0) + amount
+        except Exception as e:
+            logger.error(f"退还抽奖机会失败: {event.get_sender_id()} {amount}次: {e}")
+
+    def _build_digest_chain(self, entries: List[Dict[str, Any]]) -> List[Any]:
+        """将多条打卡结果合并为一条消息链（逐个@用户）"""
+        chain: List[Any] = [Comp.Plain(self._templates.render("checkin_digest_header", count=len(entries)) + "\n")]
+        for entry in entries:
+            chain.append(Comp.At(qq=entry["user_id"]))
+            chain.append(Comp.Plain(self._templates.render("checkin_digest_entry", **entry) + "\n"))
+        chain.append(Comp.Plain(self._templates.render("checkin_digest_footer")))
+        return chain
+
+    async def _send_checkin_digest(self, session: str, entries: List[Dict[str, Any]]) -> None:
+        await self.context.send_message(session, MessageChain(chain=self._build_digest_chain(entries)))
+
     @filter.command("打卡", alias={"打卡"})
+    @_idempotent
+    @_rate_limited("打卡")
+    @_profiled("打卡")
     async def checkin(self, event: AstrMessageEvent):
         try:
             user_id = event.get_sender_id()
             group_id = self._get_group_id(event)
             
             # 检查时间
-            cfg = self._curr_cfg()
-            is_allowed, time_error_msg = _is_checkin_time_allowed(cfg)
+            is_allowed, time_error_msg = self._settings.checkin_time_allowed()
             if not is_allowed:
                 yield event.plain_result(f"❌ 打卡失败：{time_error_msg}")
                 return
@@ -621,68 +3599,96 @@ class DrawCheckinPlugin(Star):
                 )
                 return
 
-            bucket, info = self._get_user_bucket(event)
+            self._ensure_rollover()
+            ctx_id = _get_ctx_id(event, self._settings)
             today = _today()
 
-            if info.get("last_checkin") == today.isoformat():
+            if self._day_index.test(ctx_id, user_id):
                 yield event.plain_result("今日已打卡，请勿重复~")
                 return
 
             # 检查游戏账号
-            account_info = _get_game_account_info(group_id, cfg, game_account)
+            account_info = _get_game_account_info(group_id, self._settings, game_account)
             if not account_info:
                 yield event.plain_result("❌ 打卡失败：游戏账号不存在，请检查账号是否正确或联系管理员")
                 return
 
-            # 更新连续打卡天数
-            _update_consecutive_days(info, today)
+            base_chances = self._settings.base_lottery_chances
+            event_bonus, event_name = _EVENT_SCHEDULER.extra_checkin_chances(group_id)
 
-            # 发放抽奖机会
-            base_chances = int(cfg.get("base_lottery_chances", 1))
-            consecutive_bonus = min(info.get("consecutive_days", 0) // 7, 3)  # 每7天多1次，最多3次
-            total_chances = base_chances + consecutive_bonus
+            with _DATA_STORE.transaction():
+                _, info = self._get_user_bucket(event)
+                # 同一数据目录下的其他实例可能已为该用户打卡
+                already_checked_in = info.get("last_checkin") == today.isoformat()
+                if not already_checked_in:
+                    # 更新连续打卡天数（断签用户已在日切时清零）
+                    info["consecutive_days"] = info.get("consecutive_days", 0) + 1
+
+                    # 发放抽奖机会
+                    consecutive_bonus = min(info.get("consecutive_days", 0) // 7, 3)  # 每7天多1次，最多3次
+                    total_chances = base_chances + consecutive_bonus + event_bonus
+                    
+                    info["lottery_chances"] = info.get("lottery_chances", 0) + total_chances
+                    info["total_days"] = info.get("total_days", 0) + 1
+                    info["last_checkin"] = today.isoformat()
+                    _set_checkin_bits(info, _get_checkin_bits(info) | (1 << _day_offset(today)))
+                info = dict(info)
+            self._day_index.mark(ctx_id, user_id)
+
+            if already_checked_in:
+                yield event.plain_result("今日已打卡，请勿重复~")
+                return
             
-            info["lottery_chances"] = info.get("lottery_chances", 0) + total_chances
-            info["total_days"] = info.get("total_days", 0) + 1
-            info["last_checkin"] = today.isoformat()
+            _append_records([{
+                "ts": int(time.time()),
+                "kind": "checkin",
+                "group": group_id,
+                "ctx": ctx_id,
+                "user": user_id,
+                "type": "lottery_chance",
+                "amount": total_chances
+            }])
 
-            _save_data(self.data)
+            # 聚合模式：群内打卡回复合并发送
+            if self._checkin_digest.enabled and event.get_group_id():
+                entries = self._checkin_digest.add(event.unified_msg_origin, {
+                    "user_id": user_id,
+                    "consecutive_days": info.get("consecutive_days", 0),
+                    "gained": total_chances,
+                    "chances": info["lottery_chances"]
+                })
+                if entries:
+                    yield event.chain_result(self._build_digest_chain(entries))
+                return
 
-            # 生成消息
-            use_emoji = cfg.get("use_emoji", True)
-            separator = cfg.get("message_separator", "--------")
-            
-            if use_emoji:
-                lines = [
-                    "✅ 打卡成功",
-                    separator,
-                    f"📅 累计打卡：{info['total_days']}天",
-                    f"🔥 连续打卡：{info.get('consecutive_days', 0)}天",
-                    f"🎯 获得抽奖机会：{total_chances}次",
-                    f"💰 剩余抽奖机会：{info['lottery_chances']}次"
-                ]
-            else:
-                lines = [
-                    "✅ 打卡成功",
-                    separator,
-                    f"累计打卡：{info['total_days']}天",
-                    f"连续打卡：{info.get('consecutive_days', 0)}天",
-                    f"获得抽奖机会：{total_chances}次",
-                    f"剩余抽奖机会：{info['lottery_chances']}次"
-                ]
-                
-            if consecutive_bonus > 0:
-                lines.append(f"🎊 连续打卡奖励：额外{consecutive_bonus}次抽奖机会")
+            body = self._templates.render(
+                "checkin",
+                total_days=info["total_days"],
+                consecutive_days=info.get("consecutive_days", 0),
+                gained=total_chances,
+                chances=info["lottery_chances"],
+                bonus=consecutive_bonus or None,
+                event_bonus=event_bonus or None,
+                event_name=event_name or None
+            )
+            at = Comp.At(qq=user_id)
             
-            signature = _get_random_signature(cfg)
-            lines.append(separator)
-            if use_emoji:
-                lines.append(f"💫 {signature}")
-            else:
-                lines.append(f"* {signature}")
+            if self._card_renderer.enabled:
+                rows = [
+                    ("checkin", f"累计打卡：{info['total_days']}天"),
+                    ("checkin", f"连续打卡：{info.get('consecutive_days', 0)}天"),
+                    ("extra_chance", f"获得抽奖机会：{total_chances}次"),
+                    ("info", f"剩余抽奖机会：{info['lottery_chances']}次"),
+                ]
+                if consecutive_bonus > 0:
+                    rows.append(("extra_chance", f"连续打卡奖励：额外{consecutive_bonus}次抽奖机会"))
+                if event_bonus > 0:
+                    rows.append(("extra_chance", f"{event_name}：额外{event_bonus}次抽奖机会"))
+                card_path = await self._card_renderer.render("打卡成功", rows)
+                if card_path:
+                    yield event.chain_result([at, Comp.Image.fromFileSystem(card_path)])
+                    return
             
-            body = "\n".join(lines)
-            at = Comp.At(qq=user_id)
             yield event.chain_result([at, Comp.Plain("\n" + body)])
             
         except Exception as e:
@@ -690,6 +3696,9 @@ class DrawCheckinPlugin(Star):
             yield event.plain_result("❌ 打卡出现异常，请稍后再试")
 
     @filter.command("抽奖")
+    @_idempotent
+    @_rate_limited("抽奖")
+    @_profiled("抽奖")
     async def lottery(self, event: AstrMessageEvent, 次数: str = "1"):
         """抽奖命令"""
         try:
@@ -715,97 +3724,162 @@ class DrawCheckinPlugin(Star):
                 )
                 return
             
-            bucket, info = self._get_user_bucket(event)
-            available_chances = info.get("lottery_chances", 0)
+            # 先预扣抽奖机会并占用抽奖序号，避免多个实例并发抽奖时超额消耗或复用随机数
+            with _DATA_STORE.transaction():
+                _, info = self._get_user_bucket(event)
+                available_chances = info.get("lottery_chances", 0)
+                draw_base = info.get("rng_offset", 0)
+                if available_chances >= times:
+                    info["lottery_chances"] = available_chances - times
+                    info["rng_offset"] = draw_base + times
+                state = copy.deepcopy(info.get("lottery_state") or _default_lottery_state())
             
             if available_chances < times:
                 yield event.plain_result(f"❌ 抽奖失败：抽奖机会不足\n剩余抽奖机会：{available_chances}次")
                 return
             
-            cfg = self._curr_cfg()
-            use_emoji = cfg.get("use_emoji", True)
-            separator = cfg.get("message_separator", "--------")
-            
-            # 执行抽奖
+            # 执行抽奖（在状态副本上推进，结束后再写回）
             results = []
             extra_chances_total = 0
-            multiplier = 1.0
+            failure_message = None
+            user_seed = None
+            paid_out = False
+            settled = False
             
-            for i in range(times):
-                result, message, extra_chances = _perform_lottery(group_id, cfg, user_id, game_account)
-                if not result:
-                    yield event.plain_result(message)
-                    return
-                
-                # 处理特殊效果
-                if result.get("type") == "multiplier":
-                    multiplier = result.get("multiplier", 2.0)
-                    # 特殊奖励不计入消耗
-                    continue
-                elif result.get("type") == "extra_chance":
-                    extra_chances_total += result.get("extra_chances", 1)
-                    # 特殊奖励不计入消耗
-                    continue
+            try:
+                # 每次抽奖使用「用户子流 + 抽奖序号」派生的独立随机数流，可按流水精确重放
+                # 中途出现异常时保留已完成的抽奖照常结算，未完成的次数在结算时退还
+                try:
+                    user_seed = _RNG.user_seed(_get_ctx_id(event, self._settings), user_id)
+                    for i in range(times):
+                        state_before = copy.deepcopy(state)
+                        rng = _RNG.draw_stream(user_seed, draw_base + i)
+                        result, message, extra_chances = _perform_lottery(group_id, user_id, state, rng)
+                        if not result:
+                            failure_message = message
+                            break
+                        result["rng_offset"] = draw_base + i
+                        result["state_before"] = state_before
+                        extra_chances_total += extra_chances
+                        results.append((result, message))
+                except Exception as e:
+                    logger.error(f"抽奖中断（已完成 {len(results)}/{times} 次）: {e}")
+                    failure_message = f"❌ 抽奖出现异常，未完成的 {times - len(results)} 次抽奖机会已退还"
                 
-                results.append((result, message))
-            
-            # 扣除抽奖机会（只扣除实际抽奖次数，不包括特殊奖励）
-            info["lottery_chances"] = available_chances - len(results)
-            
-            # 添加额外机会
-            if extra_chances_total > 0:
-                info["lottery_chances"] += extra_chances_total
+                # 本轮的积分/元宝合并为一次发放；发放失败则整轮作废，退还机会与已扣减的限量库存
+                points_total = sum(r.get("actual_amount", 0) for r, _ in results if r.get("type") == "points")
+                ingots_total = sum(r.get("actual_amount", 0) for r, _ in results if r.get("type") == "ingots")
+                balances = None
+                if points_total or ingots_total:
+                    balances = _apply_account_deltas(group_id, self._settings, game_account, points_total, ingots_total)
+                    if balances is None:
+                        logger.error(f"抽奖奖励发放失败，本轮作废：{game_account} 积分 {points_total} 元宝 {ingots_total}")
+                        self._void_lottery_stock(results)
+                        results = []
+                        extra_chances_total = 0
+                        failure_message = "❌ 发放奖励失败，请联系管理员（本次抽奖机会已退还）"
+                paid_out = True
+                
+                # 结算：退还未使用及特殊奖励的机会，发放额外机会并记录历史
+                paid_results = [(r, m) for r, m in results if r.get("type") not in SPECIAL_REWARD_TYPES]
+                with _DATA_STORE.transaction():
+                    _, info = self._get_user_bucket(event)
+                    info["lottery_chances"] = info.get("lottery_chances", 0) + times - len(paid_results) + extra_chances_total
+                    if results:
+                        info["lottery_state"] = state
+                    
+                    lottery_history = info.get("lottery_history", [])
+                    for result, _ in paid_results:
+                        lottery_history.append({
+                            "item": result.get("name"),
+                            "type": result.get("type"),
+                            "amount": result.get("actual_amount", 1),
+                            "timestamp": result.get("timestamp")
+                        })
+                    info["lottery_history"] = lottery_history[-50:]  # 只保留最近50条
+                    info = dict(info)
+                settled = True
+            finally:
+                if not settled:
+                    # 发放或结算本身出错：奖励未发放则整轮作废，否则只退还未发放的次数
+                    if not paid_out:
+                        self._void_lottery_stock(results)
+                        results = []
+                    self._refund_lottery_chances(
+                        event, times - sum(1 for r, _ in results if r.get("type") not in SPECIAL_REWARD_TYPES)
+                    )
             
-            # 记录抽奖历史
-            lottery_history = info.get("lottery_history", [])
-            for result, _ in results:
-                lottery_history.append({
+            _append_records([
+                {
+                    "ts": int(time.time()),
+                    "kind": "draw",
+                    "group": group_id,
+                    "user": user_id,
+                    "account": game_account,
                     "item": result.get("name"),
                     "type": result.get("type"),
-                    "amount": result.get("actual_amount", 1),
-                    "timestamp": result.get("timestamp")
-                })
-            info["lottery_history"] = lottery_history[-50:]  # 只保留最近50条
+                    "amount": result.get("extra_chances", 0) if result.get("type") == "extra_chance" else result.get("actual_amount", 0),
+                    "rng_seed": f"{user_seed:016x}",
+                    "rng_offset": result["rng_offset"],
+                    "state": result["state_before"],
+                    "pool": result.get("pool"),
+                    "events": result.get("events", []),
+                    "pool_digest": result.get("pool_digest"),
+                    "excluded": result.get("excluded", [[]])
+                }
+                for result, _ in results
+            ])
             
-            # 保存数据
-            _save_data(self.data)
+            if failure_message is not None and not results:
+                yield event.plain_result(failure_message)
+                return
             
             # 生成消息
-            if use_emoji:
-                lines = ["🎰 抽奖结果", separator]
+            if len(results) > 1:
+                result_lines = [f"第{idx}次：{message}" for idx, (_, message) in enumerate(results, 1)]
             else:
-                lines = ["抽奖结果", separator]
-            
-            for idx, (result, message) in enumerate(results, 1):
-                if len(results) > 1:
-                    lines.append(f"第{idx}次：{message}")
-                else:
-                    lines.append(message)
-            
-            if extra_chances_total > 0:
-                lines.append(f"🎊 获得额外抽奖机会：{extra_chances_total}次")
-            
-            lines.append(separator)
-            lines.append(f"剩余抽奖机会：{info['lottery_chances']}次")
+                result_lines = [message for _, message in results]
+            if failure_message is not None:
+                result_lines.append(failure_message)
             
             # 如果有物品需要兑换
-            item_results = [r for r, _ in results if r.get("type") == "item"]
-            if item_results:
-                lines.append(separator)
-                lines.append("📝 需要兑换的物品：")
-                for result in item_results:
-                    lines.append(f"- {result.get('name')} × {result.get('actual_amount', 1)}")
-                lines.append("💡 请私聊GM兑换物品")
-            
-            signature = _get_random_signature(cfg)
-            lines.append(separator)
-            if use_emoji:
-                lines.append(f"💫 {signature}")
-            else:
-                lines.append(f"* {signature}")
+            redeem_items = [
+                f"{result.get('name')} × {result.get('actual_amount', 1)}"
+                for result, _ in results if result.get("type") == "item"
+            ]
+            item_lines = [f"- {item}" for item in redeem_items]
             
-            body = "\n".join(lines)
+            body = self._templates.render(
+                "lottery",
+                results="\n".join(result_lines) if result_lines else None,
+                extra_chances=extra_chances_total or None,
+                chances=info["lottery_chances"],
+                items="\n".join(item_lines) if item_lines else None,
+                points=balances.get("points") if balances else None,
+                ingots=balances.get("ingots") if balances else None,
+                event_name="、".join(
+                    event.get("name", event["id"]) for event in _EVENT_SCHEDULER.active_events(group_id)
+                ) or None
+            )
             at = Comp.At(qq=user_id)
+            
+            if self._card_renderer.enabled:
+                rows = [(result.get("type", "info"), message) for result, message in results]
+                if failure_message is not None:
+                    rows.append(("info", failure_message))
+                if extra_chances_total > 0:
+                    rows.append(("extra_chance", f"获得额外抽奖机会：{extra_chances_total}次"))
+                rows.append(("info", f"剩余抽奖机会：{info['lottery_chances']}次"))
+                if balances and balances.get("points") is not None:
+                    rows.append(("info", f"账户余额：积分 {balances['points']}，元宝 {balances['ingots']}"))
+                if redeem_items:
+                    rows.append(("item", f"需要兑换的物品：{'、'.join(redeem_items)}"))
+                    rows.append(("info", "请私聊GM兑换物品"))
+                card_path = await self._card_renderer.render("抽奖结果", rows)
+                if card_path:
+                    yield event.chain_result([at, Comp.Image.fromFileSystem(card_path)])
+                    return
+            
             yield event.chain_result([at, Comp.Plain("\n" + body)])
             
         except Exception as e:
@@ -813,6 +3887,9 @@ class DrawCheckinPlugin(Star):
             yield event.plain_result("❌ 抽奖出现异常，请稍后再试")
 
     @filter.command("绑定游戏账号")
+    @_idempotent
+    @_rate_limited("绑定游戏账号")
+    @_profiled("绑定游戏账号")
     async def bind_game_account(self, event: AstrMessageEvent, 账号: str = ""):
         """绑定游戏账号"""
         try:
@@ -822,7 +3899,6 @@ class DrawCheckinPlugin(Star):
                 
             user_id = event.get_sender_id()
             group_id = self._get_group_id(event)
-            cfg = self._curr_cfg()
             
             # 检查是否已绑定
             if user_id in self.bind_data:
@@ -834,38 +3910,32 @@ class DrawCheckinPlugin(Star):
                 return
             
             # 检查游戏账号是否存在
-            game_account_info = _get_game_account_info(group_id, cfg, 账号)
+            game_account_info = _get_game_account_info(group_id, self._settings, 账号, verify=True)
             if not game_account_info:
                 yield event.plain_result(f"❌ 绑定失败：游戏账号 '{账号}' 不存在，请检查账号名称")
                 return
             
-            # 检查是否已被绑定
-            for uid, bound_account in self.bind_data.items():
-                if bound_account == 账号 and uid != user_id:
-                    yield event.plain_result(f"❌ 绑定失败：游戏账号 '{账号}' 已被其他用户绑定")
-                    return
+            # 在文件锁内再次检查并绑定，防止多实例同时绑定同一账号
+            with _BIND_STORE.transaction() as bind_data:
+                conflict = None
+                if user_id in bind_data:
+                    conflict = f"❌ 您已绑定游戏账号：{bind_data[user_id]}"
+                elif any(bound_account == 账号 for bound_account in bind_data.values()):
+                    conflict = f"❌ 绑定失败：游戏账号 '{账号}' 已被其他用户绑定"
+                else:
+                    bind_data[user_id] = 账号
             
-            # 绑定账号
-            self.bind_data[user_id] = 账号
-            _save_bind_data(self.bind_data)
-            
-            use_emoji = cfg.get("use_emoji", True)
-            if use_emoji:
-                content_lines = [
-                    f"👤 QQ用户：{user_id}",
-                    f"🎮 游戏账号：{账号}",
-                    f"💎 当前积分：{game_account_info['points']}",
-                    f"🪙 当前元宝：{game_account_info['ingots']}",
-                ]
-            else:
-                content_lines = [
-                    f"QQ用户：{user_id}",
-                    f"游戏账号：{账号}",
-                    f"当前积分：{game_account_info['points']}",
-                    f"当前元宝：{game_account_info['ingots']}",
-                ]
+            if conflict:
+                yield event.plain_result(conflict)
+                return
             
-            message = _format_message(cfg, "绑定成功", content_lines)
+            message = self._templates.render(
+                "bind_success",
+                user_id=user_id,
+                account=账号,
+                points=game_account_info["points"],
+                ingots=game_account_info["ingots"]
+            )
             yield event.plain_result(message)
                 
         except Exception as e:
@@ -873,15 +3943,18 @@ class DrawCheckinPlugin(Star):
             yield event.plain_result("❌ 绑定失败，请稍后再试")
 
     @filter.command("解绑游戏账号")
+    @_idempotent
+    @_rate_limited("解绑游戏账号")
+    @_profiled("解绑游戏账号")
     async def unbind_game_account(self, event: AstrMessageEvent):
         """解绑游戏账号"""
         try:
             user_id = event.get_sender_id()
             
-            if user_id in self.bind_data:
-                account = self.bind_data[user_id]
-                del self.bind_data[user_id]
-                _save_bind_data(self.bind_data)
+            with _BIND_STORE.transaction() as bind_data:
+                account = bind_data.pop(user_id, None)
+            
+            if account is not None:
                 yield event.plain_result(f"✅ 解绑成功！已解除游戏账号 '{account}' 的绑定")
             else:
                 yield event.plain_result("❌ 解绑失败：您尚未绑定任何游戏账号")
@@ -891,49 +3964,27 @@ class DrawCheckinPlugin(Star):
             yield event.plain_result("❌ 解绑失败，请稍后再试")
 
     @filter.command("我的绑定")
+    @_rate_limited("我的绑定")
+    @_profiled("我的绑定")
     async def my_binding(self, event: AstrMessageEvent):
         """查看我的绑定信息"""
         try:
             user_id = event.get_sender_id()
             group_id = self._get_group_id(event)
-            cfg = self._curr_cfg()
-            use_emoji = cfg.get("use_emoji", True)
             
             if user_id in self.bind_data:
                 account = self.bind_data[user_id]
-                game_account_info = _get_game_account_info(group_id, cfg, account)
-                
-                if use_emoji:
-                    content_lines = [
-                        f"👤 QQ用户：{user_id}",
-                        f"🎮 游戏账号：{account}",
-                    ]
-                else:
-                    content_lines = [
-                        f"QQ用户：{user_id}",
-                        f"游戏账号：{账号}",
-                    ]
+                game_account_info = _get_game_account_info(group_id, self._settings, account)
                 
-                if game_account_info:
-                    if use_emoji:
-                        content_lines.extend([
-                            f"💎 当前积分：{game_account_info['points']}",
-                            f"🪙 当前元宝：{game_account_info['ingots']}",
-                            f"✅ 绑定状态：正常"
-                        ])
-                    else:
-                        content_lines.extend([
-                            f"当前积分：{game_account_info['points']}",
-                            f"当前元宝：{game_account_info['ingots']}",
-                            f"绑定状态：正常"
-                        ])
-                else:
-                    if use_emoji:
-                        content_lines.append(f"❌ 绑定状态：游戏账号不存在")
-                    else:
-                        content_lines.append(f"绑定状态：游戏账号不存在")
-                    
-                message = _format_message(cfg, "我的绑定信息", content_lines)
+                message = self._templates.render(
+                    "my_binding",
+                    user_id=user_id,
+                    account=account,
+                    points=game_account_info["points"] if game_account_info else None,
+                    ingots=game_account_info["ingots"] if game_account_info else None,
+                    status_ok="正常" if game_account_info else None,
+                    status_error=None if game_account_info else "游戏账号不存在"
+                )
                 yield event.plain_result(message)
             else:
                 yield event.plain_result("❌ 您尚未绑定任何游戏账号\n💡 请使用：/绑定游戏账号 [账号]")
@@ -943,39 +3994,26 @@ class DrawCheckinPlugin(Star):
             yield event.plain_result("❌ 查询失败，请稍后再试")
 
     @filter.command("抽奖机会")
+    @_rate_limited("抽奖机会")
+    @_profiled("抽奖机会")
     async def lottery_chances(self, event: AstrMessageEvent):
         """查看抽奖机会"""
         try:
             _, info = self._get_user_bucket(event)
             user_id = event.get_sender_id()
-            cfg = self._curr_cfg()
-            use_emoji = cfg.get("use_emoji", True)
-            
-            chances = info.get("lottery_chances", 0)
-            total_days = info.get("total_days", 0)
             consecutive_days = info.get("consecutive_days", 0)
             
-            if use_emoji:
-                lines = [
-                    f"👤 用户：{info.get('username', user_id)}",
-                    f"🎯 剩余抽奖机会：{chances}次",
-                    f"📅 累计打卡：{total_days}天",
-                    f"🔥 连续打卡：{consecutive_days}天",
-                ]
-            else:
-                lines = [
-                    f"用户：{info.get('username', user_id)}",
-                    f"剩余抽奖机会：{chances}次",
-                    f"累计打卡：{total_days}天",
-                    f"连续打卡：{consecutive_days}天",
-                ]
-            
             # 显示连续打卡奖励信息
-            if consecutive_days >= 7:
-                bonus = min(consecutive_days // 7, 3)
-                lines.append(f"🎊 连续打卡奖励：额外{bonus}次抽奖机会")
+            bonus = min(consecutive_days // 7, 3) if consecutive_days >= 7 else None
             
-            message = _format_message(cfg, "抽奖机会信息", lines)
+            message = self._templates.render(
+                "lottery_chances",
+                username=info.get("username", user_id),
+                chances=info.get("lottery_chances", 0),
+                total_days=info.get("total_days", 0),
+                consecutive_days=consecutive_days,
+                bonus=bonus
+            )
             yield event.plain_result(message)
             
         except Exception as e:
@@ -983,26 +4021,21 @@ class DrawCheckinPlugin(Star):
             yield event.plain_result("❌ 查询失败，请稍后再试")
 
     @filter.command("抽奖历史")
+    @_rate_limited("抽奖历史")
+    @_profiled("抽奖历史")
     async def lottery_history(self, event: AstrMessageEvent):
         """查看抽奖历史"""
         try:
             _, info = self._get_user_bucket(event)
             user_id = event.get_sender_id()
-            cfg = self._curr_cfg()
-            use_emoji = cfg.get("use_emoji", True)
-            
             history = info.get("lottery_history", [])
             
             if not history:
                 yield event.plain_result("📭 暂无抽奖历史")
                 return
             
-            if use_emoji:
-                lines = [f"📜 {info.get('username', user_id)}的抽奖历史", "--------"]
-            else:
-                lines = [f"{info.get('username', user_id)}的抽奖历史", "--------"]
-            
             # 显示最近10条记录
+            lines = []
             for record in history[-10:]:
                 item_name = record.get("item", "未知")
                 amount = record.get("amount", 1)
@@ -1016,60 +4049,224 @@ class DrawCheckinPlugin(Star):
                 
                 lines.append(f"{time_str} - {item_name} × {amount}")
             
-            lines.append("--------")
-            lines.append(f"共计 {len(history)} 条记录")
-            
-            yield event.plain_result("\n".join(lines))
+            message = self._templates.render(
+                "lottery_history",
+                username=info.get("username", user_id),
+                records="\n".join(lines),
+                total=len(history)
+            )
+            yield event.plain_result(message)
             
         except Exception as e:
             logger.error(f"查询抽奖历史失败: {e}")
             yield event.plain_result("❌ 查询失败，请稍后再试")
 
+    def _makeup_left(self, info: Dict[str, Any], today: datetime.date) -> int:
+        """本月剩余补签次数"""
+        limit = self._settings.makeup_monthly_limit
+        makeup = info.get("makeup") or {}
+        used = makeup.get("used", 0) if makeup.get("month") == today.strftime("%Y-%m") else 0
+        return max(0, limit - used)
+
+    @filter.command("签到日历")
+    @_rate_limited("签到日历")
+    @_profiled("签到日历")
+    async def checkin_calendar(self, event: AstrMessageEvent, 月份: str = ""):
+        """查看本人的月度签到日历"""
+        try:
+            _, info = self._get_user_bucket(event)
+            user_id = event.get_sender_id()
+            today = _today()
+            
+            try:
+                if not 月份:
+                    year, month = today.year, today.month
+                elif "-" in 月份:
+                    year, month = map(int, 月份.split("-"))
+                else:
+                    year, month = today.year, int(月份)
+                first, days = _month_range(year, month)
+            except ValueError:
+                yield event.plain_result("❌ 月份格式错误，例如：/签到日历 2024-05")
+                return
+            
+            bits = _get_checkin_bits(info)
+            message = self._templates.render(
+                "checkin_calendar",
+                username=info.get("username", user_id),
+                month=f"{year}年{month}月",
+                grid=_render_calendar(bits, year, month, today, self._templates.use_emoji),
+                count=_range_bits(bits, first, days).bit_count(),
+                days=days,
+                consecutive_days=info.get("consecutive_days", 0),
+                makeup_left=self._makeup_left(info, today)
+            )
+            yield event.plain_result(message)
+            
+        except Exception as e:
+            logger.error(f"查询签到日历失败: {e}")
+            yield event.plain_result("❌ 查询失败，请稍后再试")
+
+    @filter.command("补签")
+    @_idempotent
+    @_rate_limited("补签")
+    @_profiled("补签")
+    async def makeup_checkin(self, event: AstrMessageEvent, 日期: str = ""):
+        """补签本月漏签的日期（默认补最近一次漏签）"""
+        try:
+            user_id = event.get_sender_id()
+            if not _get_user_game_account(self.bind_data, user_id):
+                yield event.plain_result("❌ 补签失败：您尚未绑定游戏账号！")
+                return
+            
+            self._ensure_rollover()
+            today = _today()
+            
+            day = None
+            if 日期:
+                try:
+                    if 日期.count("-") == 2:
+                        day = datetime.date.fromisoformat(日期)
+                    else:
+                        month, day_of_month = map(int, 日期.split("-"))
+                        day = datetime.date(today.year, month, day_of_month)
+                except ValueError:
+                    yield event.plain_result("❌ 日期格式错误，例如：/补签 05-12")
+                    return
+            
+            cost = self._settings.makeup_cost
+            error = None
+            with _DATA_STORE.transaction():
+                _, info = self._get_user_bucket(event)
+                bits = _get_checkin_bits(info)
+                
+                if day is None:
+                    day = today - datetime.timedelta(days=1)
+                    while day.month == today.month and _has_checkin(bits, day):
+                        day -= datetime.timedelta(days=1)
+                
+                makeup_left = self._makeup_left(info, today)
+                if day >= today or day.month != today.month or day.year != today.year or day < BITMAP_EPOCH:
+                    error = "❌ 补签失败：只能补签本月今天之前的日期"
+                elif _has_checkin(bits, day):
+                    error = f"❌ 补签失败：{day.isoformat()} 已签到"
+                elif makeup_left <= 0:
+                    error = "❌ 补签失败：本月补签次数已用完"
+                elif info.get("lottery_chances", 0) < cost:
+                    error = f"❌ 补签失败：补签需消耗{cost}次抽奖机会，当前机会不足"
+                else:
+                    bits |= 1 << _day_offset(day)
+                    _set_checkin_bits(info, bits)
+                    info["lottery_chances"] = info.get("lottery_chances", 0) - cost
+                    info["total_days"] = info.get("total_days", 0) + 1
+                    if day.isoformat() > info.get("last_checkin", ""):
+                        info["last_checkin"] = day.isoformat()
+                    anchor = today if _has_checkin(bits, today) else today - datetime.timedelta(days=1)
+                    info["consecutive_days"] = _streak_ending(bits, anchor)
+                    
+                    makeup = info.get("makeup") or {}
+                    month_key = today.strftime("%Y-%m")
+                    info["makeup"] = {
+                        "month": month_key,
+                        "used": (makeup.get("used", 0) if makeup.get("month") == month_key else 0) + 1
+                    }
+                info = dict(info)
+            
+            if error:
+                yield event.plain_result(error)
+                return
+            
+            message = self._templates.render(
+                "makeup_checkin",
+                date=day.isoformat(),
+                total_days=info["total_days"],
+                consecutive_days=info["consecutive_days"],
+                cost=cost or None,
+                makeup_left=makeup_left - 1
+            )
+            yield event.plain_result(message)
+            
+        except Exception as e:
+            logger.error(f"补签失败: {e}")
+            yield event.plain_result("❌ 补签出现异常，请稍后再试")
+
+    @filter.command("签到统计")
+    @_rate_limited("签到统计")
+    @_profiled("签到统计")
+    async def checkin_stats(self, event: AstrMessageEvent, 参数: str = "7"):
+        """查看本群近N天签到人数，或指定日期的签到名单"""
+        try:
+            bucket = self.data.get(_get_ctx_id(event, self._settings), {})
+            today = _today()
+            
+            if "-" in 参数:
+                try:
+                    day = datetime.date.fromisoformat(参数)
+                except ValueError:
+                    yield event.plain_result("❌ 日期格式错误，例如：/签到统计 2024-05-12")
+                    return
+                names = [
+                    info.get("username") or uid
+                    for uid, info in bucket.items()
+                    if isinstance(info, dict) and _has_checkin(_get_checkin_bits(info), day)
+                ]
+                message = self._templates.render(
+                    "checkin_day_users",
+                    date=day.isoformat(),
+                    count=len(names),
+                    names="、".join(names) if names else "（无）"
+                )
+                yield event.plain_result(message)
+                return
+            
+            try:
+                days = int(参数)
+                if days <= 0 or days > 31:
+                    raise ValueError
+            except ValueError:
+                yield event.plain_result("❌ 天数必须在1-31之间，例如：/签到统计 7")
+                return
+            
+            start = today - datetime.timedelta(days=days - 1)
+            counts = _daily_active_counts(bucket, start, days)
+            rows = [
+                f"{(start + datetime.timedelta(days=idx)).strftime('%m-%d')}：{count}人"
+                for idx, count in enumerate(counts)
+            ]
+            message = self._templates.render(
+                "checkin_stats",
+                n=days,
+                rows="\n".join(rows),
+                average=f"{sum(counts) / days:.1f}"
+            )
+            yield event.plain_result(message)
+            
+        except Exception as e:
+            logger.error(f"查询签到统计失败: {e}")
+            yield event.plain_result("❌ 查询失败，请稍后再试")
+
     @filter.command("打卡查询", alias={"查询打卡", "我的打卡"})
+    @_rate_limited("打卡查询")
+    @_profiled("打卡查询")
     async def query_assets(self, event: AstrMessageEvent):
         try:
             _, info = self._get_user_bucket(event)
             user_id = event.get_sender_id()
             group_id = self._get_group_id(event)
-            cfg = self._curr_cfg()
-            use_emoji = cfg.get("use_emoji", True)
             
             game_account = _get_user_game_account(self.bind_data, user_id)
-            account_info = _get_game_account_info(group_id, cfg, game_account) if game_account else None
-            
-            if use_emoji:
-                content_lines = [
-                    f"👤 用户：{info.get('username', user_id)}",
-                    f"📅 累计打卡：{info.get('total_days', 0)}天",
-                    f"🔥 连续打卡：{info.get('consecutive_days', 0)}天",
-                    f"🎯 剩余抽奖机会：{info.get('lottery_chances', 0)}次",
-                ]
-            else:
-                content_lines = [
-                    f"用户：{info.get('username', user_id)}",
-                    f"累计打卡：{info.get('total_days', 0)}天",
-                    f"连续打卡：{info.get('consecutive_days', 0)}天",
-                    f"剩余抽奖机会：{info.get('lottery_chances', 0)}次",
-                ]
+            account_info = _get_game_account_info(group_id, self._settings, game_account) if game_account else None
             
-            if account_info:
-                if use_emoji:
-                    content_lines.extend([
-                        f"💎 账号积分：{account_info['points']}",
-                        f"🪙 账号元宝：{account_info['ingots']}",
-                    ])
-                else:
-                    content_lines.extend([
-                        f"账号积分：{account_info['points']}",
-                        f"账号元宝：{account_info['ingots']}",
-                    ])
-            else:
-                if use_emoji:
-                    content_lines.append(f"🎮 游戏账号：未绑定")
-                else:
-                    content_lines.append(f"游戏账号：未绑定")
-        
-            message = _format_message(cfg, "打卡信息", content_lines)
+            message = self._templates.render(
+                "query_assets",
+                username=info.get("username", user_id),
+                total_days=info.get("total_days", 0),
+                consecutive_days=info.get("consecutive_days", 0),
+                chances=info.get("lottery_chances", 0),
+                points=account_info["points"] if account_info else None,
+                ingots=account_info["ingots"] if account_info else None,
+                unbound=None if account_info else "未绑定"
+            )
             yield event.plain_result(message)
         except Exception as e:
             logger.error(f"查询资产失败: {e}")
@@ -1086,37 +4283,79 @@ class DrawCheckinPlugin(Star):
             group_id = self._get_group_id(event)
             group_configs = _load_group_config()
             
-            cfg = self._curr_cfg()
-            use_emoji = cfg.get("use_emoji", True)
-            
-            if use_emoji:
-                lines = [f"⚙️ 群组配置（群ID：{group_id}）", "--------"]
-            else:
-                lines = [f"群组配置（群ID：{group_id}）", "--------"]
-            
-            if group_id in group_configs:
-                group_cfg = group_configs[group_id]
-                if "db_config" in group_cfg:
-                    db_cfg = group_cfg["db_config"]
-                    lines.append("数据库配置（自定义）：")
-                    lines.append(f"- 服务器：{db_cfg.get('db_server', '默认')}")
-                    lines.append(f"- 数据库：{db_cfg.get('db_database', '默认')}")
-                else:
-                    lines.append("数据库配置：使用全局配置")
-            else:
-                lines.append("数据库配置：使用全局配置")
-            
-            lines.append("--------")
-            lines.append("💡 使用命令修改配置：")
-            lines.append("/设置群组数据库 [服务器] [数据库] [用户名] [密码]")
-            
-            yield event.plain_result("\n".join(lines))
+            db_cfg = group_configs.get(group_id, {}).get("db_config")
+            message = self._templates.render(
+                "group_config",
+                group_id=group_id,
+                db_server=db_cfg.get("db_server", "默认") if db_cfg else None,
+                db_database=db_cfg.get("db_database", "默认") if db_cfg else None,
+                db_replica=(
+                    f"{db_cfg['db_replica_server']},{db_cfg.get('db_replica_port', db_cfg.get('db_port', '1433'))}"
+                    if db_cfg and db_cfg.get("db_replica_server") else None
+                ),
+                db_default=None if db_cfg else "使用全局配置",
+                pool=_POOL_REGISTRY.pool_name_for(group_id)
+            )
+            yield event.plain_result(message)
                 
         except Exception as e:
             logger.error(f"查询群组配置失败: {e}")
             yield event.plain_result("❌ 查询失败，请稍后再试")
 
+    @filter.command("抽奖模拟")
+    async def lottery_simulation(self, event: AstrMessageEvent, 次数: str = "10000", 种子: str = ""):
+        """模拟单个用户连续抽奖，校验当前奖池在保底/倍率规则下的实际分布（管理员专用）"""
+        try:
+            if not self._is_group_admin(event):
+                yield event.plain_result("❌ 仅群管理员可执行此操作")
+                return
+            
+            try:
+                draws = int(次数)
+                if draws <= 0 or draws > 1000000:
+                    raise ValueError
+            except ValueError:
+                yield event.plain_result("❌ 模拟次数必须在1-1000000之间")
+                return
+            
+            try:
+                seed = int(种子, 16) if 种子 else secrets.randbits(64)
+            except ValueError:
+                yield event.plain_result("❌ 种子必须是十六进制数，例如：/抽奖模拟 100000 1f2e3d")
+                return
+            
+            sampler = _EVENT_SCHEDULER.sampler_for(self._get_group_id(event))
+            if not sampler.has_items:
+                yield event.plain_result("❌ 抽奖配置错误，请检查奖池配置")
+                return
+            
+            loop = asyncio.get_running_loop()
+            rng = _RngStream(seed, batch=4096)
+            report = await loop.run_in_executor(None, _simulate_lottery, sampler, draws, rng)
+            rows = [
+                f"{name}：{count}次（{count / draws:.2%}）"
+                for name, count in sorted(report["counts"].items(), key=lambda kv: -kv[1])
+            ]
+            tiers = [
+                f"[{tier}] {count}次（{count / draws:.2%}），最长间隔{report['longest_gap'][tier]}抽"
+                for tier, count in report["tiers"].items()
+            ]
+            message = self._templates.render(
+                "lottery_simulation",
+                draws=draws,
+                rows="\n".join(rows),
+                tiers="\n".join(tiers),
+                multiplied=report["multiplied"],
+                seed=f"{seed:016x}"
+            )
+            yield event.plain_result(message)
+            
+        except Exception as e:
+            logger.error(f"抽奖模拟失败: {e}")
+            yield event.plain_result("❌ 模拟失败，请稍后再试")
+
     @filter.command("设置群组数据库")
+    @_idempotent
     async def set_group_database(self, event: AstrMessageEvent, 服务器: str = "", 数据库: str = "", 用户名: str = "", 密码: str = ""):
         """设置群组独立的数据库配置（管理员专用）"""
         try:
@@ -1133,29 +4372,299 @@ class DrawCheckinPlugin(Star):
                 return
             
             group_id = self._get_group_id(event)
-            group_configs = _load_group_config()
+            with _GROUP_CONFIG_STORE.transaction() as group_configs:
+                group_configs.setdefault(group_id, {})["db_config"] = {
+                    "db_server": 服务器,
+                    "db_database": 数据库,
+                    "db_username": 用户名,
+                    "db_password": 密码,
+                    "db_port": "1433",
+                    "db_driver": "FreeTDS"
+                }
+            
+            yield event.plain_result(f"✅ 群组数据库配置已更新\n服务器：{服务器}\n数据库：{数据库}")
+                
+        except Exception as e:
+            logger.error(f"设置群组数据库失败: {e}")
+            yield event.plain_result("❌ 设置失败，请稍后再试")
+
+    @filter.command("设置群组只读库")
+    @_idempotent
+    async def set_group_replica(self, event: AstrMessageEvent, 服务器: str = "", 端口: str = ""):
+        """为本群数据库设置只读副本，余额查询走只读库（管理员专用）"""
+        try:
+            if not self._is_group_admin(event):
+                yield event.plain_result("❌ 仅群管理员可执行此操作")
+                return
+            
+            if not 服务器:
+                yield event.plain_result(
+                    "❌ 格式：/设置群组只读库 [服务器] [端口]\n"
+                    "关闭只读库：/设置群组只读库 关闭"
+                )
+                return
+            
+            group_id = self._get_group_id(event)
+            with _GROUP_CONFIG_STORE.transaction() as group_configs:
+                db_cfg = group_configs.get(group_id, {}).get("db_config")
+                if db_cfg is not None:
+                    if 服务器 == "关闭":
+                        db_cfg.pop("db_replica_server", None)
+                        db_cfg.pop("db_replica_port", None)
+                    else:
+                        db_cfg["db_replica_server"] = 服务器
+                        db_cfg["db_replica_port"] = 端口 or db_cfg.get("db_port", "1433")
+            
+            if db_cfg is None:
+                yield event.plain_result("❌ 请先使用「/设置群组数据库」配置本群主库")
+            elif 服务器 == "关闭":
+                yield event.plain_result("✅ 已关闭只读库，所有查询将使用主库")
+            else:
+                yield event.plain_result(f"✅ 只读库已设置：{服务器},{db_cfg['db_replica_port']}\n写入仍使用主库")
+                
+        except Exception as e:
+            logger.error(f"设置群组只读库失败: {e}")
+            yield event.plain_result("❌ 设置失败，请稍后再试")
+
+    @filter.command("奖池列表")
+    @_rate_limited("奖池列表")
+    @_profiled("奖池列表")
+    async def lottery_pools(self, event: AstrMessageEvent):
+        """查看可用奖池及本群当前奖池"""
+        try:
+            current = _POOL_REGISTRY.pool_name_for(self._get_group_id(event))
+            lines = [f"{'👉 ' if name == current else '- '}{name}" for name in _POOL_REGISTRY.pool_names()]
+            yield event.plain_result("🎰 可用奖池：\n" + "\n".join(lines))
+        except Exception as e:
+            logger.error(f"查询奖池列表失败: {e}")
+            yield event.plain_result("❌ 查询失败，请稍后再试")
+
+    @filter.command("活动列表")
+    @_rate_limited("活动列表")
+    @_profiled("活动列表")
+    async def lottery_events(self, event: AstrMessageEvent):
+        """查看进行中与即将开始的抽奖活动"""
+        try:
+            events = _EVENT_SCHEDULER.upcoming(self._get_group_id(event))
+            if not events:
+                yield event.plain_result("📭 暂无进行中或即将开始的活动")
+                return
             
-            if group_id not in group_configs:
-                group_configs[group_id] = {}
+            now = datetime.datetime.now()
+            lines = []
+            for lottery_event in events:
+                status = "进行中" if lottery_event["start_at"] <= now else "未开始"
+                lines.append(
+                    f"[{status}] {lottery_event.get('name', lottery_event['id'])}："
+                    f"{lottery_event['start_at']:%m-%d %H:%M} ~ {lottery_event['end_at']:%m-%d %H:%M}"
+                )
+                extra = int(lottery_event.get("extra_checkin_chances", 0))
+                if extra:
+                    lines.append(f"  打卡额外获得{extra}次抽奖机会")
+            yield event.plain_result("🎉 抽奖活动：\n" + "\n".join(lines))
+        except Exception as e:
+            logger.error(f"查询活动列表失败: {e}")
+            yield event.plain_result("❌ 查询失败，请稍后再试")
+
+    @filter.command("奖品库存")
+    @_rate_limited("奖品库存")
+    @_profiled("奖品库存")
+    async def prize_stock(self, event: AstrMessageEvent):
+        """查看本群当前奖池中限量奖品的剩余库存"""
+        try:
+            sampler = _EVENT_SCHEDULER.base_sampler_for(self._get_group_id(event))
+            if not sampler.stocked:
+                yield event.plain_result("📭 当前奖池没有限量奖品")
+                return
             
-            group_configs[group_id]["db_config"] = {
-                "db_server": 服务器,
-                "db_database": 数据库,
-                "db_username": 用户名,
-                "db_password": 密码,
-                "db_port": "1433",
-                "db_driver": "FreeTDS"
+            names = {
+                entry.get("id"): entry.get("name", "未知")
+                for key in ("items", "special_rewards") for entry in sampler.config.get(key, [])
             }
+            ledger = _EVENT_SCHEDULER.ledger
+            lines = []
+            for item_id, (key, limit, period) in sampler.stocked.items():
+                remaining = max(0, limit - ledger.refresh(key, period))
+                period_text = "今日" if period == "daily" else "总计"
+                lines.append(f"- {names.get(item_id, item_id)}：{period_text}剩余 {remaining}/{limit}")
+            yield event.plain_result("📦 限量奖品库存：\n" + "\n".join(lines))
+        except Exception as e:
+            logger.error(f"查询奖品库存失败: {e}")
+            yield event.plain_result("❌ 查询失败，请稍后再试")
+
+    @filter.command("设置群奖池")
+    @_idempotent
+    async def set_group_pool(self, event: AstrMessageEvent, 奖池: str = ""):
+        """切换本群使用的奖池（管理员专用）"""
+        try:
+            if not self._is_group_admin(event):
+                yield event.plain_result("❌ 仅群管理员可执行此操作")
+                return
             
-            _save_group_config(group_configs)
+            if not 奖池:
+                yield event.plain_result("❌ 请提供奖池名称，格式：/设置群奖池 [奖池名]\n💡 使用「/奖池列表」查看可用奖池")
+                return
             
-            yield event.plain_result(f"✅ 群组数据库配置已更新\n服务器：{服务器}\n数据库：{数据库}")
+            if not _POOL_REGISTRY.assign(self._get_group_id(event), 奖池):
+                yield event.plain_result(f"❌ 奖池 '{奖池}' 不存在\n💡 使用「/奖池列表」查看可用奖池")
+                return
+            
+            yield event.plain_result(f"✅ 本群奖池已切换为：{奖池}")
                 
         except Exception as e:
-            logger.error(f"设置群组数据库失败: {e}")
+            logger.error(f"设置群奖池失败: {e}")
             yield event.plain_result("❌ 设置失败，请稍后再试")
 
+    @filter.command("发放抽奖机会")
+    @_idempotent
+    async def grant_chances(self, event: AstrMessageEvent, 次数: str = ""):
+        """为本群（当前作用域）所有用户发放或扣除抽奖机会（机器人管理员专用）"""
+        try:
+            # 抽奖机会可兑换游戏内资产，群主/群管理员不能为自己的群无限发放
+            if not event.is_admin():
+                yield event.plain_result("❌ 仅机器人管理员可执行此操作")
+                return
+            
+            try:
+                amount = int(次数)
+            except ValueError:
+                yield event.plain_result("❌ 请输入发放次数（负数为扣除），例如：/发放抽奖机会 3")
+                return
+            if amount == 0:
+                yield event.plain_result("❌ 发放次数不能为0")
+                return
+            
+            affected = _grant_chances(_get_ctx_id(event, self._settings), amount)
+            action = "发放" if amount > 0 else "扣除"
+            yield event.plain_result(f"✅ 已为 {affected} 位用户{action} {abs(amount)} 次抽奖机会")
+                
+        except Exception as e:
+            logger.error(f"批量发放抽奖机会失败: {e}")
+            yield event.plain_result("❌ 发放失败，请稍后再试")
+
+    @filter.command("导入绑定")
+    @_idempotent
+    async def import_bindings(self, event: AstrMessageEvent, 文件: str = "", 模式: str = ""):
+        """从服务器上的 CSV 文件导入账号绑定（机器人管理员专用）"""
+        try:
+            if not event.is_admin():
+                yield event.plain_result("❌ 仅机器人管理员可执行此操作")
+                return
+            if not 文件:
+                yield event.plain_result("❌ 格式：/导入绑定 [CSV路径] [覆盖]\nCSV 每行：用户ID,游戏账号")
+                return
+            if not os.path.isfile(文件):
+                yield event.plain_result(f"❌ 文件不存在：{文件}")
+                return
+            
+            imported, skipped = await asyncio.to_thread(_import_bindings, 文件, 模式 == "覆盖")
+            yield event.plain_result(f"✅ 导入完成：新增 {imported} 条，跳过 {skipped} 条")
+                
+        except Exception as e:
+            logger.error(f"导入账号绑定失败: {e}")
+            yield event.plain_result("❌ 导入失败，请检查文件格式")
+
+    @filter.command("导出群统计")
+    async def export_group_stats(self, event: AstrMessageEvent):
+        """导出本群（当前作用域）用户统计为 CSV（管理员专用）"""
+        try:
+            if not self._is_group_admin(event):
+                yield event.plain_result("❌ 仅群管理员可执行此操作")
+                return
+            
+            ctx_id = _get_ctx_id(event, self._settings)
+            file_name = f"stats_{ctx_id.replace(':', '_')}_{datetime.datetime.now():%Y%m%d_%H%M%S}.csv"
+            path = os.path.abspath(os.path.join(EXPORT_DIR, file_name))
+            count = await asyncio.to_thread(_export_user_stats, path, ctx_id)
+            yield event.plain_result(f"✅ 已导出 {count} 位用户的统计\n文件：{path}")
+                
+        except Exception as e:
+            logger.error(f"导出群统计失败: {e}")
+            yield event.plain_result("❌ 导出失败，请稍后再试")
+
+    @filter.command("运营报表")
+    async def operations_report(self, event: AstrMessageEvent, 天数: str = "1"):
+        """导出最近N天（不含今天）的打卡/抽奖运营报表（机器人管理员专用）"""
+        try:
+            if not event.is_admin():
+                yield event.plain_result("❌ 仅机器人管理员可执行此操作")
+                return
+            try:
+                days = int(天数)
+                if days <= 0 or days > 366:
+                    raise ValueError
+            except ValueError:
+                yield event.plain_result("❌ 天数必须在1-366之间，例如：/运营报表 7")
+                return
+            
+            end = _today() - datetime.timedelta(days=1)
+            start = end - datetime.timedelta(days=days - 1)
+            out_base = os.path.abspath(os.path.join(REPORT_DIR, f"report_{start.isoformat()}_{end.isoformat()}"))
+            # 在线程中流式生成，不阻塞机器人处理其他消息
+            report = await asyncio.to_thread(_build_report, start, end, out_base)
+            yield event.plain_result(
+                f"✅ 运营报表已生成（{start.isoformat()} ~ {end.isoformat()}，共 {report['rows']} 行）\n"
+                + "\n".join(report["files"])
+            )
+                
+        except Exception as e:
+            logger.error(f"生成运营报表失败: {e}")
+            yield event.plain_result("❌ 生成报表失败，请稍后再试")
+
+    @filter.command("性能采样")
+    @_idempotent
+    async def profile_handler(self, event: AstrMessageEvent, 命令: str = "", 次数: str = "10", 方式: str = "cprofile"):
+        """对指定命令接下来N次执行进行性能采样，结果写入插件数据目录（机器人管理员专用）"""
+        try:
+            if not event.is_admin():
+                yield event.plain_result("❌ 仅机器人管理员可执行此操作")
+                return
+            
+            if not 命令:
+                lines = ["📈 性能采样状态"]
+                for capture in self._profiler.pending():
+                    lines.append(f"⏳ /{capture.command}（{capture.mode}）：剩余 {capture.remaining}/{capture.runs} 次")
+                for item in reversed(self._profiler.history):
+                    lines.append(
+                        f"✅ /{item['command']}（{item['mode']}）{item['runs']}次，"
+                        f"平均 {item['avg_ms']:.1f}ms，最长 {item['max_ms']:.1f}ms\n{item['path']}"
+                    )
+                if len(lines) == 1:
+                    lines.append("暂无采样任务")
+                lines.append(f"可采样命令：{'、'.join(sorted(_PROFILED_COMMANDS))}")
+                yield event.plain_result("\n".join(lines))
+                return
+            
+            命令 = 命令.lstrip("/")
+            if 命令 not in _PROFILED_COMMANDS:
+                yield event.plain_result(f"❌ 不支持采样的命令：{命令}")
+                return
+            if 次数 in {"关闭", "取消"}:
+                if self._profiler.cancel(命令):
+                    yield event.plain_result(f"✅ 已取消 /{命令} 的性能采样")
+                else:
+                    yield event.plain_result(f"ℹ️ /{命令} 当前没有进行中的性能采样")
+                return
+            try:
+                runs = int(次数)
+                if runs <= 0 or runs > PROFILE_MAX_RUNS:
+                    raise ValueError
+            except ValueError:
+                yield event.plain_result(f"❌ 采样次数必须在1-{PROFILE_MAX_RUNS}之间，例如：/性能采样 抽奖 10")
+                return
+            if 方式 not in PROFILE_MODES:
+                yield event.plain_result(f"❌ 采样方式只能是：{'、'.join(PROFILE_MODES)}")
+                return
+            
+            self._profiler.arm(命令, runs, 方式)
+            yield event.plain_result(f"✅ 已开启 /{命令} 接下来 {runs} 次执行的性能采样（{方式}），完成后用 /性能采样 查看结果")
+                
+        except Exception as e:
+            logger.error(f"开启性能采样失败: {e}")
+            yield event.plain_result("❌ 操作失败，请稍后再试")
+
     @filter.command("重置群组配置")
+    @_idempotent
     async def reset_group_config(self, event: AstrMessageEvent):
         """重置群组配置为全局配置（管理员专用）"""
         try:
@@ -1164,11 +4673,11 @@ class DrawCheckinPlugin(Star):
                 return
             
             group_id = self._get_group_id(event)
-            group_configs = _load_group_config()
+            with _GROUP_CONFIG_STORE.transaction() as group_configs:
+                removed = group_configs.pop(group_id, None)
             
-            if group_id in group_configs:
-                del group_configs[group_id]
-                _save_group_config(group_configs)
+            if removed is not None:
+                _POOL_REGISTRY.forget(group_id)
                 yield event.plain_result("✅ 群组配置已重置，将使用全局配置")
             else:
                 yield event.plain_result("✅ 当前已使用全局配置")
@@ -1178,4 +4687,90 @@ class DrawCheckinPlugin(Star):
             yield event.plain_result("❌ 重置失败，请稍后再试")
 
     async def terminate(self):
-        pass
+        if self._warm_up_task is not None:
+            self._warm_up_task.cancel()
+        _EVENT_SCHEDULER.stop()
+        if self._rollover_task is not None:
+            self._rollover_task.cancel()
+        if self._scope_migration_task is not None:
+            self._scope_migration_task.cancel()
+        await self._checkin_digest.flush_all()
+        self._card_renderer.shutdown()
+        self._profiler.shutdown()
+
+
+def _cli_main(argv: Optional[List[str]] = None) -> int:
+    """命令行批量管理（在 AstrBot 根目录下运行，可与机器人同时运行）"""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="astrbot_plugin_draw_checkin", description="抽奖打卡插件批量管理")
+    sub = parser.add_subparsers(dest="action", required=True)
+
+    grant = sub.add_parser("grant", help="为作用域内所有用户增减抽奖机会")
+    grant.add_argument("ctx_id", help="作用域ID，如 aiocqhttp:G:123456")
+    grant.add_argument("amount", type=int, help="每人增减次数（负数为扣除）")
+
+    bindings = sub.add_parser("import-bindings", help="从 CSV（用户ID,游戏账号）导入账号绑定")
+    bindings.add_argument("csv_path")
+    bindings.add_argument("--overwrite", action="store_true", help="覆盖用户原有绑定")
+
+    export = sub.add_parser("export-stats", help="导出用户统计 CSV")
+    export.add_argument("output")
+    export.add_argument("--ctx", dest="ctx_id", default=None, help="只导出指定作用域")
+
+    report = sub.add_parser("report", help="生成每日运营报表（CSV，安装 PyArrow 时另含 Parquet）")
+    report.add_argument("start", type=datetime.date.fromisoformat, help="开始日期，如 2024-05-01")
+    report.add_argument("end", type=datetime.date.fromisoformat, help="结束日期（含）")
+    report.add_argument("--output", default=None, help="输出文件名前缀（不含扩展名）")
+
+    replay = sub.add_parser("replay", help="按流水重放某天的抽奖，核对争议结果")
+    replay.add_argument("date", type=datetime.date.fromisoformat, help="流水日期，如 2024-05-01")
+    replay.add_argument("--user", default=None, help="只重放指定用户")
+
+    migrate = sub.add_parser("migrate-scope", help="将数据迁移到新的存储范围（需同时在配置中修改 storage_scope）")
+    migrate.add_argument("scope", choices=STORAGE_SCOPES)
+
+    args = parser.parse_args(argv)
+    if args.action == "grant":
+        print(f"影响用户：{_grant_chances(args.ctx_id, args.amount)}")
+    elif args.action == "import-bindings":
+        imported, skipped = _import_bindings(args.csv_path, args.overwrite)
+        print(f"导入：{imported}，跳过：{skipped}")
+    elif args.action == "export-stats":
+        print(f"导出行数：{_export_user_stats(args.output, args.ctx_id)}")
+    elif args.action == "report":
+        out_base = args.output or os.path.join(REPORT_DIR, f"report_{args.start.isoformat()}_{args.end.isoformat()}")
+        result = _build_report(args.start, args.end, out_base)
+        print(f"报表行数：{result['rows']}\n" + "\n".join(result["files"]))
+    elif args.action == "replay":
+        for chunk in _iter_record_chunks(args.date):
+            for record in chunk:
+                if record.get("kind") != "draw" or "rng_seed" not in record:
+                    continue
+                if args.user and record.get("user") != args.user:
+                    continue
+                try:
+                    replayed = _replay_draw(record)
+                except ValueError as e:
+                    print(f"[无法复现] 用户 {record.get('user')} 序号 {record['rng_offset']}：{e}")
+                    continue
+                amount = replayed.get("extra_chances", 0) if replayed.get("type") == "extra_chance" else replayed.get("actual_amount", 0)
+                matched = replayed.get("name") == record.get("item") and amount == record.get("amount")
+                status = "一致" if matched else "不一致"
+                print(
+                    f"[{status}] 用户 {record.get('user')} 序号 {record['rng_offset']}："
+                    f"记录 {record.get('item')}，重放 {replayed.get('name')} × {replayed.get('actual_amount', '-')}"
+                )
+    elif args.action == "migrate-scope":
+        legacy = _prepare_scope_migration(args.scope)
+        total, more = 0, bool(legacy)
+        while more:
+            moved, more = _migrate_scope_batch(args.scope, legacy)
+            total += moved
+        remaining = _finish_scope_migration(args.scope)
+        print(f"迁移用户记录：{total}" + (f"，待用户使用时迁移的旧范围：{'、'.join(remaining)}" if remaining else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(_cli_main())
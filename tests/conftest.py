@@ -0,0 +1,15 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def plugin_module(tmp_path, monkeypatch):
+    """导入插件模块（需要 AstrBot 运行环境），并把相对路径的数据目录指向临时目录"""
+    pytest.importorskip("astrbot.api")
+    monkeypatch.chdir(tmp_path)
+    import astrbot_plugin_draw_checkin
+    return astrbot_plugin_draw_checkin
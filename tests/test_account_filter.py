@@ -0,0 +1,79 @@
+class _Cursor:
+    def __init__(self, accounts, queries):
+        self._accounts = accounts
+        self._queries = queries
+        self._row = None
+
+    def execute(self, sql, *args):
+        self._queries.append(args)
+        self._row = (args[0], 0, 0) if args and args[0] in self._accounts else None
+
+    def fetchone(self):
+        return self._row
+
+
+class _Conn:
+    def __init__(self, accounts, queries):
+        self._cursor = _Cursor(accounts, queries)
+
+    def cursor(self):
+        return self._cursor
+
+    def close(self):
+        pass
+
+
+def _setup(m, monkeypatch, accounts, bound_at_snapshot=()):
+    queries = []
+    settings = m._ConfigSnapshot({"account_filter_refresh": 600})
+    monkeypatch.setattr(m, "_open_read_connection", lambda *args, **kwargs: (_Conn(accounts, queries), False))
+    monkeypatch.setattr(m, "_ACCOUNT_FILTER", m._AccountFilterRegistry())
+    bloom = m._BloomFilter(100)
+    bloom.add("old_account")
+    key = m._db_key(settings.db_config("1"))
+    m._ACCOUNT_FILTER._filters[key] = (bloom, m.time.monotonic(), frozenset(bound_at_snapshot))
+    return settings, queries
+
+
+def test_account_registered_after_snapshot_can_be_bound(plugin_module, monkeypatch):
+    m = plugin_module
+    settings, queries = _setup(m, monkeypatch, {"old_account", "new_account"})
+
+    assert m._get_game_account_info("1", settings, "new_account", verify=True)["account"] == "new_account"
+    # 查到后补进快照
+    assert m._ACCOUNT_FILTER.might_exist("1", settings, "new_account") is True
+
+
+def test_snapshot_misses_are_rejected_locally_on_hot_paths(plugin_module, monkeypatch):
+    m = plugin_module
+    settings, queries = _setup(m, monkeypatch, {"old_account"}, bound_at_snapshot={"deleted"})
+    with m._BIND_STORE.transaction() as bind_data:
+        bind_data["u1"] = "deleted"
+
+    for idx in range(100):
+        assert m._get_game_account_info("1", settings, f"missing{idx}") is None
+    assert m._get_game_account_info("1", settings, "deleted") is None
+    assert queries == []
+
+
+def test_account_bound_after_snapshot_is_confirmed_once(plugin_module, monkeypatch):
+    m = plugin_module
+    settings, queries = _setup(m, monkeypatch, {"old_account", "new_account"})
+    with m._BIND_STORE.transaction() as bind_data:
+        bind_data.update({"u1": "new_account", "u2": "gone"})
+
+    for _ in range(3):
+        assert m._get_game_account_info("1", settings, "new_account")["account"] == "new_account"
+        assert m._get_game_account_info("1", settings, "gone") is None
+    # 存在的账号补进快照后照常查询余额；不存在的账号只确认一次
+    assert queries.count(("gone",)) == 1
+    assert m._ACCOUNT_FILTER.might_exist("1", settings, "new_account") is True
+
+
+def test_repeated_bind_misses_are_short_circuited(plugin_module, monkeypatch):
+    m = plugin_module
+    settings, queries = _setup(m, monkeypatch, {"old_account"})
+
+    assert m._get_game_account_info("1", settings, "typo", verify=True) is None
+    assert m._get_game_account_info("1", settings, "typo", verify=True) is None
+    assert len(queries) == 1
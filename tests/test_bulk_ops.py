@@ -0,0 +1,14 @@
+def test_grant_chances_is_all_or_nothing(plugin_module, monkeypatch):
+    m = plugin_module
+    with m._DATA_STORE.transaction() as data:
+        data["qq:G:1"] = {f"u{i}": {"lottery_chances": 1} for i in range(1200)}
+    writes = []
+    original_write = m._JsonStore._write
+    monkeypatch.setattr(m._JsonStore, "_write", lambda self: (writes.append(self.path), original_write(self)))
+
+    assert m._grant_chances("qq:G:1", 2) == 1200
+    assert writes == [m.DATA_FILE]
+    assert all(info["lottery_chances"] == 3 for info in m._DATA_STORE.data["qq:G:1"].values())
+
+    assert m._grant_chances("qq:G:1", -5) == 1200
+    assert all(info["lottery_chances"] == 0 for info in m._DATA_STORE.data["qq:G:1"].values())
@@ -0,0 +1,97 @@
+def test_replica_defaults_inherit_primary_endpoint(plugin_module, monkeypatch):
+    monkeypatch.setattr(plugin_module, "_load_group_config", lambda: {})
+    cfg = {
+        "db_server": "10.0.0.1",
+        "db_port": "1433",
+        "db_replica_server": "10.0.0.2",
+        # schema 默认值：留空表示与主库相同
+        "db_replica_port": "",
+    }
+
+    db_config = plugin_module._ConfigSnapshot(cfg).db_config("123")
+    replica = db_config["replica"]
+
+    assert replica["port"] == "1433"
+    assert replica["username"] == db_config["username"]
+    assert "SERVER=10.0.0.2,1433;" in plugin_module._connection_string(replica)
+
+
+def test_group_replica_port_overrides_primary(plugin_module, monkeypatch):
+    monkeypatch.setattr(plugin_module, "_load_group_config", lambda: {
+        "123": {"db_config": {"db_server": "10.0.0.1", "db_replica_server": "10.0.0.3", "db_replica_port": "2433"}}
+    })
+
+    replica = plugin_module._ConfigSnapshot({"db_replica_server": "10.9.9.9"}).db_config("123")["replica"]
+
+    assert plugin_module._connection_string(replica).startswith("DRIVER=FreeTDS;SERVER=10.0.0.3,2433;")
+
+
+class _Conn:
+    def __init__(self, server, log):
+        self.server = server
+        self.log = log
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, *args):
+        self.log.append(self.server)
+        if self.server == "replica-broken":
+            raise RuntimeError("query failed")
+        self.row = (args[0], 1, 2)
+
+    def fetchone(self):
+        return self.row
+
+    def close(self):
+        pass
+
+
+def _replica_setup(plugin_module, monkeypatch, replica_server):
+    log = []
+    monkeypatch.setattr(plugin_module, "_load_group_config", lambda: {})
+    monkeypatch.setattr(plugin_module, "_REPLICA_DOWN_UNTIL", {})
+    monkeypatch.setattr(plugin_module, "_connect", lambda db_config, **kwargs: _Conn(db_config["server"], log))
+    settings = plugin_module._ConfigSnapshot(
+        {"db_server": "primary", "db_replica_server": replica_server, "account_filter_refresh": 0}
+    )
+    return settings, log
+
+
+def test_bind_verification_reads_primary(plugin_module, monkeypatch):
+    settings, log = _replica_setup(plugin_module, monkeypatch, "replica")
+
+    assert plugin_module._get_game_account_info("1", settings, "new_account", verify=True)["account"] == "new_account"
+    assert plugin_module._get_game_account_info("1", settings, "new_account")["account"] == "new_account"
+    assert log == ["primary", "replica"]
+
+
+def test_replica_query_error_falls_back_to_primary(plugin_module, monkeypatch):
+    settings, log = _replica_setup(plugin_module, monkeypatch, "replica-broken")
+
+    assert plugin_module._get_game_account_info("1", settings, "player")["points"] == 1
+    # 之后一段时间内不再尝试只读库
+    assert plugin_module._get_game_account_info("1", settings, "player")["points"] == 1
+    assert log == ["replica-broken", "primary", "primary"]
+
+
+def test_snapshot_resolves_db_config_once_per_group_config_change(plugin_module, monkeypatch):
+    m = plugin_module
+    resolved = []
+    original = m._resolve_db_config
+    monkeypatch.setattr(m, "_resolve_db_config", lambda *args: resolved.append(args) or original(*args))
+    settings = m._ConfigSnapshot({"db_server": "10.0.0.1"})
+    with m._GROUP_CONFIG_STORE.transaction() as group_configs:
+        group_configs["123"] = {"db_config": {"db_server": "10.0.0.5"}}
+
+    for _ in range(3):
+        assert settings.db_config("456")["server"] == "10.0.0.1"
+        assert settings.db_config("123")["server"] == "10.0.0.5"
+    # 全局配置在快照构建时解析一次，群组配置首次使用时解析一次
+    assert len(resolved) == 2
+
+    # /设置群数据库 修改群组配置后重新解析
+    with m._GROUP_CONFIG_STORE.transaction() as group_configs:
+        group_configs["123"]["db_config"]["db_server"] = "10.0.0.6"
+    assert settings.db_config("123")["server"] == "10.0.0.6"
+    assert len(resolved) == 3
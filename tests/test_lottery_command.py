@@ -0,0 +1,145 @@
+import asyncio
+
+
+class _Event:
+    unified_msg_origin = "qq:GroupMessage:1"
+
+    def get_sender_id(self):
+        return "u1"
+
+    def get_sender_name(self):
+        return "测试用户"
+
+    def get_group_id(self):
+        return "1"
+
+    def get_platform_name(self):
+        return "qq"
+
+    def is_admin(self):
+        return False
+
+    def plain_result(self, text):
+        return text
+
+    def chain_result(self, chain):
+        return "".join(getattr(part, "text", "") for part in chain)
+
+
+class _Ledger:
+    def __init__(self):
+        self.released = []
+
+    def release(self, bucket, count=1):
+        self.released.append(bucket)
+
+
+class _Scheduler:
+    def __init__(self):
+        self.ledger = _Ledger()
+
+    def start(self):
+        pass
+
+    def active_events(self, group_id):
+        return []
+
+
+def _run_lottery(m, plugin, times):
+    async def collect():
+        return [reply async for reply in plugin.lottery(_Event(), str(times))]
+    return asyncio.run(collect())
+
+
+def _setup(m, monkeypatch, chances):
+    with m._BIND_STORE.transaction() as bind_data:
+        bind_data["u1"] = "player"
+    with m._DATA_STORE.transaction() as data:
+        data["qq:G:1"] = {"u1": dict(m._default_user("u1", "测试用户"), lottery_chances=chances)}
+    scheduler = _Scheduler()
+    monkeypatch.setattr(m, "_EVENT_SCHEDULER", scheduler)
+    monkeypatch.setattr(m, "_apply_account_deltas", lambda *args: {"points": 100, "ingots": 0})
+    return m.DrawCheckinPlugin(None, {}), scheduler
+
+
+def _draws(m, fail_at):
+    calls = []
+
+    def perform(group_id, user_id, state, rng):
+        calls.append(1)
+        if len(calls) == fail_at:
+            raise KeyError("min_amount")
+        result = {"name": "积分", "type": "points", "actual_amount": 10, "stock_bucket": f"item:{len(calls)}"}
+        return result, "🎁 积分 × 10", 0
+    return perform
+
+
+def _chances(m):
+    return m._DATA_STORE.data["qq:G:1"]["u1"]["lottery_chances"]
+
+
+def test_draw_error_settles_completed_draws_and_refunds_the_rest(plugin_module, monkeypatch):
+    m = plugin_module
+    plugin, scheduler = _setup(m, monkeypatch, 5)
+    monkeypatch.setattr(m, "_perform_lottery", _draws(m, fail_at=3))
+
+    replies = _run_lottery(m, plugin, 3)
+
+    # 前两次照常结算，第三次的机会退还
+    assert _chances(m) == 3
+    assert len(m._DATA_STORE.data["qq:G:1"]["u1"]["lottery_history"]) == 2
+    assert scheduler.ledger.released == []
+    assert "未完成的 1 次抽奖机会已退还" in replies[-1]
+
+
+def test_payout_error_voids_round_and_releases_stock(plugin_module, monkeypatch):
+    m = plugin_module
+    plugin, scheduler = _setup(m, monkeypatch, 5)
+    monkeypatch.setattr(m, "_perform_lottery", _draws(m, fail_at=0))
+
+    def broken_payout(*args):
+        raise OSError("connection reset")
+    monkeypatch.setattr(m, "_apply_account_deltas", broken_payout)
+
+    _run_lottery(m, plugin, 2)
+
+    assert _chances(m) == 5
+    assert scheduler.ledger.released == ["item:1", "item:2"]
+
+
+def test_group_admin_cannot_grant_chances(plugin_module, monkeypatch):
+    m = plugin_module
+    plugin, _ = _setup(m, monkeypatch, 0)
+    event = _Event()
+    # 群主（非机器人管理员）
+    event.message_obj = type("Message", (), {"raw_message": {"sender": {"role": "owner"}}, "message_id": ""})()
+    assert plugin._is_group_admin(event)
+
+    async def collect():
+        return [reply async for reply in plugin.grant_chances(event, "100")]
+    replies = asyncio.run(collect())
+
+    assert "仅机器人管理员" in replies[0]
+    assert _chances(m) == 0
+
+
+def test_lottery_card_includes_redemption_instructions(plugin_module, monkeypatch):
+    m = plugin_module
+    plugin, _ = _setup(m, monkeypatch, 1)
+    monkeypatch.setattr(m, "_perform_lottery", lambda *args: (
+        {"name": "创造宝石", "type": "item", "actual_amount": 2}, "🎁 创造宝石 × 2", 0
+    ))
+    cards = []
+
+    class _Renderer:
+        enabled = True
+
+        async def render(self, title, rows):
+            cards.append(rows)
+            return "card.png"
+    plugin._card_renderer = _Renderer()
+
+    _run_lottery(m, plugin, 1)
+
+    assert ("item", "需要兑换的物品：创造宝石 × 2") in cards[0]
+    assert ("info", "请私聊GM兑换物品") in cards[0]
@@ -0,0 +1,69 @@
+import math
+
+import pytest
+
+DRAWS = 200000
+
+
+def _pool(pity=None):
+    return {
+        "items": [
+            {"id": 1, "name": "积分", "type": "points", "rarity": "common", "probability": 60, "min_amount": 1, "max_amount": 10},
+            {"id": 2, "name": "元宝", "type": "ingots", "rarity": "common", "probability": 30, "min_amount": 1, "max_amount": 5},
+            {"id": 3, "name": "祝福宝石", "type": "item", "rarity": "rare", "probability": 8, "min_amount": 1, "max_amount": 1},
+            {"id": 4, "name": "创造宝石", "type": "item", "rarity": "epic", "probability": 2, "min_amount": 1, "max_amount": 1},
+        ],
+        "special_rewards": [],
+        "pity": pity or {},
+    }
+
+
+@pytest.fixture
+def rng(plugin_module):
+    return plugin_module._RngStream(0x5EED, batch=4096)
+
+
+def test_hard_pity_bounds_longest_gap(plugin_module, rng):
+    pity = {"rare": {"hard": 10}, "epic": {"hard": 30}}
+    sampler = plugin_module._LotterySampler(_pool(pity))
+
+    report = plugin_module._simulate_lottery(sampler, DRAWS, rng)
+
+    for tier, rule in pity.items():
+        assert report["longest_gap"][tier] <= rule["hard"]
+    # 保底确实生效过：不加保底时 epic 的最长间隔远超 30
+    assert report["longest_gap"]["epic"] == pity["epic"]["hard"]
+
+
+def test_frequencies_match_configured_probabilities_without_pity(plugin_module, rng):
+    pool = _pool()
+    sampler = plugin_module._LotterySampler(pool)
+
+    report = plugin_module._simulate_lottery(sampler, DRAWS, rng)
+
+    total = sum(item["probability"] for item in pool["items"])
+    for item in pool["items"]:
+        expected = item["probability"] / total
+        observed = report["counts"].get(item["name"], 0) / DRAWS
+        # 5 倍标准差以内
+        assert abs(observed - expected) <= 5 * math.sqrt(expected * (1 - expected) / DRAWS)
+
+
+def test_soft_pity_raises_rate_after_threshold(plugin_module, rng):
+    soft_start = 20
+    sampler = plugin_module._LotterySampler(_pool({"epic": {"soft_start": soft_start, "soft_step": 0.02}}))
+    state = plugin_module._default_lottery_state()
+    hits = {False: 0, True: 0}
+    draws = {False: 0, True: 0}
+
+    for _ in range(DRAWS):
+        boosted = state.get("pity", {}).get("epic", 0) >= soft_start
+        result = plugin_module._draw_with_state(sampler, state, rng)
+        draws[boosted] += 1
+        hits[boosted] += result["rarity"] == "epic"
+
+    base_rate = hits[False] / draws[False]
+    boosted_rate = hits[True] / draws[True]
+    assert abs(base_rate - 0.02) < 0.005
+    # 阈值后首抽即为 2% + 2%，之后逐抽递增
+    assert boosted_rate > 2 * base_rate
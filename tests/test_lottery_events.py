@@ -0,0 +1,25 @@
+import datetime
+import json
+import os
+
+
+def test_event_times_with_offset_are_compared_in_local_time(plugin_module):
+    m = plugin_module
+    now = datetime.datetime.now().astimezone()
+    os.makedirs(m.DATA_DIR, exist_ok=True)
+    with open(m.LOTTERY_EVENTS_FILE, "w", encoding="utf-8") as f:
+        json.dump({"events": [{
+            "id": "aware",
+            "start": (now - datetime.timedelta(hours=1)).astimezone(datetime.timezone(datetime.timedelta(hours=8))).isoformat(),
+            "end": (now + datetime.timedelta(hours=1)).astimezone(datetime.timezone.utc).isoformat(),
+            "boost": {"1": 2},
+        }]}, f)
+    scheduler = m._LotteryEventScheduler(m._LotteryPoolRegistry())
+
+    event = m._load_lottery_events()[0]
+    assert event["start_at"].tzinfo is None
+    assert event["start_at"] < now.replace(tzinfo=None) < event["end_at"]
+    # 与 datetime.now() 比较不再抛出 TypeError，活动照常生效
+    assert [active["id"] for active in scheduler.active_events("1")] == ["aware"]
+    assert scheduler.source_for("1")[2] == ["aware"]
+    scheduler.stop()
@@ -0,0 +1,28 @@
+import json
+import os
+
+
+def test_group_pool_change_from_another_instance_is_picked_up(plugin_module, monkeypatch):
+    m = plugin_module
+    os.makedirs(m.DATA_DIR, exist_ok=True)
+    with open(m.LOTTERY_POOLS_FILE, "w", encoding="utf-8") as f:
+        json.dump({"pools": {"server2": {"pity": {"rare": {"hard": 5}}}}}, f)
+    registry = m._LotteryPoolRegistry()
+    assert registry.pool_name_for("123") == m.DEFAULT_POOL
+    version = registry.version
+
+    # 模拟其他实例或命令行修改了群奖池
+    with m._GROUP_CONFIG_STORE.transaction() as group_configs:
+        group_configs["123"] = {"lottery_pool": "server2"}
+    registry._checked_at = 0.0
+
+    assert registry.pool_name_for("123") == "server2"
+    assert registry.sampler_for("123") is registry._pools["server2"]
+    # 只重建引用，不重新编译奖池
+    assert registry.version == version
+
+    with m._GROUP_CONFIG_STORE.transaction() as group_configs:
+        group_configs.pop("123")
+    registry._checked_at = 0.0
+
+    assert registry.pool_name_for("123") == m.DEFAULT_POOL
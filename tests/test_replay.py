@@ -0,0 +1,71 @@
+import copy
+import json
+import os
+
+import pytest
+
+ITEMS = {"items": [
+    {"id": 1, "name": "积分", "type": "points", "rarity": "common", "probability": 80,
+     "min_amount": 10, "max_amount": 100},
+    {"id": 2, "name": "元宝", "type": "ingots", "rarity": "rare", "probability": 15,
+     "min_amount": 1, "max_amount": 5},
+    {"id": 3, "name": "创造宝石", "type": "item", "rarity": "epic", "probability": 5,
+     "min_amount": 1, "max_amount": 1},
+]}
+EVENT = {"events": [{
+    "id": "double", "start": "2000-01-01T00:00:00", "end": "2100-01-01T00:00:00",
+    "boost": {"3": 8}, "stock": {"3": {"limit": 2}},
+}]}
+
+
+def _draw_records(m, monkeypatch, times):
+    """在限时活动期间抽奖，按抽奖指令的方式生成流水"""
+    os.makedirs(m.DATA_DIR, exist_ok=True)
+    with open(m.LOTTERY_ITEMS_FILE, "w", encoding="utf-8") as f:
+        json.dump(ITEMS, f)
+    with open(m.LOTTERY_EVENTS_FILE, "w", encoding="utf-8") as f:
+        json.dump(EVENT, f)
+    scheduler = m._LotteryEventScheduler(m._LotteryPoolRegistry())
+    scheduler._reload_events()
+    scheduler._swap(scheduler._prepare(m.datetime.datetime.now()))
+    monkeypatch.setattr(m, "_EVENT_SCHEDULER", scheduler)
+    records = []
+    state = m._default_lottery_state()
+    try:
+        for offset in range(times):
+            state_before = copy.deepcopy(state)
+            result, _, _ = m._perform_lottery("123", "u1", state, m._RNG.draw_stream(7, offset))
+            records.append({
+                "item": result["name"], "rng_seed": f"{7:016x}", "rng_offset": offset, "state": state_before,
+                "pool": result["pool"], "events": result["events"], "pool_digest": result["pool_digest"],
+                "excluded": result.get("excluded", [[]]),
+            })
+    finally:
+        scheduler.stop()
+    return records
+
+
+def test_replay_uses_the_pool_of_the_original_draw(plugin_module, monkeypatch):
+    m = plugin_module
+    records = _draw_records(m, monkeypatch, 200)
+    assert records[0]["events"] == ["double"]
+    # 活动限量 2 个，售罄后重抽：之后的流水都记录了被剔除的奖品
+    assert sum(record["item"] == "创造宝石" for record in records) == 2
+    assert any(record["excluded"] != [[]] for record in records)
+
+    # 活动结束、奖池配置改动后，仍按流水记录的奖池复现
+    os.remove(m.LOTTERY_EVENTS_FILE)
+    with open(m.LOTTERY_ITEMS_FILE, "w", encoding="utf-8") as f:
+        json.dump({"items": ITEMS["items"][:1]}, f)
+    for record in records:
+        assert m._replay_draw(record)["name"] == record["item"]
+
+
+def test_replay_refuses_when_pool_archive_is_missing(plugin_module, monkeypatch):
+    m = plugin_module
+    record = _draw_records(m, monkeypatch, 1)[0]
+    os.remove(os.path.join(m.POOL_ARCHIVE_DIR, f"{record['pool_digest']}.json"))
+    with pytest.raises(ValueError, match="奖池存档"):
+        m._replay_draw(record)
+    with pytest.raises(ValueError, match="旧版本"):
+        m._replay_draw(dict(record, pool_digest=None))
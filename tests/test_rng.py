@@ -0,0 +1,24 @@
+import multiprocessing
+import os
+
+
+def _user_seed(path, queue):
+    import astrbot_plugin_draw_checkin as m
+    queue.put(m._RngService(path).user_seed("qq:G:1", "u1"))
+
+
+def test_concurrent_first_start_agrees_on_root_seed(plugin_module, tmp_path):
+    path = str(tmp_path / "seed" / "rng_seed")
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    workers = [context.Process(target=_user_seed, args=(path, queue)) for _ in range(8)]
+    for worker in workers:
+        worker.start()
+    # 读到未写完的种子文件的进程会直接崩溃，不会产出结果
+    seeds = {queue.get(timeout=30) for _ in workers}
+    for worker in workers:
+        worker.join()
+
+    assert len(seeds) == 1
+    assert os.listdir(os.path.dirname(path)) == ["rng_seed"]
+    assert plugin_module._RngService(path).user_seed("qq:G:1", "u1") in seeds
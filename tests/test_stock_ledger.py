@@ -0,0 +1,63 @@
+import sqlite3
+
+
+def test_take_reports_original_error_when_begin_fails(plugin_module, tmp_path):
+    path = str(tmp_path / "stock.db")
+    ledger = plugin_module._StockLedger(path)
+    ledger._conn.execute("PRAGMA busy_timeout = 0")
+    blocker = sqlite3.connect(path, isolation_level=None)
+    blocker.execute("BEGIN IMMEDIATE")
+    try:
+        # 数据库被其他进程锁住：扣减失败但不应因多余的 ROLLBACK 抛出异常
+        assert not ledger.take("gem", 5)
+    finally:
+        blocker.execute("ROLLBACK")
+        blocker.close()
+    assert ledger.take("gem", 5)
+    ledger.close()
+
+
+def test_released_stock_can_be_drawn_again(plugin_module, tmp_path):
+    m = plugin_module
+    ledger = m._StockLedger(str(tmp_path / "stock.db"))
+    sampler = m._LotterySampler({"items": [
+        {"id": 1, "name": "创造宝石", "type": "item", "rarity": "epic", "probability": 1,
+         "min_amount": 1, "max_amount": 1, "stock": 1},
+        {"id": 2, "name": "积分", "type": "points", "rarity": "common", "probability": 1,
+         "min_amount": 1, "max_amount": 1},
+    ]})
+    rng = m._RngStream(1)
+    state = m._default_lottery_state()
+
+    result = m._draw_with_state(sampler, state, rng, ledger=ledger)
+    while "stock_bucket" not in result:
+        result = m._draw_with_state(sampler, state, rng, ledger=ledger)
+    assert sampler.available(ledger) is not sampler
+
+    # 抽奖作废时归还库存，售罄的奖品重新回到分布中
+    ledger.release(result["stock_bucket"])
+    assert result["stock_bucket"] == "item:1"
+    assert ledger.refresh("item:1") == 0
+    assert sampler.available(ledger) is sampler
+    ledger.close()
+
+
+def test_last_stock_taken_by_another_instance_is_a_handled_sell_out(plugin_module, tmp_path):
+    m = plugin_module
+    path = str(tmp_path / "stock.db")
+    ledger = m._StockLedger(path)
+    sampler = m._LotterySampler({"items": [
+        {"id": 1, "name": "创造宝石", "type": "item", "rarity": "epic", "probability": 1,
+         "min_amount": 1, "max_amount": 1, "stock": 1},
+    ]})
+    assert sampler.available(ledger) is sampler
+
+    # 另一个实例抢先抽走了最后一件，本实例的缓存仍认为有货
+    other = m._StockLedger(path)
+    assert other.take("item:1", 1)
+    other.close()
+
+    state = m._default_lottery_state()
+    assert m._draw_with_state(sampler, state, m._RngStream(1), ledger=ledger) == {}
+    assert state == m._default_lottery_state()
+    ledger.close()